@@ -1025,6 +1025,24 @@ function CategoryGallery({ category, subcategories = [], onBack, onSubcategoryCl
         throw new Error('Category folder is required')
       }
 
+      // Prefer the precomputed manifest written by the Pi's watcher (served pre-compressed)
+      if (category.id && refreshKey === 0) {
+        try {
+          const manifestResponse = await fetch(`/images/optimized/manifests/${encodeURIComponent(category.id)}.json`)
+          if (manifestResponse.ok) {
+            const manifest = await manifestResponse.json()
+            if (manifest.folder === category.folder && Array.isArray(manifest.images)) {
+              setImages(manifest.images)
+              loadCommentsFromStorage(manifest.images)
+              applyCustomImageOrder(manifest.images)
+              return
+            }
+          }
+        } catch (manifestError) {
+          console.log('No gallery manifest, asking the server:', manifestError)
+        }
+      }
+
       // Create URL with properly encoded path parameter
       const url = new URL('/api/images', window.location.origin);
       url.searchParams.set('path', category.folder);
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the Xiaomi BLE to MQTT Bridge
+Runs the real bridge against a fleet of simulated sensors and an in-process
+MQTT broker (xiaomi_ble_fake_backend.py) and reports readings per second,
+advertisement-to-broker latency percentiles and CPU per sensor.
+
+Usage:
+    python3 benchmark-xiaomi-bridge.py --sensors 300 --duration 60
+    python3 benchmark-xiaomi-bridge.py --json > baseline.json
+    python3 benchmark-xiaomi-bridge.py --baseline baseline.json   # exit 1 on regression
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import xiaomi_ble_mqtt_bridge as bridge
+    from xiaomi_ble_fake_backend import FIRMWARES, MiniMQTTBroker, SimulatedRadio
+except ImportError as e:
+    print(f"Missing required packages ({e}). Install with:")
+    print("pip3 install paho-mqtt")
+    sys.exit(1)
+
+# ==================== CONFIGURATION ====================
+DEFAULT_SENSORS = 200
+DEFAULT_DURATION = 60.0             # Measured seconds, after the warm-up
+DEFAULT_WARMUP = 10.0               # Seconds before measuring (discovery, first polls)
+DEFAULT_ADVERTISE_INTERVAL = 2.0    # Mean seconds between a virtual sensor's advertisements
+DEFAULT_UPDATE_INTERVAL = 5.0       # Bridge UPDATE_INTERVAL during the run
+DEFAULT_FIRMWARE_MIX = "atc=0.4,pvvx=0.3,bthome=0.2,stock=0.1"
+DEFAULT_TOLERANCE = 0.2             # Allowed fractional regression against --baseline
+
+# Results compared against a baseline: name -> True if higher is better
+REGRESSION_CHECKS = {
+    "readings_per_second": True,
+    "latency_p95_ms": False,
+    "cpu_percent_per_sensor": False,
+}
+# =======================================================
+
+
+def parse_mix(text: str) -> dict:
+    """Parse "atc=0.4,stock=0.1" into firmware weights."""
+    mix = {}
+    for part in text.split(","):
+        firmware, _, weight = part.partition("=")
+        firmware = firmware.strip()
+        if firmware not in FIRMWARES:
+            raise argparse.ArgumentTypeError(f"unknown firmware {firmware!r}, choose from {', '.join(FIRMWARES)}")
+        mix[firmware] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def configure_bridge(args, broker_port: int, spool_dir: str):
+    """Point the bridge's configuration at the simulated environment."""
+    bridge.MQTT_BROKER = "127.0.0.1"
+    bridge.MQTT_PORT = broker_port
+    bridge.MQTT_USERNAME = None
+    bridge.MQTT_PASSWORD = None
+    bridge.MQTT_STATE_ONLY = args.state_only
+    bridge.SPOOL_PATH = os.path.join(spool_dir, "mqtt_spool.db")
+    bridge.SCAN_TIMEOUT = min(bridge.SCAN_TIMEOUT, args.advertise_interval * 2)
+    bridge.UPDATE_INTERVAL = args.update_interval
+    bridge.PASSIVE_STALE_TIMEOUT = args.advertise_interval * 5
+    bridge.GATT_BACKOFF_BASE = min(bridge.GATT_BACKOFF_BASE, args.update_interval)
+    bridge.METRICS_PORT = 0
+    bridge.METRICS_INTERVAL = 0
+    if args.gatt_connections:
+        bridge.GATT_MAX_CONNECTIONS = args.gatt_connections
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.CRITICAL)
+
+
+async def run_bridge(radio: SimulatedRadio, broker: MiniMQTTBroker, sensor_table: list,
+                     warmup: float, duration: float) -> dict:
+    """Run bridge.main() through the warm-up and measured window, then stop it."""
+    task = asyncio.create_task(bridge.main(sensor_table))
+    await asyncio.sleep(warmup)
+    if task.done():
+        task.result()
+    start = {
+        "time": time.monotonic(),
+        "cpu": time.process_time(),
+        "broker_cpu": broker.thread_cpu_time(),
+        "readings": readings_total(),
+        "advertisements": radio.advertisements,
+    }
+    await asyncio.sleep(duration)
+    end = {
+        "time": time.monotonic(),
+        "cpu": time.process_time(),
+        "broker_cpu": broker.thread_cpu_time(),
+        "readings": readings_total(),
+        "advertisements": radio.advertisements,
+    }
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return {"start": start, "end": end}
+
+
+def readings_total() -> int:
+    return sum(
+        value for (name, _labels), value in bridge.metrics.counters.items()
+        if name == "xiaomi_bridge_readings_total"
+    )
+
+
+def run_benchmark(args) -> dict:
+    """Run one benchmark and return its results."""
+    sensor_options = {
+        "connect_latency": args.connect_latency,
+        "failure_rate": args.failure_rate,
+        "drop_rate": args.drop_rate,
+    }
+    if args.replay:
+        radio = SimulatedRadio.from_recording(args.replay, **sensor_options)
+    else:
+        radio = SimulatedRadio.synthetic(
+            args.sensors, args.firmware_mix, advertise_interval=args.advertise_interval, **sensor_options
+        )
+    sensor_table = []
+    for i, sensor in enumerate(radio.sensors.values()):
+        entry = {"mac": sensor.mac, "name": sensor.name}
+        if args.subscribe_every and i % args.subscribe_every == 0:
+            entry["mode"] = "subscribe"
+        sensor_table.append(entry)
+    by_name = {sensor.name: sensor for sensor in radio.sensors.values()}
+
+    # Broker receipts: (time.monotonic(), topic, payload), matched up after the run
+    receipts = []
+    broker = MiniMQTTBroker(lambda topic, payload, received: receipts.append((received, topic, payload)))
+    port = broker.start_in_thread()
+
+    bridge.use_ble_backend(*radio.backend())
+    with tempfile.TemporaryDirectory() as spool_dir:
+        configure_bridge(args, port, spool_dir)
+        window = asyncio.run(run_bridge(radio, broker, sensor_table, args.warmup, args.duration))
+    broker.stop()
+
+    start, end = window["start"], window["end"]
+    elapsed = end["time"] - start["time"]
+
+    # End-to-end latency: the sensor handing out a reading -> its state message reaching the broker
+    latencies = []
+    unmatched = 0
+    state_suffix = "/state"
+    messages = 0
+    for received, topic, payload in receipts:
+        if not start["time"] <= received <= end["time"]:
+            continue
+        messages += 1
+        if not topic.endswith(state_suffix):
+            continue
+        name = topic[len(bridge.MQTT_BASE_TOPIC) + 1:-len(state_suffix)]
+        sensor = by_name.get(name)
+        temperature = json.loads(payload).get("temperature")
+        emitted = sensor.emitted_before(temperature, received) if sensor and temperature is not None else None
+        if emitted is None:
+            unmatched += 1
+        else:
+            latencies.append(received - emitted)
+    latencies.sort()
+
+    # The broker's thread is part of the process but not of the bridge
+    bridge_cpu = (end["cpu"] - start["cpu"]) - (end["broker_cpu"] - start["broker_cpu"])
+    sensors = len(sensor_table)
+    return {
+        "sensors": sensors,
+        "duration_s": round(elapsed, 1),
+        "advertisements_per_second": round((end["advertisements"] - start["advertisements"]) / elapsed, 1),
+        "readings_per_second": round((end["readings"] - start["readings"]) / elapsed, 1),
+        "mqtt_messages_per_second": round(messages / elapsed, 1),
+        "latency_samples": len(latencies),
+        "latency_unmatched": unmatched,
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "latency_max_ms": round((latencies[-1] if latencies else 0.0) * 1000, 1),
+        "cpu_percent": round(bridge_cpu / elapsed * 100, 2),
+        "cpu_percent_per_sensor": round(bridge_cpu / elapsed * 100 / max(1, sensors), 4),
+        "gatt_peak_connections": radio.peak_connections,
+        "gatt_failed_connections": radio.failed_connections,
+        "gatt_dropped_connections": radio.dropped_connections,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return a description of every check that regressed past the tolerance."""
+    regressions = []
+    for name, higher_is_better in REGRESSION_CHECKS.items():
+        if name not in baseline or not baseline[name]:
+            continue
+        old, new = baseline[name], results[name]
+        change = (new - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{name}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Xiaomi BLE to MQTT bridge against simulated sensors")
+    parser.add_argument("--sensors", type=int, default=DEFAULT_SENSORS, help="number of virtual sensors")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP, help="seconds before measuring")
+    parser.add_argument("--advertise-interval", type=float, default=DEFAULT_ADVERTISE_INTERVAL)
+    parser.add_argument("--update-interval", type=float, default=DEFAULT_UPDATE_INTERVAL)
+    parser.add_argument("--firmware-mix", type=parse_mix, default=parse_mix(DEFAULT_FIRMWARE_MIX),
+                        help=f"firmware weights (default {DEFAULT_FIRMWARE_MIX}); stock sensors need GATT")
+    parser.add_argument("--subscribe-every", type=int, default=0, help="subscribe to every Nth sensor")
+    parser.add_argument("--gatt-connections", type=int, default=0, help="override GATT_MAX_CONNECTIONS")
+    parser.add_argument("--connect-latency", type=float, default=0.5, help="mean simulated connect seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="fraction of failed connections")
+    parser.add_argument("--drop-rate", type=float, default=0.01, help="chance a subscription drops per notification")
+    parser.add_argument("--state-only", action="store_true", help="run with MQTT_STATE_ONLY")
+    parser.add_argument("--replay", help="replay a capture from xiaomi_ble_fake_backend.py record")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the bridge's log")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("=" * 60)
+        print("Xiaomi BLE Bridge Benchmark")
+        print("=" * 60)
+        for name, value in results.items():
+            print(f"  {name:28} {value}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Regressions against baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\n✅ Within {args.tolerance:.0%} of baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Image catalog for the photo portfolio
+One SQLite row per image (path, size, mtime, content hash, dimensions,
+EXIF date, validation status), kept current by the watch-folders.py
+stage, so folder counts, cover lookups and "what changed since" queries
+don't need a walk of the whole tree.
+
+Usage:
+    python3 portfolio_catalog.py /mnt/Plex/photo-portfolio/images build
+    python3 portfolio_catalog.py /mnt/Plex/photo-portfolio/images counts
+    python3 portfolio_catalog.py /mnt/Plex/photo-portfolio/images cover doors_and_windows
+    python3 portfolio_catalog.py /mnt/Plex/photo-portfolio/images changed --since 2025-10-01
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ==================== CONFIGURATION ====================
+CATALOG_DB_NAME = ".portfolio-catalog.db"   # Kept in the portfolio root
+WORKERS = 4                                 # Threads hashing and reading headers
+HASH_CHUNK_SIZE = 1024 * 1024
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp", ".avif", ".heic"}
+SKIP_DIRS = {"optimized"}                   # Generated files, never catalogued
+COVER_NAMES = ("Cover.jpg", "cover.jpg")    # Preferred cover image in a folder
+# =======================================================
+
+# Validation status of a row
+STATUS_UNCHECKED = "unchecked"    # Not opened yet
+STATUS_HEADER_OK = "header_ok"    # Header parsed, dimensions known
+STATUS_VALID = "valid"            # Passed a full integrity check
+STATUS_CORRUPT = "corrupt"        # Failed to parse or verify
+
+# EXIF tags
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+
+logger = logging.getLogger("portfolio_catalog")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,          -- relative to the root, '/' separated
+    folder TEXT NOT NULL,           -- parent folder of path, '' for the root
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    hash TEXT,
+    width INTEGER,
+    height INTEGER,
+    taken TEXT,                     -- EXIF capture time, ISO 8601
+    status TEXT NOT NULL DEFAULT 'unchecked',
+    error TEXT,
+    updated REAL NOT NULL,          -- time.time() the row last changed
+    deleted REAL                    -- time.time() the file was removed, NULL while present
+);
+CREATE INDEX IF NOT EXISTS images_folder ON images (folder, name) WHERE deleted IS NULL;
+CREATE INDEX IF NOT EXISTS images_updated ON images (updated);
+CREATE INDEX IF NOT EXISTS images_hash ON images (hash) WHERE deleted IS NULL;
+CREATE INDEX IF NOT EXISTS images_status ON images (status) WHERE deleted IS NULL;
+"""
+
+
+def file_hash(path: str) -> str:
+    """Content hash of a file (BLAKE2b, 128 bit)."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def relative_key(root: str, path: str) -> str:
+    """Catalog key of a file: its path below the root with '/' separators."""
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+def is_catalogued(name: str) -> bool:
+    return not name.startswith(".") and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def walk_images(root: str, skip_dirs: Iterable[str] = SKIP_DIRS,
+                accept: Optional[Callable[[str], bool]] = None) -> List[str]:
+    """Every catalogued file below the root (or every path accept() takes), found with os.scandir.
+
+    Directory symlinks are followed when they lead out of the root (a
+    folder on another drive); ones pointing back inside it are aliases of
+    folders walked anyway. Each directory is walked once, so a link loop
+    can't run forever. Unreadable directories are logged and skipped.
+    """
+    found = []
+    stack = [root]
+    real_root = os.path.realpath(root)
+    root_stat = os.stat(root)
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=True):
+                        if entry.name in skip_dirs or entry.name.startswith("."):
+                            continue
+                        if entry.is_symlink():
+                            target = os.path.realpath(entry.path)
+                            if target == real_root or target.startswith(real_root + os.sep):
+                                continue
+                        stat = entry.stat(follow_symlinks=True)
+                        if (stat.st_dev, stat.st_ino) not in visited:
+                            visited.add((stat.st_dev, stat.st_ino))
+                            stack.append(entry.path)
+                    elif accept(entry.path) if accept else is_catalogued(entry.name):
+                        found.append(entry.path)
+        except OSError as e:
+            logger.warning(f"⚠️  Can't read {e.filename}: {e.strerror}")
+    return found
+
+
+def _exif_date(image) -> Optional[str]:
+    """Capture time from the EXIF header, as ISO 8601."""
+    try:
+        exif = image.getexif()
+        value = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+        if value:
+            return datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S").isoformat()
+    except Exception:
+        pass
+    return None
+
+
+def scan_file(root: str, path: str, previous: Optional[dict] = None) -> dict:
+    """Catalog record for one file, reusing `previous` when size and mtime match.
+
+    Only the header is read for dimensions and EXIF; pixel data is never decoded.
+    """
+    stat = os.stat(path)
+    key = relative_key(root, path)
+    if (
+        previous is not None and previous["deleted"] is None
+        and (previous["size"], previous["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns)
+    ):
+        return previous
+
+    record = {
+        "path": key,
+        "folder": key.rpartition("/")[0],
+        "name": key.rpartition("/")[2],
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": file_hash(path),
+        "width": None,
+        "height": None,
+        "taken": None,
+        "status": STATUS_UNCHECKED,
+        "error": None,
+        "updated": time.time(),
+        "deleted": None,
+    }
+    if previous is not None and previous["hash"] == record["hash"] and previous["deleted"] is None:
+        # Touched or re-copied, same content: keep what was learned about it
+        for field in ("width", "height", "taken", "status", "error"):
+            record[field] = previous[field]
+        record["updated"] = previous["updated"]
+        return record
+
+    if Image is not None:
+        try:
+            with Image.open(path) as image:
+                record["width"], record["height"] = image.size
+                record["taken"] = _exif_date(image)
+            record["status"] = STATUS_HEADER_OK
+        except Exception as e:
+            record["status"] = STATUS_CORRUPT
+            record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+class ImageCatalog:
+    """SQLite index of every image below one root."""
+
+    COLUMNS = ("path", "folder", "name", "size", "mtime_ns", "hash", "width", "height",
+               "taken", "status", "error", "updated", "deleted")
+
+    def __init__(self, root: str, db_path: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.db_path = db_path or os.path.join(self.root, CATALOG_DB_NAME)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    # ---- Updates ----
+
+    def upsert(self, records: Iterable[dict]):
+        placeholders = ", ".join("?" for _ in self.COLUMNS)
+        rows = [tuple(record[column] for column in self.COLUMNS) for record in records]
+        with self.lock:
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO images ({', '.join(self.COLUMNS)}) VALUES ({placeholders})", rows
+            )
+            self.db.commit()
+
+    def mark_deleted(self, keys: Iterable[str]):
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                "UPDATE images SET deleted = ?, updated = ? WHERE path = ? AND deleted IS NULL",
+                [(now, now, key) for key in keys]
+            )
+            self.db.commit()
+
+    def set_status(self, key: str, status: str, error: Optional[str] = None):
+        self.set_statuses([(key, status, error)])
+
+    def set_statuses(self, items: Iterable[Tuple[str, str, Optional[str]]]):
+        """Record validation results as (path, status, error)."""
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                "UPDATE images SET status = ?, error = ?, updated = ? WHERE path = ?",
+                [(status, error, now, key) for key, status, error in items]
+            )
+            self.db.commit()
+
+    def purge_deleted(self, before: float):
+        """Drop deletion records older than `before` (time.time())."""
+        with self.lock:
+            self.db.execute("DELETE FROM images WHERE deleted IS NOT NULL AND deleted < ?", (before,))
+            self.db.commit()
+
+    # ---- Queries ----
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def get(self, key: str) -> Optional[dict]:
+        rows = self._query("SELECT * FROM images WHERE path = ?", (key,))
+        return dict(rows[0]) if rows else None
+
+    def get_many(self, keys: List[str]) -> Dict[str, dict]:
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._query(
+                f"SELECT * FROM images WHERE path IN ({', '.join('?' for _ in chunk)})", chunk
+            )
+            found.update((row["path"], dict(row)) for row in rows)
+        return found
+
+    def folder_counts(self) -> Dict[str, Tuple[int, int]]:
+        """Folder -> (images directly in it, their total bytes)."""
+        rows = self._query(
+            "SELECT folder, COUNT(*), SUM(size) FROM images WHERE deleted IS NULL GROUP BY folder"
+        )
+        return {row[0]: (row[1], row[2] or 0) for row in rows}
+
+    def count(self, folder: str, recursive: bool = True) -> int:
+        """Images in a folder, including its subfolders when recursive."""
+        if recursive and not folder:
+            rows = self._query("SELECT COUNT(*) FROM images WHERE deleted IS NULL")
+        elif recursive:
+            rows = self._query(
+                "SELECT COUNT(*) FROM images WHERE deleted IS NULL AND (folder = ? OR (folder >= ? AND folder < ?))",
+                (folder, folder + "/", folder + "0")
+            )
+        else:
+            rows = self._query("SELECT COUNT(*) FROM images WHERE deleted IS NULL AND folder = ?", (folder,))
+        return rows[0][0]
+
+    def cover(self, folder: str) -> Optional[str]:
+        """The folder's Cover.jpg, else its first image by name."""
+        for name in COVER_NAMES:
+            key = f"{folder}/{name}" if folder else name
+            if self._query("SELECT 1 FROM images WHERE path = ? AND deleted IS NULL", (key,)):
+                return key
+        rows = self._query(
+            "SELECT path FROM images WHERE folder = ? AND deleted IS NULL ORDER BY name LIMIT 1", (folder,)
+        )
+        return rows[0][0] if rows else None
+
+    def images(self, folder: Optional[str] = None) -> List[dict]:
+        """Present images, in path order, optionally of one folder only."""
+        if folder is None:
+            rows = self._query("SELECT * FROM images WHERE deleted IS NULL ORDER BY path")
+        else:
+            rows = self._query(
+                "SELECT * FROM images WHERE folder = ? AND deleted IS NULL ORDER BY name", (folder,)
+            )
+        return [dict(row) for row in rows]
+
+    def under(self, folder: str) -> List[str]:
+        """Keys of present images anywhere below a folder key."""
+        prefix = folder.strip("/") + "/"
+        rows = self._query(
+            "SELECT path FROM images WHERE substr(path, 1, ?) = ? AND deleted IS NULL", (len(prefix), prefix)
+        )
+        return [row[0] for row in rows]
+
+    def changed_since(self, since: float) -> List[dict]:
+        """Rows added, changed or deleted after `since` (time.time())."""
+        rows = self._query("SELECT * FROM images WHERE updated > ? ORDER BY updated", (since,))
+        return [dict(row) for row in rows]
+
+    def with_status(self, status: str) -> List[dict]:
+        rows = self._query("SELECT * FROM images WHERE status = ? AND deleted IS NULL ORDER BY path", (status,))
+        return [dict(row) for row in rows]
+
+    def by_hash(self, content_hash: str) -> List[str]:
+        rows = self._query("SELECT path FROM images WHERE hash = ? AND deleted IS NULL", (content_hash,))
+        return [row[0] for row in rows]
+
+    # ---- Indexing ----
+
+    def index_files(self, paths: List[str], workers: int = WORKERS) -> Tuple[int, int, int]:
+        """Scan files into the catalog; returns (changed, unchanged, failed)."""
+        keys = [relative_key(self.root, path) for path in paths]
+        previous = self.get_many(keys)
+
+        def scan(item):
+            path, key = item
+            try:
+                return scan_file(self.root, path, previous.get(key))
+            except FileNotFoundError:
+                return None
+            except OSError as e:
+                logger.error(f"Can't catalog {key}: {e}")
+                return None
+
+        changed, unchanged, failed = [], 0, 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for (path, key), record in zip(zip(paths, keys), pool.map(scan, zip(paths, keys))):
+                if record is None:
+                    failed += 1
+                elif record is previous.get(key):
+                    unchanged += 1
+                else:
+                    changed.append(record)
+        self.upsert(changed)
+        return len(changed), unchanged, failed
+
+    def build(self, workers: int = WORKERS) -> Tuple[int, int, int, int]:
+        """Bring the whole catalog up to date; returns (changed, unchanged, failed, removed)."""
+        paths = walk_images(self.root)
+        changed, unchanged, failed = self.index_files(paths, workers)
+        present = {relative_key(self.root, path) for path in paths}
+        gone = [row[0] for row in self._query("SELECT path FROM images WHERE deleted IS NULL")
+                if row[0] not in present]
+        self.mark_deleted(gone)
+        return changed, unchanged, failed, len(gone)
+
+
+class CatalogStage:
+    """watch-folders.py stage that keeps the catalog current for each batch."""
+
+    name = "catalog"
+
+    def __init__(self, workers: int = WORKERS):
+        self.workers = workers
+        self.catalog: Optional[ImageCatalog] = None
+
+    def process(self, batch):
+        if self.catalog is None:
+            self.catalog = ImageCatalog(batch.root)
+        files = [path for path in batch.files if is_catalogued(os.path.basename(path))]
+        changed, unchanged, failed = self.catalog.index_files(files, self.workers)
+        self.catalog.mark_deleted(relative_key(batch.root, path) for path in batch.deleted)
+        logger.info(
+            f"🗂️  Catalog: {changed} new/changed, {unchanged} unchanged, "
+            f"{failed} failed, {len(batch.deleted)} removed"
+        )
+
+    def close(self):
+        if self.catalog is not None:
+            self.catalog.close()
+            self.catalog = None
+
+
+def parse_since(text: str) -> float:
+    """ISO date/time, or a number of seconds ago."""
+    try:
+        return time.time() - float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Query or rebuild the portfolio image catalog")
+    parser.add_argument("root", help="portfolio images folder")
+    parser.add_argument("--db", help=f"catalog file (default <root>/{CATALOG_DB_NAME})")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--json", action="store_true", help="print results as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="index the whole tree (only changed files are hashed)")
+    build_parser.add_argument("--workers", type=int, default=WORKERS)
+    commands.add_parser("counts", parents=[output], help="images and bytes per folder")
+    cover_parser = commands.add_parser("cover", parents=[output], help="cover image of a folder")
+    cover_parser.add_argument("folder")
+    changed_parser = commands.add_parser("changed", parents=[output], help="files changed since a time")
+    changed_parser.add_argument("--since", required=True, help="ISO date/time or seconds ago")
+    status_parser = commands.add_parser("status", parents=[output], help="files with a validation status")
+    status_parser.add_argument("status", choices=(STATUS_UNCHECKED, STATUS_HEADER_OK, STATUS_VALID, STATUS_CORRUPT))
+    args = parser.parse_args()
+    as_json = getattr(args, "json", False)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not os.path.isdir(args.root):
+        print(f"❌ Not a directory: {args.root}")
+        return 1
+    catalog = ImageCatalog(args.root, args.db)
+    try:
+        if args.command == "build":
+            started = time.monotonic()
+            changed, unchanged, failed, removed = catalog.build(args.workers)
+            print(f"✅ {changed} new/changed, {unchanged} unchanged, {failed} failed, "
+                  f"{removed} removed in {time.monotonic() - started:.1f}s")
+            result = None
+        elif args.command == "counts":
+            result = {folder or ".": {"images": count, "bytes": size}
+                      for folder, (count, size) in sorted(catalog.folder_counts().items())}
+            if not as_json:
+                for folder, info in result.items():
+                    print(f"{info['images']:7d}  {info['bytes'] / 1024 / 1024:9.1f} MB  {folder}")
+        elif args.command == "cover":
+            result = catalog.cover(args.folder.strip("/"))
+            if not as_json:
+                print(result or "No images")
+        elif args.command == "changed":
+            result = catalog.changed_since(parse_since(args.since))
+            if not as_json:
+                for row in result:
+                    print(f"{'deleted' if row['deleted'] else 'changed'}  {row['path']}")
+        else:
+            result = catalog.with_status(args.status)
+            if not as_json:
+                for row in result:
+                    print(f"{row['path']}  {row['error'] or ''}")
+        if as_json and result is not None:
+            print(json.dumps(result, indent=2))
+    finally:
+        catalog.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
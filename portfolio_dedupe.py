@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Duplicate and near-duplicate finder for the photo portfolio
+Every image gets a 64-bit perceptual hash (dHash) from a tiny greyscale
+thumbnail, decoded in JPEG draft mode so only about 1/64 of the pixels are
+ever produced. Hashes are cached by (size, mtime) and kept in a
+multi-index hash table, so "what looks like this image" only compares the
+few hashes sharing a chunk with it, and clustering 100k images never
+compares every pair. Runs as a watch-folders.py stage or on its own:
+
+    python3 portfolio_dedupe.py /mnt/Plex/photo-portfolio/images
+    python3 portfolio_dedupe.py /mnt/Plex/photo-portfolio/images --threshold 4 --report duplicates.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import portfolio_catalog
+from portfolio_catalog import relative_key
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+# ==================== CONFIGURATION ====================
+HASH_DB_NAME = ".dedupe-hashes.db"    # Kept in the portfolio root
+WORKERS = os.cpu_count() or 4
+STAGE_WORKERS = 1                     # Worker processes when run by watch-folders.py
+CHUNK_SIZE = 32                       # Files per worker task
+HASH_SIZE = 8                         # 8x8 gradient bits = 64-bit hash
+THRESHOLD = 6                         # Max differing bits for a near-duplicate
+# =======================================================
+
+logger = logging.getLogger("portfolio_dedupe")
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+def dhash(path: str) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a 9x8 greyscale thumbnail."""
+    with Image.open(path) as image:
+        # JPEGs decode straight to 1/8 scale (or less work); other formats ignore this
+        image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image)
+        small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def _hash_job(path: str) -> Tuple[str, Optional[int], Optional[str]]:
+    """Runs in a worker process; returns (path, hash, error)."""
+    try:
+        return path, dhash(path), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def chunk_layout(bits: int, radius: int) -> List[Tuple[int, int]]:
+    """(shift, mask) of radius+1 near-equal chunks covering a bits-wide hash."""
+    chunks = min(radius + 1, bits)
+    widths = [bits // chunks + (i < bits % chunks) for i in range(chunks)]
+    layout = []
+    shift = bits
+    for width in widths:
+        shift -= width
+        layout.append((shift, (1 << width) - 1))
+    return layout
+
+
+def close_pairs(items: List[Tuple[int, int]], bits: int, radius: int, limit: int,
+                seen: Set[Tuple[int, ...]]) -> Set[Tuple[int, int]]:
+    """(a, b) with a < b for every two of the (id, value) items at most radius bits apart.
+
+    Small groups are compared directly. A larger one (skies, black frames)
+    drops the bits all its values share, then is bucketed by radius+1
+    chunks of the bits that differ, like MultiIndexHash: a bucket holding
+    nearly the whole group is split off from its few strays, otherwise
+    each bucket recurses when that costs less than comparing the group.
+    `seen` holds the groups already done, so one found again under another
+    chunk is skipped.
+    """
+    found = set()
+    if len(items) <= limit:
+        for i, (a, value) in enumerate(items):
+            for b, other in items[i + 1:]:
+                if popcount(value ^ other) <= radius:
+                    found.add((a, b) if a < b else (b, a))
+        return found
+
+    varying = 0
+    for _, value in items:
+        varying |= value ^ items[0][1]
+    if popcount(varying) <= radius:
+        # Every pair is close enough
+        keys = sorted(key for key, _ in items)
+        return {(a, b) for i, a in enumerate(keys) for b in keys[i + 1:]}
+    if popcount(varying) < bits:
+        # Squeeze the runs of differing bits together
+        runs = []
+        bit = 0
+        while varying >> bit:
+            if varying >> bit & 1:
+                start = bit
+                while varying >> bit & 1:
+                    bit += 1
+                runs.append((start, (1 << (bit - start)) - 1, bit - start))
+            else:
+                bit += 1
+        compacted = []
+        for key, value in items:
+            packed = offset = 0
+            for start, mask, width in runs:
+                packed |= ((value >> start) & mask) << offset
+                offset += width
+            compacted.append((key, packed))
+        items = compacted
+        bits = popcount(varying)
+
+    buckets: Dict[Tuple[int, ...], List[Tuple[int, int]]] = {}
+    for shift, mask in chunk_layout(bits, radius):
+        table: Dict[int, List[Tuple[int, int]]] = {}
+        for item in items:
+            table.setdefault((item[1] >> shift) & mask, []).append(item)
+        for bucket in table.values():
+            if len(bucket) > 1:
+                buckets[tuple(key for key, _ in bucket)] = bucket
+
+    largest = max(buckets, key=len, default=())
+    if len(largest) >= 0.9 * len(items):
+        # A tight cluster plus a few strays: compare the strays with
+        # everything, then the cluster on its own, where its shared bits drop out
+        cluster = set(largest)
+        strays = [item for item in items if item[0] not in cluster]
+        for a, value in strays:
+            for b, other in items:
+                if a != b and popcount(value ^ other) <= radius:
+                    found.add((a, b) if a < b else (b, a))
+        if largest not in seen:
+            seen.add(largest)
+            found |= close_pairs(buckets[largest], bits, radius, limit, seen)
+        return found
+    if sum(len(members) ** 2 for members in buckets) >= len(items) ** 2:
+        # Values too evenly spread for the chunks to narrow anything down
+        return close_pairs(items, bits, radius, len(items), seen)
+    for members, bucket in buckets.items():
+        if members not in seen:
+            seen.add(members)
+            found |= close_pairs(bucket, bits, radius, limit, seen)
+    return found
+
+
+class MultiIndexHash:
+    """Hashes split into radius+1 chunks, with a lookup table per chunk.
+
+    Two hashes at most `radius` bits apart agree exactly on at least one
+    chunk (pigeonhole), so a search only compares against the hashes that
+    share a chunk with the query: a few hundred table entries instead of
+    the whole library. Several files with the same hash share a node;
+    removing them leaves the node empty.
+    """
+
+    BUCKET_LIMIT = 64   # pairs() splits bigger buckets instead of comparing every two members
+
+    def __init__(self, radius: int = THRESHOLD, bits: int = HASH_SIZE * HASH_SIZE):
+        self.radius = radius
+        self.bits = bits
+        self.chunks: List[Tuple[int, int]] = chunk_layout(bits, radius)    # (shift, mask) of each chunk
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in self.chunks]
+        self.values: List[int] = []
+        self.keys: List[Set[str]] = []
+        self.nodes: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return sum(len(keys) for keys in self.keys)
+
+    def add(self, value: int, key: str):
+        node = self.nodes.get(value)
+        if node is not None:
+            self.keys[node].add(key)
+            return
+        node = len(self.values)
+        self.values.append(value)
+        self.keys.append({key})
+        self.nodes[value] = node
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            table.setdefault((value >> shift) & mask, []).append(node)
+
+    def remove(self, value: int, key: str):
+        node = self.nodes.get(value)
+        if node is not None:
+            self.keys[node].discard(key)
+
+    def search(self, value: int, radius: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(distance, node) of every live node within radius of value."""
+        radius = self.radius if radius is None else min(radius, self.radius)
+        found = []
+        seen = set()
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            for node in table.get((value >> shift) & mask, ()):
+                if node in seen:
+                    continue
+                seen.add(node)
+                distance = popcount(value ^ self.values[node])
+                if distance <= radius and self.keys[node]:
+                    found.append((distance, node))
+        return found
+
+    def pairs(self) -> List[Tuple[int, int]]:
+        """Every pair of live nodes within the radius, each found from a shared chunk bucket."""
+        found = set()
+        seen = set()
+        for table in self.tables:
+            for bucket in table.values():
+                live = [node for node in bucket if self.keys[node]]
+                if len(live) > self.BUCKET_LIMIT:
+                    # Comparing every two would go quadratic: split it further
+                    if tuple(live) not in seen:
+                        seen.add(tuple(live))
+                        found |= close_pairs([(node, self.values[node]) for node in live],
+                                             self.bits, self.radius, self.BUCKET_LIMIT, seen)
+                    continue
+                for i, a in enumerate(live):
+                    value = self.values[a]
+                    for b in live[i + 1:]:
+                        if popcount(value ^ self.values[b]) <= self.radius:
+                            found.add((a, b))
+        return sorted(found)
+
+    def live_nodes(self) -> List[int]:
+        return [node for node, keys in enumerate(self.keys) if keys]
+
+
+class HashStore:
+    """Perceptual hashes keyed by path, valid while size and mtime match."""
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, dhash TEXT, error TEXT, hashed REAL)"
+        )
+        self.db.commit()
+
+    def load(self) -> Dict[str, tuple]:
+        """path -> (size, mtime_ns, hash or None, error)."""
+        rows = self.db.execute("SELECT path, size, mtime_ns, dhash, error FROM hashes")
+        return {row[0]: (row[1], row[2], int(row[3], 16) if row[3] else None, row[4]) for row in rows}
+
+    def store(self, rows):
+        """Rows of (path, size, mtime_ns, hash or None, error)."""
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO hashes (path, size, mtime_ns, dhash, error, hashed) VALUES (?, ?, ?, ?, ?, ?)",
+            [(key, size, mtime_ns, f"{value:016x}" if value is not None else None, error, now)
+             for key, size, mtime_ns, value, error in rows]
+        )
+        self.db.commit()
+
+    def forget(self, keys):
+        self.db.executemany("DELETE FROM hashes WHERE path = ?", [(key,) for key in keys])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class DuplicateIndex:
+    """Perceptual hashes of every image below a root, searchable by Hamming distance."""
+
+    def __init__(self, root: str, workers: int = WORKERS, threshold: int = THRESHOLD):
+        if Image is None:
+            raise RuntimeError("Pillow is required for duplicate detection: pip3 install Pillow")
+        self.root = os.path.abspath(root)
+        self.workers = max(1, workers)
+        self.store = HashStore(os.path.join(self.root, HASH_DB_NAME))
+        self.entries = self.store.load()
+        self.threshold = threshold
+        self.hashes = MultiIndexHash(threshold)
+        for key, (_size, _mtime_ns, value, _error) in self.entries.items():
+            if value is not None:
+                self.hashes.add(value, key)
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    def update(self, paths: List[str]) -> Tuple[List[str], int, int]:
+        """Hash new or changed files; returns (keys hashed, unchanged count, failed count)."""
+        to_hash = {}
+        unchanged = 0
+        for path in paths:
+            key = relative_key(self.root, path)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entry = self.entries.get(key)
+            if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                unchanged += 1
+            else:
+                to_hash[path] = (key, stat.st_size, stat.st_mtime_ns)
+        if not to_hash:
+            return [], unchanged, 0
+
+        if self.pool is None:
+            # spawn: the watcher runs observer threads, which fork() doesn't mix with
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        rows = []
+        hashed = []
+        failed = 0
+        for path, value, error in self.pool.map(_hash_job, list(to_hash), chunksize=CHUNK_SIZE):
+            key, size, mtime_ns = to_hash[path]
+            previous = self.entries.get(key)
+            if previous is not None and previous[2] is not None:
+                self.hashes.remove(previous[2], key)
+            self.entries[key] = (size, mtime_ns, value, error)
+            rows.append((key, size, mtime_ns, value, error))
+            if value is None:
+                failed += 1
+                logger.debug(f"Can't hash {key}: {error}")
+            else:
+                self.hashes.add(value, key)
+                hashed.append(key)
+        self.store.store(rows)
+        return hashed, unchanged, failed
+
+    def forget(self, paths: List[str]):
+        keys = [relative_key(self.root, path) for path in paths]
+        for key in keys:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[2] is not None:
+                self.hashes.remove(entry[2], key)
+        self.store.forget(keys)
+
+    def similar(self, key: str) -> List[Tuple[str, int]]:
+        """Other images within the threshold of this one, closest first."""
+        entry = self.entries.get(key)
+        if entry is None or entry[2] is None:
+            return []
+        matches = []
+        for distance, node in self.hashes.search(entry[2]):
+            matches.extend((other, distance) for other in self.hashes.keys[node] if other != key)
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+    def clusters(self) -> List[List[str]]:
+        """Groups of images that chain together within the threshold, largest first."""
+        parent: Dict[int, int] = {}
+
+        def find(node):
+            root = node
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while parent.get(node, node) != root:
+                parent[node], node = root, parent[node]
+            return root
+
+        for node, other in self.hashes.pairs():
+            a, b = find(node), find(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+        groups: Dict[int, List[str]] = {}
+        for node in self.hashes.live_nodes():
+            groups.setdefault(find(node), []).extend(self.hashes.keys[node])
+        clusters = [sorted(keys) for keys in groups.values() if len(keys) > 1]
+        return sorted(clusters, key=lambda keys: (-len(keys), keys[0]))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.store.close()
+
+
+def build_report(index: DuplicateIndex, catalog: Optional[portfolio_catalog.ImageCatalog] = None) -> dict:
+    """Machine-readable duplicate report; the largest file of each cluster is its keeper."""
+    clusters = []
+    reclaimable = 0
+    for keys in index.clusters():
+        rows = catalog.get_many(keys) if catalog is not None else {}
+        sizes = {key: index.entries[key][0] for key in keys}
+        keeper = max(sorted(keys), key=sizes.get)    # First by name among equals
+        keeper_hash = index.entries[keeper][2]
+        content = {rows[key]["hash"] for key in keys if key in rows}
+        members = [
+            {"path": key, "bytes": sizes[key], "distance": popcount(index.entries[key][2] ^ keeper_hash)}
+            for key in sorted(keys, key=lambda key: (key != keeper, key))
+        ]
+        saving = sum(sizes.values()) - sizes[keeper]
+        reclaimable += saving
+        clusters.append({
+            "keeper": keeper,
+            "identical": len(content) == 1 and len(rows) == len(keys),
+            "folders": sorted({key.rpartition("/")[0] or "." for key in keys}),
+            "reclaimable_bytes": saving,
+            "images": members,
+        })
+    return {
+        "root": index.root,
+        "generated": datetime.now().isoformat(),
+        "threshold": index.threshold,
+        "images": len(index.hashes),
+        "clusters": len(clusters),
+        "duplicates": sum(len(cluster["images"]) - 1 for cluster in clusters),
+        "reclaimable_bytes": reclaimable,
+        "groups": clusters,
+    }
+
+
+class DedupeStage:
+    """watch-folders.py stage that hashes each new image and reports what it duplicates."""
+
+    name = "dedupe"
+
+    def __init__(self, workers: int = STAGE_WORKERS, threshold: int = THRESHOLD):
+        self.workers = workers
+        self.threshold = threshold
+        self.index: Optional[DuplicateIndex] = None
+
+    def process(self, batch):
+        if self.index is None:
+            self.index = DuplicateIndex(batch.root, self.workers, self.threshold)
+        files = [path for path in batch.files if portfolio_catalog.is_catalogued(os.path.basename(path))]
+        self.index.forget(batch.deleted)
+        hashed, unchanged, failed = self.index.update(files)
+        for key in hashed:
+            matches = self.index.similar(key)
+            if matches:
+                shown = ", ".join(f"{other} ({distance} bits)" for other, distance in matches[:3])
+                more = f" and {len(matches) - 3} more" if len(matches) > 3 else ""
+                logger.warning(f"🪞 {key} looks like {shown}{more}")
+        if files:
+            logger.info(f"🪞 Dedupe: {len(hashed)} hashed, {unchanged} unchanged, {failed} unreadable")
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Find duplicate and near-duplicate portfolio images")
+    parser.add_argument("root", help="portfolio images folder")
+    parser.add_argument("--threshold", type=int, default=THRESHOLD,
+                        help=f"max differing hash bits, 0 for identical-looking only (default {THRESHOLD})")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"worker processes (default {WORKERS})")
+    parser.add_argument("--report", help="write the JSON report to this file")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not os.path.isdir(args.root):
+        print(f"❌ Not a directory: {args.root}")
+        return 1
+    if Image is None:
+        print("Duplicate detection needs Pillow: pip3 install Pillow")
+        return 1
+
+    started = time.monotonic()
+    index = DuplicateIndex(args.root, args.workers, args.threshold)
+    catalog_path = os.path.join(args.root, portfolio_catalog.CATALOG_DB_NAME)
+    catalog = portfolio_catalog.ImageCatalog(args.root) if os.path.exists(catalog_path) else None
+    try:
+        paths = portfolio_catalog.walk_images(index.root)
+        present = {relative_key(index.root, path) for path in paths}
+        index.forget([os.path.join(index.root, key) for key in index.entries if key not in present])
+        hashed, unchanged, failed = index.update(paths)
+        logger.info(f"{len(hashed)} hashed, {unchanged} unchanged, {failed} unreadable "
+                    f"in {time.monotonic() - started:.1f}s")
+        report = build_report(index, catalog)
+    finally:
+        index.close()
+        if catalog is not None:
+            catalog.close()
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    for cluster in report["groups"]:
+        kind = "identical files" if cluster["identical"] else "look alike"
+        print(f"🪞 {len(cluster['images'])} images ({kind}, "
+              f"{cluster['reclaimable_bytes'] / 1024 / 1024:.1f} MB reclaimable):")
+        for image in cluster["images"]:
+            marker = "keep" if image["path"] == cluster["keeper"] else f"{image['distance']:>2} bits"
+            print(f"    {marker:>7}  {image['path']}")
+    print(f"🔎 {report['images']} image(s): {report['duplicates']} duplicate(s) in {report['clusters']} "
+          f"cluster(s), {report['reclaimable_bytes'] / 1024 / 1024:.1f} MB reclaimable, "
+          f"in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,693 @@
+#!/usr/bin/env python3
+"""
+EXIF/XMP metadata for the photo portfolio
+Reads capture time, camera, lens, exposure, GPS and XMP rating/title/
+keywords straight from the metadata segments of each JPEG/TIFF (a JPEG is
+read only up to its image data, a TIFF only where its IFDs point), on a
+thread pool, and keeps them in a columnar NumPy table (.exif-cache.npz in
+the portfolio root). Sorting or filtering the whole library by date or
+camera is then a few array operations. Runs as a watch-folders.py stage
+or on its own:
+
+    python3 portfolio_exif.py /mnt/Plex/photo-portfolio/images build
+    python3 portfolio_exif.py /mnt/Plex/photo-portfolio/images query --camera "EOS R5" --since 2024-01-01
+    python3 portfolio_exif.py /mnt/Plex/photo-portfolio/images query --folder safaris --sort taken
+    python3 portfolio_exif.py /mnt/Plex/photo-portfolio/images cameras
+"""
+
+import argparse
+import html
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import portfolio_catalog
+from portfolio_catalog import relative_key
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ==================== CONFIGURATION ====================
+CACHE_NAME = ".exif-cache.npz"      # Kept in the portfolio root
+WORKERS = 8                         # Threads reading metadata (mostly waiting on the disk)
+STAGE_WORKERS = 4                   # Threads when run by watch-folders.py
+BATCH_SIZE = 256                    # Files per thread pool task
+METADATA_EXTENSIONS = {".jpg", ".jpeg", ".tif", ".tiff"}
+# =======================================================
+
+EPOCH = datetime(1970, 1, 1)
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+EXIF_HEADER = b"Exif\x00\x00"
+
+# TIFF tags
+TAG_DESCRIPTION = 270
+TAG_MAKE = 271
+TAG_MODEL = 272
+TAG_ORIENTATION = 274
+TAG_DATETIME = 306
+TAG_XMP = 700
+TAG_EXPOSURE_TIME = 33434
+TAG_FNUMBER = 33437
+TAG_EXIF_IFD = 34665
+TAG_GPS_IFD = 34853
+TAG_ISO = 34855
+TAG_DATETIME_ORIGINAL = 36867
+TAG_DATETIME_DIGITIZED = 36868
+TAG_OFFSET_TIME_ORIGINAL = 36881
+TAG_FOCAL_LENGTH = 37386
+TAG_LENS_MODEL = 42036
+IFD0_TAGS = {TAG_DESCRIPTION, TAG_MAKE, TAG_MODEL, TAG_ORIENTATION, TAG_DATETIME, TAG_XMP, TAG_EXIF_IFD, TAG_GPS_IFD}
+EXIF_TAGS = {TAG_EXPOSURE_TIME, TAG_FNUMBER, TAG_ISO, TAG_DATETIME_ORIGINAL, TAG_DATETIME_DIGITIZED,
+             TAG_OFFSET_TIME_ORIGINAL, TAG_FOCAL_LENGTH, TAG_LENS_MODEL}
+GPS_TAGS = {1, 2, 3, 4, 5, 6}       # Latitude ref/value, longitude ref/value, altitude ref/value
+
+# TIFF field type -> (struct code, size)
+FIELD_TYPES = {1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 7: ("B", 1),
+               9: ("i", 4), 10: ("ii", 8), 11: ("f", 4), 12: ("d", 8)}
+
+# Table columns
+FLOAT_COLUMNS = ("taken", "offset_minutes", "focal_length", "fnumber", "exposure", "iso",
+                 "latitude", "longitude", "altitude", "rating")     # NaN when missing
+INT_COLUMNS = ("size", "mtime_ns", "orientation")                   # 0 orientation when missing
+CATEGORY_COLUMNS = ("camera", "lens")                               # Codes into a vocabulary, -1 when missing
+TEXT_COLUMNS = ("path", "title", "description", "keywords")         # UTF-8 bytes + offsets
+
+logger = logging.getLogger("portfolio_exif")
+
+
+# ---- Parsing ----
+
+def jpeg_segments(f) -> tuple:
+    """(EXIF TIFF bytes, XMP packet) from a JPEG's APP1 segments, stopping at the image data."""
+    if f.read(2) != b"\xff\xd8":
+        raise ValueError("not a JPEG")
+    exif = xmp = None
+    while True:
+        byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            break
+        marker = byte[0]
+        if marker in (0xD9, 0xDA):    # EOI, or SOS: only image data follows
+            break
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue
+        header = f.read(2)
+        if len(header) < 2:
+            break
+        length = struct.unpack(">H", header)[0] - 2
+        if marker == 0xE1:
+            data = f.read(length)
+            if data.startswith(EXIF_HEADER) and exif is None:
+                exif = data[len(EXIF_HEADER):]
+            elif data.startswith(XMP_HEADER) and xmp is None:
+                xmp = data[len(XMP_HEADER):]
+        else:
+            f.seek(length, os.SEEK_CUR)
+    return exif, xmp
+
+
+class TiffReader:
+    """Just enough of a TIFF IFD parser for the tags above, over bytes or an mmap."""
+
+    def __init__(self, data):
+        self.data = data
+        order = bytes(data[:2])
+        if order == b"II":
+            self.endian = "<"
+        elif order == b"MM":
+            self.endian = ">"
+        else:
+            raise ValueError("not TIFF data")
+        if self._unpack("H", 2)[0] != 42:
+            raise ValueError("bad TIFF magic")
+
+    def _unpack(self, fmt: str, offset: int) -> tuple:
+        return struct.unpack_from(self.endian + fmt, self.data, offset)
+
+    def ifd0_offset(self) -> int:
+        return self._unpack("I", 4)[0]
+
+    def read_ifd(self, offset: int, wanted: set) -> Dict[int, object]:
+        tags = {}
+        if not 8 <= offset <= len(self.data) - 2:
+            return tags
+        count = self._unpack("H", offset)[0]
+        for index in range(min(count, 1000)):
+            entry = offset + 2 + index * 12
+            if entry + 12 > len(self.data):
+                break
+            tag, kind, items, value_offset = self._unpack("HHII", entry)
+            if tag not in wanted or kind not in FIELD_TYPES:
+                continue
+            code, size = FIELD_TYPES[kind]
+            start = entry + 8 if size * items <= 4 else value_offset
+            if start + size * items > len(self.data):
+                continue
+            tags[tag] = self._value(code, size, items, start)
+        return tags
+
+    def _value(self, code: str, size: int, items: int, start: int):
+        if code == "s":
+            return bytes(self.data[start:start + items]).split(b"\x00", 1)[0].decode("utf-8", "replace").strip()
+        if code == "B" and items > 4:
+            return bytes(self.data[start:start + items])
+        if code in ("II", "ii"):
+            pairs = self._unpack(code * items, start)
+            values = [pairs[i] / pairs[i + 1] if pairs[i + 1] else None for i in range(0, len(pairs), 2)]
+        else:
+            values = list(self._unpack(code * items, start))
+        return values[0] if items == 1 else values
+
+
+def _xmp_value(xmp: str, name: str) -> Optional[str]:
+    """A simple XMP property, written as an attribute or as an element."""
+    match = re.search(rf'{name}="([^"]*)"', xmp) or re.search(rf"<{name}>([^<]*)</{name}>", xmp)
+    return html.unescape(match.group(1)).strip() if match else None
+
+
+def _xmp_list(xmp: str, name: str) -> List[str]:
+    """Items of an rdf:Alt/Bag/Seq property such as dc:title or dc:subject."""
+    match = re.search(rf"<{name}>(.*?)</{name}>", xmp, re.S)
+    if not match:
+        return []
+    return [html.unescape(item).strip() for item in re.findall(r"<rdf:li[^>]*>([^<]*)</rdf:li>", match.group(1))]
+
+
+def _taken(text) -> Optional[float]:
+    """EXIF "YYYY:MM:DD HH:MM:SS" as wall-clock seconds since 1970 (the camera's local time)."""
+    try:
+        return (datetime.strptime(str(text)[:19], "%Y:%m:%d %H:%M:%S") - EPOCH).total_seconds()
+    except ValueError:
+        return None
+
+
+def _gps(values, ref) -> Optional[float]:
+    try:
+        degrees, minutes, seconds = values
+        value = degrees + minutes / 60 + seconds / 3600
+    except (TypeError, ValueError):
+        return None
+    return -value if ref in ("S", "W") else value
+
+
+def _camera(make: Optional[str], model: Optional[str]) -> Optional[str]:
+    """One camera name: "Canon" + "Canon EOS R5" -> "Canon EOS R5", "FUJIFILM" + "X-T4" -> "FUJIFILM X-T4"."""
+    make, model = (make or "").strip(), (model or "").strip()
+    if not model:
+        return make or None
+    brand = make.split(" ")[0].lower()
+    return model if not brand or model.lower().startswith(brand) else f"{make.split(' ')[0]} {model}"
+
+
+def empty_record(key: str, size: int, mtime_ns: int) -> dict:
+    record = {column: None for column in FLOAT_COLUMNS + CATEGORY_COLUMNS + TEXT_COLUMNS}
+    record.update(path=key, size=size, mtime_ns=mtime_ns, orientation=0)
+    return record
+
+
+def read_metadata(path: str, key: str) -> dict:
+    """Metadata record of one file; never decodes pixel data."""
+    stat = os.stat(path)
+    record = empty_record(key, stat.st_size, stat.st_mtime_ns)
+    tags: Dict[int, object] = {}
+    exif_tags: Dict[int, object] = {}
+    gps: Dict[int, object] = {}
+    xmp = None
+    with open(path, "rb") as f:
+        if os.path.splitext(path)[1].lower() in (".tif", ".tiff"):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                reader = TiffReader(data)
+                tags = reader.read_ifd(reader.ifd0_offset(), IFD0_TAGS)
+                exif_tags = reader.read_ifd(tags.get(TAG_EXIF_IFD, 0), EXIF_TAGS)
+                gps = reader.read_ifd(tags.get(TAG_GPS_IFD, 0), GPS_TAGS)
+                if isinstance(tags.get(TAG_XMP), bytes):
+                    xmp = tags[TAG_XMP]
+        else:
+            exif, xmp = jpeg_segments(f)
+            if exif:
+                reader = TiffReader(exif)
+                tags = reader.read_ifd(reader.ifd0_offset(), IFD0_TAGS)
+                exif_tags = reader.read_ifd(tags.get(TAG_EXIF_IFD, 0), EXIF_TAGS)
+                gps = reader.read_ifd(tags.get(TAG_GPS_IFD, 0), GPS_TAGS)
+
+    taken = (exif_tags.get(TAG_DATETIME_ORIGINAL) or exif_tags.get(TAG_DATETIME_DIGITIZED)
+             or tags.get(TAG_DATETIME))
+    record["taken"] = _taken(taken) if taken else None
+    offset = exif_tags.get(TAG_OFFSET_TIME_ORIGINAL)
+    match = re.fullmatch(r"([+-])(\d\d):(\d\d)", offset or "")
+    if match:
+        record["offset_minutes"] = (1 if match.group(1) == "+" else -1) * (int(match.group(2)) * 60 + int(match.group(3)))
+    record["camera"] = _camera(tags.get(TAG_MAKE), tags.get(TAG_MODEL))
+    record["lens"] = exif_tags.get(TAG_LENS_MODEL) or None
+    record["focal_length"] = exif_tags.get(TAG_FOCAL_LENGTH)
+    record["fnumber"] = exif_tags.get(TAG_FNUMBER)
+    record["exposure"] = exif_tags.get(TAG_EXPOSURE_TIME)
+    iso = exif_tags.get(TAG_ISO)
+    record["iso"] = iso[0] if isinstance(iso, list) else iso
+    orientation = tags.get(TAG_ORIENTATION)
+    record["orientation"] = orientation if isinstance(orientation, int) and 1 <= orientation <= 8 else 0
+    record["latitude"] = _gps(gps.get(2), gps.get(1))
+    record["longitude"] = _gps(gps.get(4), gps.get(3))
+    if isinstance(gps.get(6), float):
+        record["altitude"] = -gps[6] if gps.get(5) == 1 else gps[6]
+    record["description"] = tags.get(TAG_DESCRIPTION) or None
+
+    if xmp:
+        text = xmp.decode("utf-8", "replace")
+        rating = _xmp_value(text, "xmp:Rating")
+        try:
+            record["rating"] = float(rating) if rating is not None else None
+        except ValueError:
+            pass
+        record["title"] = next(iter(_xmp_list(text, "dc:title")), None)
+        record["description"] = next(iter(_xmp_list(text, "dc:description")), None) or record["description"]
+        record["keywords"] = "; ".join(_xmp_list(text, "dc:subject")) or None
+        record["lens"] = record["lens"] or _xmp_value(text, "aux:Lens") or _xmp_value(text, "exifEX:LensModel")
+        if record["taken"] is None:
+            created = _xmp_value(text, "photoshop:DateCreated") or _xmp_value(text, "xmp:CreateDate")
+            try:
+                record["taken"] = (datetime.fromisoformat(created[:19]) - EPOCH).total_seconds() if created else None
+            except ValueError:
+                pass
+    return record
+
+
+def _read_batch(items: List[tuple]) -> List[dict]:
+    """Read a batch of (path, key) on one thread; unreadable files get an empty record."""
+    records = []
+    for path, key in items:
+        try:
+            records.append(read_metadata(path, key))
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            logger.debug(f"No metadata from {key}: {type(e).__name__}: {e}")
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            records.append(empty_record(key, stat.st_size, stat.st_mtime_ns))
+    return records
+
+
+# ---- Columnar table ----
+
+class MetadataTable:
+    """Column arrays for every file: floats (NaN missing), ints, dictionary-coded
+    categories and variable-length UTF-8 text, saved together as one .npz."""
+
+    def __init__(self, columns: Dict[str, "np.ndarray"]):
+        self.columns = columns
+        self.size = len(columns["size"])
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def from_records(cls, records: List[dict]) -> "MetadataTable":
+        columns = {}
+        for name in FLOAT_COLUMNS:
+            columns[name] = np.array([np.nan if r[name] is None else r[name] for r in records], dtype=np.float64)
+        for name in INT_COLUMNS:
+            columns[name] = np.array([r[name] for r in records], dtype=np.int64)
+        for name in CATEGORY_COLUMNS:
+            vocabulary = sorted({r[name] for r in records if r[name]})
+            codes = {value: code for code, value in enumerate(vocabulary)}
+            columns[f"{name}.codes"] = np.array([codes.get(r[name], -1) for r in records], dtype=np.int32)
+            columns[f"{name}.vocab"] = np.array(vocabulary, dtype=str)
+        for name in TEXT_COLUMNS:
+            encoded = [(r[name] or "").encode() for r in records]
+            columns[f"{name}.offsets"] = np.cumsum([0] + [len(value) for value in encoded], dtype=np.int64)
+            columns[f"{name}.data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(columns)
+
+    def merge(self, changed: Dict[int, dict], added: List[dict], removed: Iterable[int]) -> "MetadataTable":
+        """A copy with rows replaced, appended and dropped; untouched rows are copied as whole arrays."""
+        positions = list(changed) + list(range(self.size, self.size + len(added)))
+        records = list(changed.values()) + added
+        keep = np.ones(self.size + len(added), dtype=bool)
+        keep[list(removed)] = False
+        columns = {}
+        for name in FLOAT_COLUMNS:
+            column = np.concatenate([self.columns[name], np.full(len(added), np.nan)])
+            column[positions] = [np.nan if r[name] is None else r[name] for r in records]
+            columns[name] = column[keep]
+        for name in INT_COLUMNS:
+            column = np.concatenate([self.columns[name], np.zeros(len(added), dtype=np.int64)])
+            column[positions] = [r[name] for r in records]
+            columns[name] = column[keep]
+        for name in CATEGORY_COLUMNS:
+            vocabulary = self.columns[f"{name}.vocab"]
+            codes = np.concatenate([self.columns[f"{name}.codes"], np.full(len(added), -1, dtype=np.int32)])
+            new = {r[name] for r in records if r[name]} - set(vocabulary.tolist())
+            if new:
+                merged = np.array(sorted(set(vocabulary.tolist()) | new), dtype=str)
+                codes = np.append(np.searchsorted(merged, vocabulary), -1).astype(np.int32)[codes]
+                vocabulary = merged
+            lookup = {value: code for code, value in enumerate(vocabulary.tolist())}
+            codes[positions] = [lookup.get(r[name], -1) for r in records]
+            codes = codes[keep]
+            used = np.unique(codes[codes >= 0])
+            if len(used) < len(vocabulary):
+                vocabulary = vocabulary[used]
+                codes = np.where(codes >= 0, np.searchsorted(used, codes), -1).astype(np.int32)
+            columns[f"{name}.codes"] = codes
+            columns[f"{name}.vocab"] = vocabulary
+        for name in TEXT_COLUMNS:
+            offsets = self.columns[f"{name}.offsets"]
+            data = self.columns[f"{name}.data"]
+            lengths = np.concatenate([np.diff(offsets), np.zeros(len(added), dtype=np.int64)])
+            encoded = {row: b"" for row in np.flatnonzero(~keep).tolist()}
+            encoded.update((row, (r[name] or "").encode()) for row, r in zip(positions, records))
+            pieces = []
+            start = 0
+            for row in sorted(encoded):
+                old = (offsets[row], offsets[row + 1]) if row < self.size else (len(data), len(data))
+                pieces += [data[start:old[0]], np.frombuffer(encoded[row], dtype=np.uint8)]
+                start = old[1]
+                lengths[row] = len(encoded[row])
+            pieces.append(data[start:])
+            columns[f"{name}.offsets"] = np.concatenate([[0], np.cumsum(lengths[keep])]).astype(np.int64)
+            columns[f"{name}.data"] = np.concatenate(pieces)
+        return type(self)(columns)
+
+    @classmethod
+    def load(cls, path: str) -> "MetadataTable":
+        with np.load(path, allow_pickle=False) as archive:
+            return cls({name: archive[name] for name in archive.files})
+
+    def save(self, path: str):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **self.columns)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def text(self, name: str, index: int) -> Optional[str]:
+        offsets = self.columns[f"{name}.offsets"]
+        value = self.columns[f"{name}.data"][offsets[index]:offsets[index + 1]].tobytes().decode()
+        return value or None
+
+    def category(self, name: str, index: int) -> Optional[str]:
+        code = self.columns[f"{name}.codes"][index]
+        return str(self.columns[f"{name}.vocab"][code]) if code >= 0 else None
+
+    def record(self, index: int) -> dict:
+        record = {}
+        for name in FLOAT_COLUMNS:
+            value = self.columns[name][index]
+            record[name] = None if np.isnan(value) else float(value)
+        for name in INT_COLUMNS:
+            record[name] = int(self.columns[name][index])
+        for name in CATEGORY_COLUMNS:
+            record[name] = self.category(name, index)
+        for name in TEXT_COLUMNS:
+            record[name] = self.text(name, index)
+        return record
+
+    def paths(self) -> List[str]:
+        offsets = self.columns["path.offsets"]
+        data = self.columns["path.data"].tobytes()
+        return [data[offsets[i]:offsets[i + 1]].decode() for i in range(self.size)]
+
+    def category_mask(self, name: str, text: str) -> "np.ndarray":
+        """Rows whose category contains the text, case-insensitively."""
+        wanted = [code for code, value in enumerate(self.columns[f"{name}.vocab"]) if text.lower() in value.lower()]
+        return np.isin(self.columns[f"{name}.codes"], wanted)
+
+    def query(self, folder: Optional[str] = None, camera: Optional[str] = None, lens: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None, gps: bool = False,
+              min_rating: Optional[float] = None, sort: str = "taken", descending: bool = False) -> "np.ndarray":
+        """Row indices matching every filter, sorted (rows without the sort key last)."""
+        mask = np.ones(self.size, dtype=bool)
+        if folder is not None:
+            prefix = folder.strip("/") + "/"
+            paths = self.paths()
+            mask &= np.array([path.startswith(prefix) for path in paths], dtype=bool)
+        if camera:
+            mask &= self.category_mask("camera", camera)
+        if lens:
+            mask &= self.category_mask("lens", lens)
+        taken = self.columns["taken"]
+        if since is not None:
+            mask &= taken >= since
+        if until is not None:
+            mask &= taken < until
+        if gps:
+            mask &= ~np.isnan(self.columns["latitude"])
+        if min_rating is not None:
+            mask &= self.columns["rating"] >= min_rating
+        rows = np.flatnonzero(mask)
+
+        if sort in FLOAT_COLUMNS:
+            keys = self.columns[sort][rows]
+            keys = np.where(np.isnan(keys), np.inf if not descending else -np.inf, keys)
+        elif sort in CATEGORY_COLUMNS:
+            codes = self.columns[f"{sort}.codes"][rows]
+            keys = np.where(codes < 0, np.iinfo(np.int32).max if not descending else -1, codes)
+        elif sort in ("path", "name"):
+            paths = self.paths()
+            order = sorted(range(len(rows)), key=lambda i: paths[rows[i]].lower(), reverse=descending)
+            return rows[order]
+        else:
+            keys = self.columns[sort][rows]
+        order = np.argsort(keys, kind="stable")
+        return rows[order[::-1]] if descending else rows[order]
+
+
+class MetadataCache:
+    """The table of one portfolio root, updated incrementally by (size, mtime).
+
+    New and changed records wait in self.changed (deleted keys in
+    self.removed) and are merged into the column arrays on save; a save
+    with nothing pending doesn't rewrite the file.
+    """
+
+    def __init__(self, root: str, workers: int = WORKERS):
+        if np is None:
+            raise RuntimeError("NumPy is required for the metadata cache: pip3 install numpy")
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, CACHE_NAME)
+        self.workers = max(1, workers)
+        self.lock = threading.Lock()
+        self.table = None
+        if os.path.exists(self.path):
+            try:
+                self.table = MetadataTable.load(self.path)
+            except Exception as e:
+                logger.warning(f"⚠️  Rebuilding the metadata cache, can't read it: {e}")
+        self.dirty = self.table is None
+        if self.table is None:
+            self.table = MetadataTable.from_records([])
+        self.index: Dict[str, int] = {key: row for row, key in enumerate(self.table.paths())}
+        self.changed: Dict[str, dict] = {}
+        self.removed: set = set()
+
+    def keys(self) -> List[str]:
+        with self.lock:
+            return [key for key in self.index if key not in self.removed] + \
+                   [key for key in self.changed if key not in self.index]
+
+    def signature(self, key: str) -> Optional[tuple]:
+        """(size, mtime_ns) on record for a key, or None."""
+        record = self.changed.get(key)
+        if record is not None:
+            return record["size"], record["mtime_ns"]
+        row = self.index.get(key)
+        if row is None or key in self.removed:
+            return None
+        return int(self.table.columns["size"][row]), int(self.table.columns["mtime_ns"][row])
+
+    def update(self, paths: Iterable[str]) -> tuple:
+        """Read new or changed files; returns (read, unchanged)."""
+        items = []
+        unchanged = 0
+        for path in paths:
+            key = relative_key(self.root, path)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if self.signature(key) == (stat.st_size, stat.st_mtime_ns):
+                unchanged += 1
+            else:
+                items.append((path, key))
+        batches = [items[start:start + BATCH_SIZE] for start in range(0, len(items), BATCH_SIZE)]
+        read = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for records in pool.map(_read_batch, batches):
+                with self.lock:
+                    for record in records:
+                        self.changed[record["path"]] = record
+                        self.removed.discard(record["path"])
+                read += len(records)
+        return read, unchanged
+
+    def forget(self, keys: Iterable[str]):
+        with self.lock:
+            for key in keys:
+                self.changed.pop(key, None)
+                if key in self.index:
+                    self.removed.add(key)
+
+    def save(self) -> MetadataTable:
+        """Merge pending rows into the table and write it, if anything changed."""
+        with self.lock:
+            if not (self.changed or self.removed or self.dirty):
+                return self.table
+            changed = {self.index[key]: record for key, record in self.changed.items() if key in self.index}
+            added = [record for key, record in self.changed.items() if key not in self.index]
+            removed = [self.index[key] for key in self.removed]
+            self.table = self.table.merge(changed, added, removed)
+            if removed:
+                self.index = {key: row for row, key in enumerate(self.table.paths())}
+            else:
+                for record in added:
+                    self.index[record["path"]] = len(self.index)
+            self.changed.clear()
+            self.removed.clear()
+            self.dirty = False
+            table = self.table
+        table.save(self.path)
+        return table
+
+
+class MetadataStage:
+    """watch-folders.py stage that reads the metadata of each new JPEG/TIFF."""
+
+    name = "metadata"
+
+    def __init__(self, workers: int = STAGE_WORKERS):
+        self.workers = workers
+        self.cache: Optional[MetadataCache] = None
+
+    def process(self, batch):
+        if self.cache is None:
+            self.cache = MetadataCache(batch.root, self.workers)
+        files = [path for path in batch.files if os.path.splitext(path)[1].lower() in METADATA_EXTENSIONS]
+        deleted = [relative_key(batch.root, path) for path in batch.deleted]
+        if not files and not deleted:
+            return
+        started = time.monotonic()
+        read, unchanged = self.cache.update(files)
+        self.cache.forget(deleted)
+        self.cache.save()
+        logger.info(f"📷 Metadata: {read} read, {unchanged} unchanged, {len(deleted)} removed "
+                    f"in {time.monotonic() - started:.2f}s")
+
+
+def parse_date(text: str) -> float:
+    """ISO date/time as the wall-clock seconds used by the taken column."""
+    return (datetime.fromisoformat(text).replace(tzinfo=None) - EPOCH).total_seconds()
+
+
+def format_taken(seconds: Optional[float]) -> Optional[str]:
+    return (EPOCH + timedelta(seconds=seconds)).isoformat() if seconds is not None else None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Read and query portfolio image metadata")
+    parser.add_argument("root", help="portfolio images folder")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--json", action="store_true", help="print results as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="read metadata for the whole tree (only new or changed files)")
+    query_parser = commands.add_parser("query", parents=[output], help="filter and sort images by metadata")
+    query_parser.add_argument("--folder")
+    query_parser.add_argument("--camera", help="camera name contains this")
+    query_parser.add_argument("--lens", help="lens name contains this")
+    query_parser.add_argument("--since", type=parse_date, help="taken on or after (ISO date)")
+    query_parser.add_argument("--until", type=parse_date, help="taken before (ISO date)")
+    query_parser.add_argument("--gps", action="store_true", help="only images with a location")
+    query_parser.add_argument("--min-rating", type=float)
+    query_parser.add_argument("--sort", default="taken",
+                              choices=("taken", "name", "camera", "lens", "rating", "size", "iso", "focal_length"))
+    query_parser.add_argument("--desc", action="store_true", help="sort descending")
+    query_parser.add_argument("--limit", type=int)
+    commands.add_parser("cameras", parents=[output], help="images per camera and lens")
+    args = parser.parse_args()
+    as_json = getattr(args, "json", False)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not os.path.isdir(args.root):
+        print(f"❌ Not a directory: {args.root}")
+        return 1
+    if np is None:
+        print("The metadata cache needs NumPy: pip3 install numpy")
+        return 1
+
+    cache_path = os.path.join(args.root, CACHE_NAME)
+    if args.command == "build":
+        started = time.monotonic()
+        cache = MetadataCache(args.root, args.workers)
+        paths = [path for path in portfolio_catalog.walk_images(cache.root)
+                 if os.path.splitext(path)[1].lower() in METADATA_EXTENSIONS]
+        present = {relative_key(cache.root, path) for path in paths}
+        gone = [key for key in cache.keys() if key not in present]
+        read, unchanged = cache.update(paths)
+        cache.forget(gone)
+        table = cache.save()
+        dated = int(np.count_nonzero(~np.isnan(table.columns["taken"])))
+        print(f"✅ {len(table)} images ({dated} dated): {read} read, {unchanged} unchanged, "
+              f"{len(gone)} removed in {time.monotonic() - started:.1f}s")
+        return 0
+
+    if not os.path.exists(cache_path):
+        print(f"❌ No metadata cache yet, run: {sys.argv[0]} {args.root} build")
+        return 1
+    table = MetadataTable.load(cache_path)
+
+    if args.command == "cameras":
+        result = {}
+        for name in CATEGORY_COLUMNS:
+            codes = table.columns[f"{name}.codes"]
+            counts = np.bincount(codes[codes >= 0], minlength=len(table.columns[f"{name}.vocab"]))
+            result[name] = {str(value): int(count) for value, count in
+                            sorted(zip(table.columns[f"{name}.vocab"], counts), key=lambda item: -item[1])}
+            result[name]["(unknown)"] = int(np.count_nonzero(codes < 0))
+        if as_json:
+            print(json.dumps(result, indent=2))
+        else:
+            for name, counts in result.items():
+                print(f"{name.title()}:")
+                for value, count in counts.items():
+                    print(f"  {count:7d}  {value}")
+        return 0
+
+    rows = table.query(args.folder, args.camera, args.lens, args.since, args.until, args.gps,
+                       args.min_rating, args.sort, args.desc)
+    if args.limit:
+        rows = rows[:args.limit]
+    records = [table.record(int(row)) for row in rows]
+    for record in records:
+        record["taken"] = format_taken(record["taken"])
+    if as_json:
+        print(json.dumps(records, indent=2))
+    else:
+        for record in records:
+            print(f"{record['taken'] or '-':19}  {record['camera'] or '-':24}  {record['path']}")
+        print(f"🔎 {len(records)} image(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
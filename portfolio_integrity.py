@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Image integrity scanner for the photo portfolio
+Checks every image in-process instead of running file/sips/identify per
+file: magic bytes, JPEG SOI/EOI markers and segment structure, PNG chunk
+CRCs, GIF/WebP/TIFF/BMP/HEIF framing, and optionally a full decode.
+Results are cached by (size, mtime, hash), so unchanged files are never
+checked twice. Runs as a watch-folders.py stage or on its own:
+
+    python3 portfolio_integrity.py /mnt/Plex/photo-portfolio/images --report integrity.json
+    python3 portfolio_integrity.py /mnt/Plex/photo-portfolio/images --decode
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import portfolio_catalog
+from portfolio_catalog import file_hash, relative_key
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ==================== CONFIGURATION ====================
+CACHE_DB_NAME = ".integrity-cache.db"   # Kept in the portfolio root
+WORKERS = os.cpu_count() or 4
+STAGE_WORKERS = 2                       # Worker processes when run by watch-folders.py
+CHUNK_SIZE = 32                         # Files per worker task
+JPEG_TAIL_BYTES = 64 * 1024             # EOI is looked for here before scanning the whole file
+# =======================================================
+
+# Check levels; a cached result counts when its level is at least the one requested
+LEVEL_STRUCTURE = 1
+LEVEL_DECODE = 2
+
+# Magic bytes -> format
+SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+    (b"BM", "BMP"),
+)
+HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"mif1", b"msf1", b"avif", b"avis"}
+EXTENSION_FORMATS = {
+    ".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".gif": "GIF", ".tif": "TIFF", ".tiff": "TIFF",
+    ".bmp": "BMP", ".webp": "WEBP", ".heic": "HEIF", ".avif": "HEIF",
+}
+
+logger = logging.getLogger("portfolio_integrity")
+
+
+class IntegrityError(Exception):
+    """The file is damaged or not the image it claims to be."""
+
+
+def detect_format(head: bytes) -> Optional[str]:
+    for signature, fmt in SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[4:8] == b"ftyp" and head[8:12] in HEIF_BRANDS:
+        return "HEIF"
+    return None
+
+
+def check_jpeg(f, size: int):
+    """SOI, well-formed segments up to the first scan, and an EOI after it."""
+    f.seek(2)
+    seen_frame = False
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2:
+            raise IntegrityError("truncated before the image data")
+        if marker[0] != 0xFF:
+            raise IntegrityError(f"bad marker at offset {f.tell() - 2}")
+        code = marker[1]
+        if code == 0xFF:
+            # Fill byte
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if code in (0x01,) or 0xD0 <= code <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            raise IntegrityError("truncated segment header")
+        length = struct.unpack(">H", length_bytes)[0]
+        if length < 2 or f.tell() + length - 2 > size:
+            raise IntegrityError(f"segment 0x{code:02X} runs past the end of the file")
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            seen_frame = True
+        if code == 0xDA:
+            if not seen_frame:
+                raise IntegrityError("scan data without a frame header")
+            scan_start = f.tell() + length - 2
+            break
+        f.seek(length - 2, os.SEEK_CUR)
+
+    # Entropy-coded data can't contain FF D9, so an EOI after the scan start
+    # means the file was written completely. Look at the tail first.
+    tail_start = max(scan_start, size - JPEG_TAIL_BYTES)
+    f.seek(tail_start)
+    if b"\xff\xd9" in f.read():
+        return
+    # Trailing data (e.g. an embedded video) pushed EOI further up
+    f.seek(scan_start)
+    previous = b""
+    while tail_start > f.tell():
+        chunk = f.read(min(1024 * 1024, tail_start - f.tell()))
+        if not chunk:
+            break
+        if b"\xff\xd9" in previous[-1:] + chunk:
+            return
+        previous = chunk
+    raise IntegrityError("missing EOI marker (truncated)")
+
+
+def check_png(f, size: int):
+    """Every chunk's CRC, starting with IHDR and ending with IEND."""
+    f.seek(8)
+    first = True
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            raise IntegrityError("truncated before IEND")
+        length, chunk_type = struct.unpack(">I4s", header)
+        if f.tell() + length + 4 > size:
+            raise IntegrityError(f"{chunk_type!r} chunk runs past the end of the file")
+        if first and chunk_type != b"IHDR":
+            raise IntegrityError("first chunk is not IHDR")
+        first = False
+        crc = zlib.crc32(chunk_type)
+        remaining = length
+        while remaining:
+            data = f.read(min(remaining, 1024 * 1024))
+            crc = zlib.crc32(data, crc)
+            remaining -= len(data)
+        if struct.unpack(">I", f.read(4))[0] != crc & 0xFFFFFFFF:
+            raise IntegrityError(f"CRC mismatch in {chunk_type.decode('latin-1')} chunk")
+        if chunk_type == b"IEND":
+            return
+
+
+def check_gif(f, size: int):
+    f.seek(max(0, size - 16))
+    if not f.read().rstrip(b"\x00").endswith(b"\x3b"):
+        raise IntegrityError("missing GIF trailer (truncated)")
+
+
+def check_webp(f, size: int):
+    f.seek(4)
+    riff_size = struct.unpack("<I", f.read(4))[0]
+    if riff_size + 8 > size:
+        raise IntegrityError(f"RIFF size {riff_size + 8} exceeds file size {size} (truncated)")
+
+
+def check_tiff(f, size: int):
+    f.seek(0)
+    byte_order = "<" if f.read(2) == b"II" else ">"
+    f.seek(4)
+    offset = struct.unpack(f"{byte_order}I", f.read(4))[0]
+    if not 8 <= offset < size:
+        raise IntegrityError("first IFD offset is outside the file")
+
+
+def check_bmp(f, size: int):
+    f.seek(2)
+    declared = struct.unpack("<I", f.read(4))[0]
+    if declared > size:
+        raise IntegrityError(f"header size {declared} exceeds file size {size} (truncated)")
+
+
+def check_heif(f, size: int):
+    """Top-level ISO BMFF boxes must tile the file exactly."""
+    offset = 0
+    while offset < size:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            raise IntegrityError("truncated box header")
+        box_size = struct.unpack(">I", header[:4])[0]
+        if box_size == 1:
+            box_size = struct.unpack(">Q", f.read(8))[0]
+        elif box_size == 0:
+            return
+        if box_size < 8 or offset + box_size > size:
+            raise IntegrityError(f"{header[4:8]!r} box runs past the end of the file (truncated)")
+        offset += box_size
+
+
+STRUCTURE_CHECKS = {
+    "JPEG": check_jpeg, "PNG": check_png, "GIF": check_gif, "WEBP": check_webp,
+    "TIFF": check_tiff, "BMP": check_bmp, "HEIF": check_heif,
+}
+
+
+def check_file(path: str, level: int = LEVEL_STRUCTURE) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Check one file; returns (format, error, warning). Runs in a worker process."""
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return None, "empty file", None
+        with open(path, "rb") as f:
+            fmt = detect_format(f.read(16))
+            if fmt is None:
+                return None, "not a recognised image format", None
+            STRUCTURE_CHECKS[fmt](f, size)
+
+        warning = None
+        expected = EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower())
+        if expected is not None and expected != fmt:
+            warning = f"{fmt} data with a {os.path.splitext(path)[1]} extension"
+
+        if level >= LEVEL_DECODE and Image is not None and fmt != "HEIF":
+            with Image.open(path) as image:
+                image.load()
+        return fmt, None, warning
+    except IntegrityError as e:
+        return fmt, str(e), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", None
+
+
+def _check_job(item: Tuple[str, int]) -> Tuple[str, Optional[str], Optional[str], Optional[str]]:
+    path, level = item
+    return (path, *check_file(path, level))
+
+
+class IntegrityCache:
+    """Check results keyed by path, valid while (size, mtime) or the content hash match."""
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT, level INTEGER, "
+            "format TEXT, error TEXT, warning TEXT, checked REAL)"
+        )
+        self.db.commit()
+
+    def load(self) -> Dict[str, tuple]:
+        rows = self.db.execute(
+            "SELECT path, size, mtime_ns, hash, level, format, error, warning FROM results"
+        )
+        return {row[0]: row[1:] for row in rows}
+
+    def store(self, rows):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO results "
+            "(path, size, mtime_ns, hash, level, format, error, warning, checked) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        self.db.commit()
+
+    def forget(self, keys):
+        self.db.executemany("DELETE FROM results WHERE path = ?", [(key,) for key in keys])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class IntegrityScanner:
+    """Check many files in a process pool, skipping the ones the cache vouches for."""
+
+    def __init__(self, root: str, workers: int = WORKERS, level: int = LEVEL_STRUCTURE,
+                 catalog: Optional[portfolio_catalog.ImageCatalog] = None):
+        self.root = os.path.abspath(root)
+        self.workers = max(1, workers)
+        self.level = level
+        self.catalog = catalog
+        self.cache = IntegrityCache(os.path.join(self.root, CACHE_DB_NAME))
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    def _cached(self, key: str, path: str, entry: Optional[tuple], catalog_row: Optional[dict]):
+        """Return (size, mtime_ns, hash, cache hit) for a file."""
+        stat = os.stat(path)
+        content_hash = None
+        if catalog_row is not None and (catalog_row["size"], catalog_row["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            content_hash = catalog_row["hash"]
+        if entry is None or entry[3] < self.level:
+            return stat.st_size, stat.st_mtime_ns, content_hash, False
+        if (entry[0], entry[1]) == (stat.st_size, stat.st_mtime_ns):
+            return stat.st_size, stat.st_mtime_ns, content_hash or entry[2], True
+        if entry[0] == stat.st_size and entry[2] is not None:
+            # Same size, new mtime: the content hash decides
+            content_hash = content_hash or file_hash(path)
+            return stat.st_size, stat.st_mtime_ns, content_hash, content_hash == entry[2]
+        return stat.st_size, stat.st_mtime_ns, content_hash, False
+
+    def scan(self, paths: List[str]) -> dict:
+        """Check the files and return a machine-readable report."""
+        started = time.monotonic()
+        cache = self.cache.load()
+        keys = {path: relative_key(self.root, path) for path in paths}
+        catalog_rows = self.catalog.get_many(list(keys.values())) if self.catalog is not None else {}
+
+        results: Dict[str, tuple] = {}
+        signatures = {}
+        to_check = []
+        for path, key in keys.items():
+            try:
+                size, mtime_ns, content_hash, hit = self._cached(key, path, cache.get(key), catalog_rows.get(key))
+            except FileNotFoundError:
+                continue
+            signatures[path] = (size, mtime_ns, content_hash)
+            if hit:
+                entry = cache[key]
+                results[path] = (entry[4], entry[5], entry[6])
+            else:
+                to_check.append(path)
+
+        if to_check:
+            if self.pool is None:
+                # spawn: the watcher runs observer threads, which fork() doesn't mix with
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            rows = []
+            now = time.time()
+            items = [(path, self.level) for path in to_check]
+            for path, fmt, error, warning in self.pool.map(_check_job, items, chunksize=CHUNK_SIZE):
+                results[path] = (fmt, error, warning)
+                size, mtime_ns, content_hash = signatures[path]
+                rows.append((keys[path], size, mtime_ns, content_hash, self.level, fmt, error, warning, now))
+            self.cache.store(rows)
+
+        failures = []
+        warnings = []
+        for path, (fmt, error, warning) in sorted(results.items()):
+            if error:
+                failures.append({"path": keys[path], "format": fmt, "error": error})
+            if warning:
+                warnings.append({"path": keys[path], "warning": warning})
+        if self.catalog is not None:
+            # Also fills in rows the catalog re-created after a cached check
+            updates = []
+            for path, (fmt, error, warning) in results.items():
+                status = portfolio_catalog.STATUS_CORRUPT if error else portfolio_catalog.STATUS_VALID
+                row = catalog_rows.get(keys[path])
+                if row is not None and (row["status"], row["error"]) != (status, error):
+                    updates.append((keys[path], status, error))
+            self.catalog.set_statuses(updates)
+
+        return {
+            "root": self.root,
+            "generated": datetime.now().isoformat(),
+            "level": "decode" if self.level >= LEVEL_DECODE else "structure",
+            "files": len(results),
+            "checked": len(to_check),
+            "cached": len(results) - len(to_check),
+            "valid": len(results) - len(failures),
+            "corrupt": len(failures),
+            "duration_s": round(time.monotonic() - started, 2),
+            "failures": failures,
+            "warnings": warnings,
+        }
+
+    def forget(self, paths: List[str]):
+        self.cache.forget(relative_key(self.root, path) for path in paths)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.cache.close()
+
+
+class IntegrityStage:
+    """watch-folders.py stage that checks each new file and records the result in the catalog."""
+
+    name = "integrity"
+
+    def __init__(self, workers: int = STAGE_WORKERS, level: int = LEVEL_STRUCTURE, catalog_stage=None):
+        self.workers = workers
+        self.level = level
+        self.catalog_stage = catalog_stage
+        self.scanner: Optional[IntegrityScanner] = None
+
+    def process(self, batch):
+        if self.scanner is None:
+            catalog = self.catalog_stage.catalog if self.catalog_stage is not None else None
+            self.scanner = IntegrityScanner(batch.root, self.workers, self.level, catalog)
+        elif self.catalog_stage is not None:
+            self.scanner.catalog = self.catalog_stage.catalog
+        files = [path for path in batch.files if os.path.splitext(path)[1].lower() in EXTENSION_FORMATS]
+        report = self.scanner.scan(files)
+        self.scanner.forget(batch.deleted)
+        for failure in report["failures"]:
+            logger.error(f"❌ Corrupt image {failure['path']}: {failure['error']}")
+        if files:
+            logger.info(f"🔎 Integrity: {report['valid']} valid, {report['corrupt']} corrupt "
+                        f"({report['checked']} checked) in {report['duration_s']}s")
+
+    def close(self):
+        if self.scanner is not None:
+            self.scanner.close()
+            self.scanner = None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check portfolio images for corruption")
+    parser.add_argument("root", help="portfolio images folder")
+    parser.add_argument("--decode", action="store_true", help="also fully decode every image (slower)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"worker processes (default {WORKERS})")
+    parser.add_argument("--report", help="write the JSON report to this file")
+    parser.add_argument("--no-catalog", dest="catalog", action="store_false",
+                        help="don't read hashes from or write statuses to the catalog")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not os.path.isdir(args.root):
+        print(f"❌ Not a directory: {args.root}")
+        return 1
+    if args.decode and Image is None:
+        print("Full decode needs Pillow: pip3 install Pillow")
+        return 1
+
+    catalog_path = os.path.join(args.root, portfolio_catalog.CATALOG_DB_NAME)
+    catalog = portfolio_catalog.ImageCatalog(args.root) if args.catalog and os.path.exists(catalog_path) else None
+    scanner = IntegrityScanner(
+        args.root, args.workers, LEVEL_DECODE if args.decode else LEVEL_STRUCTURE, catalog
+    )
+    try:
+        paths = [
+            path for path in portfolio_catalog.walk_images(scanner.root)
+            if os.path.splitext(path)[1].lower() in EXTENSION_FORMATS
+        ]
+        report = scanner.scan(paths)
+    finally:
+        scanner.close()
+        if catalog is not None:
+            catalog.close()
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"🔎 {report['files']} image(s): {report['valid']} valid, {report['corrupt']} corrupt, "
+          f"{len(report['warnings'])} warning(s); {report['checked']} checked, "
+          f"{report['cached']} cached, in {report['duration_s']}s")
+    for failure in report["failures"]:
+        print(f"❌ {failure['path']}: {failure['error']}")
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Ingest journal for watch-folders.py
+Watchdog only reports live events, so files added or removed while the
+watcher was down (a restart, a reboot) used to go unnoticed. The watcher
+records every file its stages finished, with its (size, mtime), in
+.watch-journal.db in the portfolio root; on startup one os.scandir walk
+compared with the journal finds just the files that are new, changed or
+gone, and those are queued like live events.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import portfolio_catalog
+
+# ==================== CONFIGURATION ====================
+JOURNAL_NAME = ".watch-journal.db"  # Kept in the portfolio root
+# =======================================================
+
+logger = logging.getLogger("portfolio_journal")
+
+
+class IngestJournal:
+    """(size, mtime_ns) of every file the pipeline has processed, by relative path."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, JOURNAL_NAME)
+        self.lock = threading.Lock()
+        self.new = not os.path.exists(self.path)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, processed REAL)"
+        )
+        self.db.commit()
+
+    def key(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def path_of(self, key: str) -> str:
+        return os.path.join(self.root, key.replace("/", os.sep))
+
+    def entries(self) -> Dict[str, Tuple[int, int]]:
+        with self.lock:
+            return {path: (size, mtime_ns) for path, size, mtime_ns in
+                    self.db.execute("SELECT path, size, mtime_ns FROM processed")}
+
+    def under(self, directory: str) -> List[str]:
+        """Processed files below a directory, e.g. one that was deleted or moved away."""
+        prefix = self.key(directory).rstrip("/") + "/"
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT path FROM processed WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+            ).fetchall()
+        return [self.path_of(key) for (key,) in rows]
+
+    def record(self, files: Iterable[str], deleted: Iterable[str] = ()):
+        """Mark files as processed at their current signature and forget deleted ones."""
+        now = time.time()
+        rows = []
+        for path in files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            rows.append((self.key(path), stat.st_size, stat.st_mtime_ns, now))
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO processed (path, size, mtime_ns, processed) VALUES (?, ?, ?, ?)", rows
+            )
+            self.db.executemany("DELETE FROM processed WHERE path = ?", [(self.key(p),) for p in deleted])
+            self.db.commit()
+
+    def scan(self, ignore_dirs: Iterable[str], accept: Callable[[str], bool]) -> Dict[str, Tuple[int, int]]:
+        """Signature of every accepted file in the tree, walked like the catalog walks it."""
+        found = {}
+        for path in portfolio_catalog.walk_images(self.root, set(ignore_dirs), accept):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found[self.key(path)] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def reconcile(self, ignore_dirs: Iterable[str], accept: Callable[[str], bool]) -> Tuple[List[str], List[str], int]:
+        """(new or changed paths, deleted paths, files seeded) since the last run.
+
+        A journal created by this run is filled from the tree as it is,
+        instead of reprocessing the whole library.
+        """
+        found = self.scan(ignore_dirs, accept)
+        if self.new:
+            self.new = False
+            now = time.time()
+            with self.lock:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO processed (path, size, mtime_ns, processed) VALUES (?, ?, ?, ?)",
+                    [(key, size, mtime_ns, now) for key, (size, mtime_ns) in found.items()]
+                )
+                self.db.commit()
+            return [], [], len(found)
+        known = self.entries()
+        changed = [self.path_of(key) for key, signature in found.items() if known.get(key) != signature]
+        deleted = [self.path_of(key) for key in known if key not in found]
+        return sorted(changed), sorted(deleted), 0
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class JournalStage:
+    """Last watch-folders.py stage: records the files every stage before it handled."""
+
+    name = "journal"
+
+    def __init__(self, journal: IngestJournal):
+        self.journal = journal
+
+    def process(self, batch):
+        self.journal.record([path for path in batch.files if path not in batch.failed], batch.deleted)
+
+    def close(self):
+        self.journal.close()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Gallery manifests for the photo portfolio
+One precomputed JSON file per category (every image with its dimensions,
+a tiny placeholder, variant URLs and sort keys), plus an index of the
+categories, written next to the variants with gzip (and brotli when
+installed) copies. The front end fetches one small static file per
+category instead of the server walking folders on every request.
+
+watch-folders.py rewrites only the categories a batch touched; a file is
+replaced atomically and only when its contents change, so unchanged
+categories keep their ETag. Run on its own to (re)build everything:
+
+    python3 portfolio_manifest.py /mnt/Plex/photo-portfolio/images
+    python3 portfolio_manifest.py /mnt/Plex/photo-portfolio/images --folder doors_and_windows
+"""
+
+import argparse
+import base64
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import quote
+
+import portfolio_catalog
+from portfolio_thumbnails import OPTIMIZED_DIR_NAME, VARIANT_FORMATS, VARIANT_SIZES
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ==================== CONFIGURATION ====================
+MANIFEST_DIR_NAME = "manifests"             # <root>/optimized/manifests/<category id>.json
+INDEX_NAME = "index"                        # <root>/optimized/manifests/index.json
+ORIGINALS_URL = "/images/portfolio"         # Where the web server serves the images folder
+OPTIMIZED_URL = "/images/optimized"         # ... and the optimized folder
+WEB_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif"}   # Browsers can show these
+PLACEHOLDER_SIZE = 16                       # Longest edge of the inline placeholder
+PLACEHOLDER_QUALITY = 40
+WORKERS = 2                                 # Threads decoding new images for placeholders
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# =======================================================
+
+EXIF_ORIENTATION = 0x0112
+
+logger = logging.getLogger("portfolio_manifest")
+
+
+def category_id(folder: str) -> str:
+    """Same id configGenerator.js gives a folder."""
+    return re.sub(r"[^a-z0-9]+", "-", folder.lower())
+
+
+def format_title(name: str) -> str:
+    """doors_and_windows -> Doors And Windows, as configGenerator.js does."""
+    return " ".join(word[:1].upper() + word[1:] for word in name.split("_"))
+
+
+def url(prefix: str, *parts: str) -> str:
+    return "/".join([prefix, *(quote(part) for part in "/".join(parts).split("/"))])
+
+
+def placeholder(path: str) -> Tuple[int, int, str, str]:
+    """(width, height as displayed, placeholder data URI, average colour) of an image.
+
+    Only the header and a draft-mode (1/8 scale) decode are needed.
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+            width, height = height, width
+        image.draft("RGB", (PLACEHOLDER_SIZE * 8, PLACEHOLDER_SIZE * 8))
+        small = ImageOps.exif_transpose(image).convert("RGB")
+        small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.LANCZOS)
+    color = "#{:02x}{:02x}{:02x}".format(*small.resize((1, 1), Image.BOX).getpixel((0, 0)))
+    buffer = io.BytesIO()
+    small.save(buffer, "WEBP", quality=PLACEHOLDER_QUALITY)
+    return width, height, "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode(), color
+
+
+def _write_if_changed(path: str, data: bytes) -> bool:
+    """Atomically replace a file unless it already holds exactly this data."""
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def publish(base_path: str, document) -> bool:
+    """Write <base>.json with .json.gz (and .json.br) copies; True if it changed."""
+    data = json.dumps(document, separators=(",", ":"), ensure_ascii=False).encode()
+    if not _write_if_changed(f"{base_path}.json", data):
+        return False
+    # mtime=0 keeps the gzip bytes identical for identical JSON
+    _write_if_changed(f"{base_path}.json.gz", gzip.compress(data, GZIP_LEVEL, mtime=0))
+    if brotli is not None:
+        _write_if_changed(f"{base_path}.json.br", brotli.compress(data, quality=BROTLI_QUALITY))
+    return True
+
+
+def unpublish(base_path: str) -> bool:
+    removed = False
+    for suffix in (".json", ".json.gz", ".json.br"):
+        try:
+            os.remove(base_path + suffix)
+            removed = True
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+class GalleryManifests:
+    """Per-category manifests built from the catalog."""
+
+    def __init__(self, root: str, catalog: portfolio_catalog.ImageCatalog, workers: int = WORKERS):
+        if Image is None:
+            raise RuntimeError("Pillow is required for gallery manifests: pip3 install Pillow")
+        self.root = os.path.abspath(root)
+        self.catalog = catalog
+        self.workers = max(1, workers)
+        self.optimized_dir = os.path.join(self.root, OPTIMIZED_DIR_NAME)
+        self.manifest_dir = os.path.join(self.optimized_dir, MANIFEST_DIR_NAME)
+        self.lock = threading.Lock()
+        self.published: Optional[Dict[str, Tuple[int, Optional[str]]]] = None   # folder -> (count, cover)
+
+    def _load_published(self) -> Dict[str, Tuple[int, Optional[str]]]:
+        """Count and cover of every category manifest on disk, read once."""
+        published = {}
+        if os.path.isdir(self.manifest_dir):
+            for name in os.listdir(self.manifest_dir):
+                if not name.endswith(".json") or name == INDEX_NAME + ".json":
+                    continue
+                try:
+                    with open(os.path.join(self.manifest_dir, name)) as f:
+                        document = json.load(f)
+                    published[document["folder"]] = (document["count"], document["cover"])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return published
+
+    def _previous(self, folder: str) -> Dict[str, dict]:
+        """Entries of the category's current manifest, by path."""
+        try:
+            with open(os.path.join(self.manifest_dir, category_id(folder) + ".json")) as f:
+                return {entry["path"]: entry for entry in json.load(f)["images"]}
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _variants(self, key: str, width: int, height: int) -> dict:
+        """URLs and sizes of the variants that exist for one image."""
+        stem = os.path.splitext(key)[0]
+        variants = {}
+        for size, edge in VARIANT_SIZES.items():
+            if not os.path.exists(os.path.join(self.optimized_dir, size, key)):
+                continue
+            scale = min(1.0, edge / max(width, height, 1))
+            variant = {
+                "width": max(1, round(width * scale)),
+                "height": max(1, round(height * scale)),
+                "src": url(OPTIMIZED_URL, size, key),
+            }
+            for fmt in VARIANT_FORMATS:
+                if os.path.exists(os.path.join(self.optimized_dir, size, f"{stem}.{fmt}")):
+                    variant[fmt] = url(OPTIMIZED_URL, size, f"{stem}.{fmt}")
+            variants[size] = variant
+        full_path = os.path.join(self.optimized_dir, "full", key)
+        if os.path.exists(full_path):
+            # portfolio_optimize.py may have scaled it down (headers only, no decode)
+            try:
+                with Image.open(full_path) as image:
+                    if max(image.size) < max(width, height):
+                        width, height = image.size
+            except OSError:
+                pass
+            variants["full"] = {"width": width, "height": height, "src": url(OPTIMIZED_URL, "full", key)}
+            if os.path.exists(os.path.join(self.optimized_dir, "full", f"{stem}.webp")):
+                variants["full"]["webp"] = url(OPTIMIZED_URL, "full", f"{stem}.webp")
+        return variants
+
+    def _entry(self, row: dict, previous: Optional[dict]) -> Optional[dict]:
+        key = row["path"]
+        if previous is not None and previous.get("hash") == row["hash"]:
+            width, height = previous["width"], previous["height"]
+            preview, color = previous["placeholder"], previous["color"]
+        else:
+            try:
+                width, height, preview, color = placeholder(os.path.join(self.root, key))
+            except Exception as e:
+                logger.warning(f"⚠️  Leaving {key} out of the gallery: {type(e).__name__}: {e}")
+                return None
+        return {
+            "path": key,
+            "name": row["name"],
+            "src": f"{ORIGINALS_URL}/{key}",    # Unencoded, as /api/images returns it
+            "width": width,
+            "height": height,
+            "placeholder": preview,
+            "color": color,
+            "variants": self._variants(key, width, height),
+            "sort": {
+                "name": row["name"].lower(),
+                "taken": row["taken"],
+                "modified": row["mtime_ns"] // 1_000_000_000,
+                "size": row["size"],
+            },
+            "hash": row["hash"],
+        }
+
+    def update_folders(self, folders: Iterable[str]) -> Tuple[int, int, int]:
+        """Rebuild the given categories; returns (written, unchanged, removed)."""
+        written = unchanged = removed = 0
+        with self.lock, ThreadPoolExecutor(max_workers=self.workers) as pool:
+            os.makedirs(self.manifest_dir, exist_ok=True)
+            if self.published is None:
+                self.published = self._load_published()
+            for folder in sorted(set(folders) - {""}):    # Loose files in the root aren't a category
+                base_path = os.path.join(self.manifest_dir, category_id(folder))
+                rows = [
+                    row for row in self.catalog.images(folder)
+                    if os.path.splitext(row["name"])[1].lower() in WEB_EXTENSIONS
+                    and row["status"] != portfolio_catalog.STATUS_CORRUPT
+                ]
+                previous = self._previous(folder) if rows else {}
+                entries = [entry for entry in pool.map(lambda row: self._entry(row, previous.get(row["path"])), rows)
+                           if entry is not None]
+                if not entries:
+                    removed += unpublish(base_path)
+                    self.published.pop(folder, None)
+                    continue
+                by_name = {entry["name"]: entry for entry in entries}
+                cover = next((by_name[name] for name in portfolio_catalog.COVER_NAMES if name in by_name), entries[0])
+                document = {
+                    "id": category_id(folder),
+                    "folder": folder,
+                    "count": len(entries),
+                    "cover": cover["src"],
+                    "images": entries,
+                }
+                self.published[folder] = (document["count"], document["cover"])
+                if publish(base_path, document):
+                    written += 1
+                else:
+                    unchanged += 1
+            self._update_index()
+        return written, unchanged, removed
+
+    def _update_index(self) -> bool:
+        """Category list in configGenerator.js's shape, with counts and manifest URLs."""
+        categories = []
+        for folder, (count, cover) in self.published.items():
+            parent, _, name = folder.rpartition("/")
+            title = format_title(name)
+            categories.append({
+                "id": category_id(folder),
+                "title": title,
+                "description": f"Collection of {title.lower()} photographs",
+                "folder": folder,
+                "featured": parent == "",
+                "parent": parent or None,
+                "count": count,
+                "cover": cover,
+                "manifest": url(OPTIMIZED_URL, MANIFEST_DIR_NAME, category_id(folder) + ".json"),
+            })
+        categories.sort(key=lambda category: (not category["featured"], category["title"].lower()))
+        return publish(os.path.join(self.manifest_dir, INDEX_NAME), {"categories": categories})
+
+    def build_all(self) -> Tuple[int, int, int]:
+        """Every category the catalog knows, and drop manifests of folders that are gone."""
+        folders = set(self.catalog.folder_counts())
+        known = {category_id(folder) for folder in folders if folder}
+        stale = 0
+        if os.path.isdir(self.manifest_dir):
+            for name in os.listdir(self.manifest_dir):
+                base, extension = name.split(".", 1) if "." in name else (name, "")
+                if extension == "json" and base not in known and base != INDEX_NAME:
+                    stale += unpublish(os.path.join(self.manifest_dir, base))
+        self.published = None
+        written, unchanged, removed = self.update_folders(folders)
+        return written, unchanged, removed + stale
+
+
+class ManifestStage:
+    """watch-folders.py stage that rewrites the manifests of the categories in each batch.
+
+    Runs after the catalog and thumbnail stages so it sees fresh rows and variants.
+    """
+
+    name = "manifest"
+
+    def __init__(self, workers: int = WORKERS, catalog_stage=None):
+        self.workers = workers
+        self.catalog_stage = catalog_stage
+        self.own_catalog: Optional[portfolio_catalog.ImageCatalog] = None
+        self.manifests: Optional[GalleryManifests] = None
+
+    def process(self, batch):
+        if self.catalog_stage is not None and self.catalog_stage.catalog is not None:
+            catalog = self.catalog_stage.catalog
+        else:
+            # Catalog stage disabled: keep our own copy current for the batch
+            if self.own_catalog is None:
+                self.own_catalog = portfolio_catalog.ImageCatalog(batch.root)
+            catalog = self.own_catalog
+            catalog.index_files([path for path in batch.files
+                                 if portfolio_catalog.is_catalogued(os.path.basename(path))])
+            catalog.mark_deleted(portfolio_catalog.relative_key(batch.root, path) for path in batch.deleted)
+        if self.manifests is None or self.manifests.catalog is not catalog:
+            self.manifests = GalleryManifests(batch.root, catalog, self.workers)
+
+        folders = {
+            portfolio_catalog.relative_key(batch.root, path).rpartition("/")[0]
+            for path in list(batch.files) + list(batch.deleted)
+            if os.path.splitext(path)[1].lower() in WEB_EXTENSIONS
+        }
+        if not folders:
+            return
+        started = time.monotonic()
+        written, unchanged, removed = self.manifests.update_folders(folders)
+        logger.info(f"🧾 Manifests: {written} rewritten, {unchanged} unchanged, {removed} removed "
+                    f"in {time.monotonic() - started:.1f}s")
+
+    def close(self):
+        if self.own_catalog is not None:
+            self.own_catalog.close()
+            self.own_catalog = None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build the per-category gallery manifests")
+    parser.add_argument("root", help="portfolio images folder")
+    parser.add_argument("--folder", action="append", help="only rebuild this category (repeatable)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not os.path.isdir(args.root):
+        print(f"❌ Not a directory: {args.root}")
+        return 1
+    if Image is None:
+        print("Gallery manifests need Pillow: pip3 install Pillow")
+        return 1
+
+    started = time.monotonic()
+    catalog = portfolio_catalog.ImageCatalog(args.root)
+    try:
+        catalog.build()
+        manifests = GalleryManifests(args.root, catalog, args.workers)
+        if args.folder:
+            written, unchanged, removed = manifests.update_folders(folder.strip("/") for folder in args.folder)
+        else:
+            written, unchanged, removed = manifests.build_all()
+    finally:
+        catalog.close()
+    print(f"🧾 {written} manifest(s) written, {unchanged} unchanged, {removed} removed "
+          f"in {time.monotonic() - started:.1f}s{'' if brotli else ' (pip3 install brotli for .br copies)'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
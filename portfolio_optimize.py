@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Web-optimized full-size images for the photo portfolio
+Fullscreen viewing loads images/optimized/full/<image>, which used to be a
+plain copy of the upload (up to 50 MB). This re-encodes it instead: EXIF,
+XMP and comments stripped (orientation applied first, colour profile kept),
+capped at 4K, as a progressive JPEG (and a WebP next to it) at the lowest
+quality whose SSIM against the source still meets the target, within a
+byte budget. The originals are never touched; they stay in the portfolio
+tree. Runs as a watch-folders.py stage, or on its own:
+
+    python3 portfolio_optimize.py /mnt/Plex/photo-portfolio/images
+    python3 portfolio_optimize.py /mnt/Plex/photo-portfolio/images --stats
+"""
+
+import argparse
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from types import SimpleNamespace
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+from portfolio_catalog import file_hash
+from portfolio_thumbnails import OPTIMIZED_DIR_NAME, SOURCE_EXTENSIONS, _init_worker
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ==================== CONFIGURATION ====================
+MAX_EDGE = 3840                     # Longest edge of the full-size image (0 keeps the source size)
+TARGET_SSIM = 0.985                 # Lowest quality that still reaches this SSIM wins
+MAX_BYTES = 3_000_000               # Byte budget per image (0 for none); quality drops to fit
+MIN_QUALITY = 50
+MAX_QUALITY = 92
+DEFAULT_QUALITY = 82                # Used when NumPy isn't there to measure SSIM
+SEARCH_EDGE = 1600                  # Quality is searched on a copy this size, then applied to the full image
+OUTPUT_FORMATS = ("jpeg", "webp")   # jpeg: same-name file (JPEG sources only); webp: <name>.webp beside it
+WORKERS = 2                         # Encoder processes (each holds one decoded image)
+NICENESS = 15
+STATE_DB_NAME = ".optimized.db"     # Kept inside the optimized dir
+# =======================================================
+
+ENCODER_VERSION = 2                 # Bumped when the same settings produce different files
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+logger = logging.getLogger("portfolio_optimize")
+
+
+def settings_key(max_edge: int = MAX_EDGE, target_ssim: float = TARGET_SSIM, max_bytes: int = MAX_BYTES,
+                 formats: Tuple[str, ...] = OUTPUT_FORMATS) -> str:
+    """Changing any of these (or ENCODER_VERSION) re-encodes everything."""
+    return f"v={ENCODER_VERSION};edge={max_edge};ssim={target_ssim};bytes={max_bytes};formats={','.join(formats)}"
+
+
+def output_paths(optimized_dir: str, relative_path: str, formats: Tuple[str, ...] = OUTPUT_FORMATS) -> Dict[str, str]:
+    """Format -> file written for one source image."""
+    paths = {}
+    if "jpeg" in formats:
+        paths["jpeg"] = os.path.join(optimized_dir, "full", relative_path)
+    if "webp" in formats:
+        paths["webp"] = os.path.join(optimized_dir, "full", f"{os.path.splitext(relative_path)[0]}.webp")
+    return paths
+
+
+def _window_sums(values, height: int, width: int):
+    """Sums over 8x8 windows every 4 pixels, from 4x4 block sums."""
+    blocks = values.reshape(height // 4, 4, width // 4, 4).sum(axis=(1, 3))
+    return blocks[:-1, :-1] + blocks[1:, :-1] + blocks[:-1, 1:] + blocks[1:, 1:]
+
+
+def block_ssim(reference, candidate) -> float:
+    """Mean SSIM of two luma arrays over overlapping 8x8 windows."""
+    height, width = (min(a, b) // 4 * 4 for a, b in zip(reference.shape, candidate.shape))
+    if height < 8 or width < 8:
+        return 1.0
+    a = reference[:height, :width]
+    b = candidate[:height, :width]
+    mean_a, mean_b = _window_sums(a, height, width) / 64, _window_sums(b, height, width) / 64
+    var_a = _window_sums(a * a, height, width) / 64 - mean_a ** 2
+    var_b = _window_sums(b * b, height, width) / 64 - mean_b ** 2
+    covariance = _window_sums(a * b, height, width) / 64 - mean_a * mean_b
+    ssim = ((2 * mean_a * mean_b + SSIM_C1) * (2 * covariance + SSIM_C2)) / (
+        (mean_a ** 2 + mean_b ** 2 + SSIM_C1) * (var_a + var_b + SSIM_C2))
+    return float(ssim.mean())
+
+
+def _luma(image):
+    return np.asarray(image.convert("L"), dtype=np.float32)
+
+
+def encode(image, fmt: str, quality: int, icc_profile: Optional[bytes]) -> bytes:
+    """Encode without any metadata but the colour profile."""
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True, icc_profile=icc_profile)
+    else:
+        image.save(buffer, "WEBP", quality=quality, method=4, icc_profile=icc_profile)
+    return buffer.getvalue()
+
+
+def encode_lossless(image, extension: str, icc_profile: Optional[bytes]) -> bytes:
+    """Encode losslessly in the source's own format, without any metadata but the colour profile."""
+    buffer = io.BytesIO()
+    if extension == ".png":
+        image.save(buffer, "PNG", optimize=True, icc_profile=icc_profile)
+    elif extension in (".tif", ".tiff"):
+        image.save(buffer, "TIFF", compression="tiff_adobe_deflate", icc_profile=icc_profile)
+    else:
+        image.save(buffer, "WEBP", lossless=True, icc_profile=icc_profile)
+    return buffer.getvalue()
+
+
+def search_quality(proxy, fmt: str, target_ssim: float, icc_profile: Optional[bytes]) -> Tuple[int, Optional[float]]:
+    """Binary search for the lowest quality whose SSIM reaches the target."""
+    if np is None:
+        return DEFAULT_QUALITY, None
+    reference = _luma(proxy)
+    low, high = MIN_QUALITY, MAX_QUALITY
+    best = MAX_QUALITY    # When even that misses the target (noisy images)
+    measured = {}
+    while low <= high:
+        quality = (low + high) // 2
+        with Image.open(io.BytesIO(encode(proxy, fmt, quality, icc_profile))) as decoded:
+            measured[quality] = block_ssim(reference, _luma(decoded))
+        if measured[quality] >= target_ssim:
+            best = quality
+            high = quality - 1
+        else:
+            low = quality + 1
+    return best, measured.get(best)
+
+
+def fit_budget(image, fmt: str, quality: int, max_bytes: int, icc_profile: Optional[bytes]) -> Tuple[int, bytes]:
+    """Encode at the quality, lowering it (binary search) while the result is over budget."""
+    data = encode(image, fmt, quality, icc_profile)
+    if not max_bytes or len(data) <= max_bytes or quality <= MIN_QUALITY:
+        return quality, data
+    low, high = MIN_QUALITY, quality - 1
+    best = (MIN_QUALITY, None)
+    while low <= high:
+        candidate = (low + high) // 2
+        candidate_data = encode(image, fmt, candidate, icc_profile)
+        if len(candidate_data) <= max_bytes:
+            best = (candidate, candidate_data)
+            low = candidate + 1
+        else:
+            high = candidate - 1
+    return best[0], best[1] if best[1] is not None else encode(image, fmt, MIN_QUALITY, icc_profile)
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _copy_atomic(source: str, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def optimize_image(source: str, optimized_dir: str, relative_path: str, max_edge: int, target_ssim: float,
+                   max_bytes: int, formats: Tuple[str, ...]) -> Dict[str, tuple]:
+    """Write every output of one image; returns format -> (quality, ssim, bytes).
+
+    Runs in a worker process. Nothing is copied from the source, so no
+    output carries its EXIF/XMP. A non-JPEG source's same-name file is
+    re-saved losslessly (quality None); a JPEG that the search can't make
+    smaller than the source is encoded at MAX_QUALITY instead.
+    """
+    source_bytes = os.path.getsize(source)
+    extension = os.path.splitext(source)[1].lower()
+    is_jpeg = extension in (".jpg", ".jpeg")
+    paths = output_paths(optimized_dir, relative_path, formats)
+    if paths.get("jpeg") == paths.get("webp"):
+        del paths["jpeg"]    # A WebP source: the webp output is its same-name file
+    results = {}
+    with Image.open(source) as image:
+        icc_profile = image.info.get("icc_profile")
+        if is_jpeg and max_edge:
+            scale = max_edge / max(image.size)
+            if scale < 1:
+                image.draft("RGB", (int(image.size[0] * scale) + 1, int(image.size[1] * scale) + 1))
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        if max_edge and max(image.size) > max_edge:
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        image.info = {}
+        proxy = image.copy()
+        proxy.thumbnail((SEARCH_EDGE, SEARCH_EDGE), Image.LANCZOS)
+
+        for fmt, path in paths.items():
+            if fmt == "jpeg" and not is_jpeg:
+                # The gallery asks for full/<name> in the source's own format
+                data = encode_lossless(image, extension, icc_profile)
+                _write_atomic(path, data)
+                results[fmt] = (None, None, len(data))
+                continue
+            candidate = image.convert("RGB") if fmt == "jpeg" else image
+            quality, ssim = search_quality(proxy.convert(candidate.mode), fmt, target_ssim, icc_profile)
+            quality, data = fit_budget(candidate, fmt, quality, max_bytes, icc_profile)
+            if fmt == "jpeg" and len(data) >= source_bytes:
+                # No saving to be had: spend the bytes on fidelity, within the budget
+                best = encode(candidate, fmt, MAX_QUALITY, icc_profile)
+                if not max_bytes or len(best) <= max_bytes:
+                    quality, ssim, data = MAX_QUALITY, None, best
+            _write_atomic(path, data)
+            results[fmt] = (quality, ssim, len(data))
+    return results
+
+
+def _optimize_job(source: str, optimized_dir: str, relative_path: str, settings: tuple, state_path: str,
+                  previous: Optional[tuple]) -> Tuple[str, Optional[tuple], Optional[dict], Optional[str]]:
+    """Worker entry point: reuse earlier work for the same content, else encode.
+
+    Returns (relative_path, (size, mtime_ns, hash), results, error); results
+    is None when nothing had to be encoded.
+    """
+    max_edge, target_ssim, max_bytes, formats = settings
+    key = settings_key(*settings)
+    try:
+        stat = os.stat(source)
+        signature_hash = file_hash(source)
+        signature = (stat.st_size, stat.st_mtime_ns, signature_hash)
+        paths = output_paths(optimized_dir, relative_path, formats)
+        if (previous is not None and previous[2:] == (signature_hash, key)
+                and all(os.path.exists(path) for path in paths.values())):
+            return relative_path, signature, None, None    # Touched or re-copied, same content
+
+        # Same content already optimized under another name (a moved or copied image)
+        with closing(sqlite3.connect(f"file:{quote(state_path)}?mode=ro", uri=True)) as db:
+            twins = db.execute(
+                "SELECT path FROM optimized WHERE hash = ? AND settings = ? AND path != ?",
+                (signature_hash, key, relative_path)
+            ).fetchall()
+        for (twin,) in twins:
+            twin_paths = output_paths(optimized_dir, twin, formats)
+            if all(os.path.exists(path) for path in twin_paths.values()):
+                for fmt, path in paths.items():
+                    _copy_atomic(twin_paths[fmt], path)
+                return relative_path, signature, None, None
+
+        results = optimize_image(source, optimized_dir, relative_path, max_edge, target_ssim, max_bytes, formats)
+        return relative_path, signature, results, None
+    except Exception as e:
+        return relative_path, None, None, f"{type(e).__name__}: {e}"
+
+
+class OptimizeState:
+    """What each source was optimized from, and what it came to."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS optimized ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT, settings TEXT, "
+            "source_bytes INTEGER, output_bytes INTEGER, quality INTEGER, ssim REAL, built REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS optimized_hash ON optimized (hash)")
+        self.db.commit()
+
+    def get(self, relative_path: str) -> Optional[tuple]:
+        """(size, mtime_ns, hash, settings) of the last run, or None."""
+        row = self.db.execute(
+            "SELECT size, mtime_ns, hash, settings FROM optimized WHERE path = ?", (relative_path,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, relative_path: str, signature: tuple, key: str, output_bytes: int,
+            quality: Optional[int], ssim: Optional[float]):
+        self.db.execute(
+            "INSERT OR REPLACE INTO optimized (path, size, mtime_ns, hash, settings, source_bytes, "
+            "output_bytes, quality, ssim, built) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (relative_path, *signature, key, signature[0], output_bytes, quality, ssim, time.time())
+        )
+
+    def touch(self, relative_path: str, signature: tuple, key: str) -> bool:
+        """Record a new size/mtime for unchanged content; False if there was no row."""
+        cursor = self.db.execute(
+            "UPDATE optimized SET size = ?, mtime_ns = ?, hash = ?, settings = ?, built = ? WHERE path = ?",
+            (*signature, key, time.time(), relative_path)
+        )
+        return cursor.rowcount > 0
+
+    def commit(self):
+        self.db.commit()
+
+    def delete_many(self, relative_paths):
+        self.db.executemany("DELETE FROM optimized WHERE path = ?", [(p,) for p in relative_paths])
+        self.db.commit()
+
+    def totals(self) -> tuple:
+        """(images, source bytes, output bytes, average quality) over everything recorded."""
+        return self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(source_bytes), 0), COALESCE(SUM(output_bytes), 0), AVG(quality) "
+            "FROM optimized"
+        ).fetchone()
+
+    def close(self):
+        self.db.close()
+
+
+class OptimizeStage:
+    """watch-folders.py stage that writes the web-optimized full-size images."""
+
+    name = "optimize"
+
+    def __init__(self, workers: int = WORKERS, niceness: int = NICENESS, max_edge: int = MAX_EDGE,
+                 target_ssim: float = TARGET_SSIM, max_bytes: int = MAX_BYTES,
+                 formats: Tuple[str, ...] = OUTPUT_FORMATS, optimized_dir: Optional[str] = None):
+        if Image is None:
+            raise RuntimeError("Pillow is required for optimization: pip3 install Pillow")
+        if np is None:
+            logger.warning(f"NumPy is not installed (pip3 install numpy); using quality {DEFAULT_QUALITY} "
+                           f"instead of an SSIM search")
+        self.workers = max(1, workers)
+        self.niceness = niceness
+        self.settings = (max_edge, target_ssim, max_bytes, tuple(formats))
+        self.optimized_dir = optimized_dir
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.state: Optional[OptimizeState] = None
+
+    def _start(self, root: str):
+        if self.optimized_dir is None:
+            self.optimized_dir = os.path.join(root, OPTIMIZED_DIR_NAME)
+        if self.state is None:
+            self.state = OptimizeState(os.path.join(self.optimized_dir, STATE_DB_NAME))
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.niceness,),
+            )
+
+    def process(self, batch):
+        self._start(batch.root)
+        started = time.monotonic()
+        key = settings_key(*self.settings)
+        formats = self.settings[3]
+
+        futures = []
+        unchanged = 0
+        for path in batch.files:
+            if os.path.splitext(path)[1].lower() not in SOURCE_EXTENSIONS:
+                continue
+            relative_path = os.path.relpath(path, batch.root)
+            previous = self.state.get(relative_path)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if (previous is not None and previous[:2] == (stat.st_size, stat.st_mtime_ns) and previous[3] == key
+                    and all(os.path.exists(p) for p in output_paths(self.optimized_dir, relative_path, formats).values())):
+                unchanged += 1
+                continue
+            futures.append((path, self.pool.submit(
+                _optimize_job, path, self.optimized_dir, relative_path, self.settings, self.state.path, previous
+            )))
+
+        encoded = failed = 0
+        source_total = output_total = 0
+        for path, future in futures:
+            relative_path, signature, results, error = future.result()
+            if error is not None:
+                failed += 1
+                batch.failed.add(path)
+                logger.error(f"❌ Optimizing failed for {relative_path}: {error}")
+                continue
+            paths = output_paths(self.optimized_dir, relative_path, formats)
+            if results is None:
+                unchanged += 1
+                if not self.state.touch(relative_path, signature, key):
+                    # Copied from the same content under another name
+                    served = next(iter(paths.values()))
+                    self.state.put(relative_path, signature, key, os.path.getsize(served), None, None)
+                continue
+            encoded += 1
+            quality, ssim, size = next(iter(results.values()))
+            self.state.put(relative_path, signature, key, size, quality, ssim)
+            source_total += signature[0]
+            output_total += size
+            logger.debug(f"{relative_path}: " + ", ".join(
+                f"{fmt} lossless {b / 1024:.0f} KB" if q is None else f"{fmt} q{q}{f' ssim {s:.4f}' if s is not None else ''} {b / 1024:.0f} KB"
+                for fmt, (q, s, b) in results.items()
+            ))
+        self.state.commit()
+
+        removed = self._remove(batch)
+        if futures or unchanged or removed:
+            saved = f", {source_total / 1e6:.1f} MB -> {output_total / 1e6:.1f} MB" if encoded else ""
+            logger.info(
+                f"🗜️  Optimized: {encoded} encoded, {unchanged} unchanged, {failed} failed, "
+                f"{removed} removed{saved} in {time.monotonic() - started:.1f}s"
+            )
+
+    def _remove(self, batch) -> int:
+        """Delete the outputs of removed source images."""
+        relative_paths = [os.path.relpath(path, batch.root) for path in batch.deleted]
+        for relative_path in relative_paths:
+            for path in output_paths(self.optimized_dir, relative_path, OUTPUT_FORMATS).values():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self.state.delete_many(relative_paths)
+        return len(relative_paths)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.state is not None:
+            self.state.close()
+            self.state = None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Write web-optimized full-size portfolio images")
+    parser.add_argument("root", help="portfolio images folder (output goes to <root>/optimized/full)")
+    parser.add_argument("paths", nargs="*", help="only these files or folders (default: whole tree)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"encoder processes (default {WORKERS})")
+    parser.add_argument("--nice", type=int, default=NICENESS, help=f"worker niceness (default {NICENESS})")
+    parser.add_argument("--max-edge", type=int, default=MAX_EDGE, help=f"longest edge (default {MAX_EDGE}, 0 keeps it)")
+    parser.add_argument("--target-ssim", type=float, default=TARGET_SSIM, help=f"default {TARGET_SSIM}")
+    parser.add_argument("--max-bytes", type=int, default=MAX_BYTES, help=f"byte budget (default {MAX_BYTES}, 0 for none)")
+    parser.add_argument("--no-webp", action="store_true", help="skip the WebP versions")
+    parser.add_argument("--stats", action="store_true", help="show totals of everything optimized so far")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if Image is None:
+        print("Missing required packages. Install with:")
+        print("pip3 install Pillow numpy")
+        return 1
+
+    root = os.path.abspath(args.root)
+    if args.stats:
+        state = OptimizeState(os.path.join(root, OPTIMIZED_DIR_NAME, STATE_DB_NAME))
+        images, source_bytes, output_bytes, quality = state.totals()
+        state.close()
+        ratio = source_bytes / output_bytes if output_bytes else 0
+        print(f"📊 {images} images: {source_bytes / 1e6:.1f} MB of originals served as "
+              f"{output_bytes / 1e6:.1f} MB ({ratio:.1f}x smaller), average quality {quality or 0:.0f}")
+        return 0
+
+    files = []
+    for start in [os.path.abspath(p) for p in args.paths] or [root]:
+        if os.path.isfile(start):
+            files.append(start)
+            continue
+        for dirpath, dirnames, filenames in os.walk(start):
+            dirnames[:] = [d for d in dirnames if d != OPTIMIZED_DIR_NAME and not d.startswith(".")]
+            files.extend(
+                os.path.join(dirpath, name) for name in filenames
+                if not name.startswith(".") and os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS
+            )
+
+    formats = tuple(fmt for fmt in OUTPUT_FORMATS if not (args.no_webp and fmt == "webp"))
+    stage = OptimizeStage(workers=args.workers, niceness=args.nice, max_edge=args.max_edge,
+                          target_ssim=args.target_ssim, max_bytes=args.max_bytes, formats=formats)
+    batch = SimpleNamespace(root=root, files=sorted(files), deleted=[], failed=set())
+    try:
+        stage.process(batch)
+    finally:
+        stage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Delta sync from the Mac to the Pi5 photo portfolio
+Builds a manifest (path, size, mtime, content hash) on both sides, diffs
+them locally and ships only new or changed images, as parallel tar streams
+over one multiplexed SSH connection. Hashes come from the watcher's catalog
+where it exists and from a small per-tree cache otherwise, so an unchanged
+tree only costs a stat walk on each side.
+
+The remote manifest is built by piping this file to the Pi's python3, so
+nothing needs installing there and it only uses the standard library.
+
+Usage:
+    python3 portfolio_sync.py                 # Sync LOCAL_PATH to the Pi5
+    python3 portfolio_sync.py --dry-run       # Show what would be sent
+    python3 portfolio_sync.py --delete        # Also remove files that are gone from the Mac
+    python3 portfolio_sync.py manifest /mnt/Plex/photo-portfolio/images
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shlex
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# ==================== CONFIGURATION ====================
+PI_USER = "ian"
+PI_HOST = "192.168.50.243"
+PI_PATH = "/mnt/Plex/photo-portfolio/images"
+SSH_KEY = "~/.ssh/id_ed25519"
+LOCAL_PATH = "/Users/ian/Portfolio Images to Transfer"
+REMOTE_PYTHON = "python3"
+
+STREAMS = 4                       # Parallel tar streams over the shared connection
+HASH_WORKERS = 4                  # Threads hashing files missing from the caches
+CONTROL_PERSIST = 60              # Seconds the SSH master outlives the last stream
+SPACE_BUFFER_PERCENT = 10         # Free space required on the Pi5 on top of the upload
+
+# Kept in step with portfolio_catalog.py, which this file can't import on the Pi
+HASH_CHUNK_SIZE = 1024 * 1024
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp", ".avif", ".heic"}
+SKIP_DIRS = {"optimized"}
+CATALOG_DB_NAME = ".portfolio-catalog.db"
+MANIFEST_CACHE_NAME = ".sync-manifest.json"
+# =======================================================
+
+logger = logging.getLogger("portfolio_sync")
+
+# key -> (size, mtime_ns, hash)
+Manifest = Dict[str, Tuple[int, int, str]]
+
+
+# ---- Manifests (run on both sides) ----
+
+def file_hash(path: str) -> str:
+    """Content hash of a file (BLAKE2b, 128 bit), the same as the catalog's."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stat_images(root: str) -> Dict[str, Tuple[int, int]]:
+    """key -> (size, mtime_ns) of every image below the root, walked like portfolio_catalog.walk_images."""
+    found = {}
+    stack = [root]
+    real_root = os.path.realpath(root)
+    root_stat = os.stat(root)
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=True):
+                        if entry.name in SKIP_DIRS:
+                            continue
+                        if entry.is_symlink():
+                            target = os.path.realpath(entry.path)
+                            if target == real_root or target.startswith(real_root + os.sep):
+                                continue
+                        stat = entry.stat(follow_symlinks=True)
+                        if (stat.st_dev, stat.st_ino) not in visited:
+                            visited.add((stat.st_dev, stat.st_ino))
+                            stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        key = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                        found[key] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logger.warning(f"⚠️  Can't read {e.filename}: {e.strerror}")
+    return found
+
+
+def known_hashes(root: str) -> Manifest:
+    """Hashes already on record: the watcher's catalog, then the sync cache."""
+    known = {}
+    catalog_path = os.path.join(root, CATALOG_DB_NAME)
+    if os.path.exists(catalog_path):
+        try:
+            db = sqlite3.connect(f"file:{catalog_path}?mode=ro", uri=True)
+            try:
+                rows = db.execute(
+                    "SELECT path, size, mtime_ns, hash FROM images WHERE deleted IS NULL AND hash IS NOT NULL"
+                ).fetchall()
+            finally:
+                db.close()
+            known.update((path, (size, mtime_ns, digest)) for path, size, mtime_ns, digest in rows)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Can't read the catalog, hashing without it: {e}")
+    try:
+        with open(os.path.join(root, MANIFEST_CACHE_NAME)) as f:
+            cached = json.load(f)
+        for key, (size, mtime_ns, digest) in cached.items():
+            if key not in known or known[key][:2] != (size, mtime_ns):
+                known[key] = (size, mtime_ns, digest)
+    except (OSError, ValueError):
+        pass
+    return known
+
+
+def build_manifest(root: str, workers: int = HASH_WORKERS) -> Manifest:
+    """Manifest of the tree, hashing only files whose size or mtime isn't on record."""
+    stats = stat_images(root)
+    known = known_hashes(root)
+    manifest = {}
+    to_hash = []
+    for key, (size, mtime_ns) in stats.items():
+        record = known.get(key)
+        if record is not None and record[:2] == (size, mtime_ns):
+            manifest[key] = record
+        else:
+            to_hash.append(key)
+
+    def hash_one(key):
+        try:
+            return file_hash(os.path.join(root, key))
+        except OSError as e:
+            logger.warning(f"⚠️  Can't hash {key}: {e}")
+            return None
+
+    if to_hash:
+        logger.info(f"🔑 Hashing {len(to_hash)} new or changed files in {root}")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for key, digest in zip(to_hash, pool.map(hash_one, to_hash)):
+                if digest is not None:
+                    manifest[key] = stats[key] + (digest,)
+
+    if to_hash or len(manifest) != len(known):
+        save_cache(root, manifest)
+    return manifest
+
+
+def save_cache(root: str, manifest: Manifest):
+    """Write the sync cache atomically; a read-only tree just goes without."""
+    path = os.path.join(root, MANIFEST_CACHE_NAME)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=root, prefix=MANIFEST_CACHE_NAME, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.debug(f"Can't write {path}: {e}")
+
+
+def print_manifest(root: str) -> int:
+    """`manifest` command: gzipped JSON of the manifest and free space on stdout."""
+    manifest = build_manifest(root)
+    usage = shutil.disk_usage(root)
+    document = {"root": root, "free_bytes": usage.free, "files": manifest}
+    sys.stdout.buffer.write(gzip.compress(json.dumps(document, separators=(",", ":")).encode(), 6))
+    sys.stdout.buffer.flush()
+    return 0
+
+
+# ---- Diff ----
+
+def diff_manifests(local: Manifest, remote: Manifest) -> Tuple[List[str], List[str], int]:
+    """(keys to send, keys only on the remote, unchanged count).
+
+    Files are compared by content hash, so a touched or re-copied file with
+    the same bytes isn't sent again.
+    """
+    send = sorted(key for key, record in local.items()
+                  if key not in remote or remote[key][2] != record[2])
+    extra = sorted(key for key in remote if key not in local)
+    return send, extra, len(local) - len(send)
+
+
+def split_streams(keys: List[str], manifest: Manifest, streams: int) -> List[List[str]]:
+    """Spread files over streams with roughly equal bytes, largest first."""
+    buckets = [[0, []] for _ in range(max(1, min(streams, len(keys))))]
+    for key in sorted(keys, key=lambda k: manifest[k][0], reverse=True):
+        bucket = min(buckets, key=lambda b: b[0])
+        bucket[0] += manifest[key][0]
+        bucket[1].append(key)
+    return [sorted(files) for _size, files in buckets if files]
+
+
+# ---- Transport ----
+
+class SSHConnection:
+    """One SSH master connection that every command and stream is multiplexed over."""
+
+    def __init__(self, user: str, host: str, key: Optional[str] = SSH_KEY):
+        self.target = f"{user}@{host}"
+        self.control_dir = tempfile.mkdtemp(prefix="psync-")
+        self.options = [
+            "-o", "BatchMode=yes",
+            "-o", f"ControlPath={os.path.join(self.control_dir, 'cm')}",
+        ]
+        if key:
+            self.options += ["-i", os.path.expanduser(key)]
+        self.master_open = False
+
+    def open(self):
+        subprocess.run(
+            ["ssh", *self.options, "-o", "ControlMaster=yes", "-o", f"ControlPersist={CONTROL_PERSIST}",
+             "-N", "-f", self.target],
+            check=True, stdin=subprocess.DEVNULL
+        )
+        self.master_open = True
+
+    def command(self, remote_command: str) -> List[str]:
+        return ["ssh", *self.options, "-o", "ControlMaster=no", self.target, remote_command]
+
+    def run(self, remote_command: str, input: bytes = b"") -> bytes:
+        result = subprocess.run(self.command(remote_command), input=input, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{remote_command!r} failed on {self.target}: "
+                               f"{result.stderr.decode(errors='replace').strip()}")
+        return result.stdout
+
+    def close(self):
+        if self.master_open:
+            subprocess.run(["ssh", *self.options, "-O", "exit", self.target],
+                           stdin=subprocess.DEVNULL, capture_output=True)
+            self.master_open = False
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def fetch_remote_manifest(connection: SSHConnection, remote_root: str) -> dict:
+    """Run this file on the remote side with the `manifest` command."""
+    with open(os.path.abspath(__file__), "rb") as f:
+        source = f.read()
+    command = f"{REMOTE_PYTHON} - manifest {shlex.quote(remote_root)}"
+    return json.loads(gzip.decompress(connection.run(command, input=source)))
+
+
+def _tar_filter(info: tarfile.TarInfo) -> tarfile.TarInfo:
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    info.mode = 0o644
+    return info
+
+
+def send_stream(connection: SSHConnection, local_root: str, remote_root: str,
+                keys: List[str], progress) -> Tuple[int, int, Optional[str]]:
+    """Ship files as one tar stream unpacked in place; returns (files, bytes, error)."""
+    process = subprocess.Popen(
+        connection.command(f"tar -xf - -C {shlex.quote(remote_root)}"),
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    sent_files = sent_bytes = 0
+    error = None
+    try:
+        with tarfile.open(fileobj=process.stdin, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            for key in keys:
+                path = os.path.join(local_root, key)
+                try:
+                    tar.add(path, arcname=key, recursive=False, filter=_tar_filter)
+                except FileNotFoundError:
+                    logger.warning(f"⚠️  {key} disappeared before it was sent")
+                    continue
+                sent_files += 1
+                sent_bytes += os.path.getsize(path)
+                progress(key)
+    except (BrokenPipeError, OSError) as e:
+        error = str(e)
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+    stderr = process.stderr.read().decode(errors="replace").strip()
+    if process.wait() != 0:
+        error = stderr or error or f"tar exited with {process.returncode}"
+    return sent_files, sent_bytes, error
+
+
+def delete_remote(connection: SSHConnection, remote_root: str, keys: List[str]):
+    """Remove files below the remote root, paths fed NUL-separated to xargs."""
+    payload = b"".join(key.encode() + b"\0" for key in keys)
+    connection.run(f"cd {shlex.quote(remote_root)} && xargs -0 rm -f --", input=payload)
+
+
+# ---- Sync ----
+
+def format_size(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f}MB"
+
+
+def sync(args) -> int:
+    started = time.monotonic()
+    local_root = os.path.abspath(os.path.expanduser(args.local))
+    if not os.path.isdir(local_root):
+        print(f"❌ Portfolio transfer directory not found: {local_root}")
+        return 1
+
+    print(f"🔄 Syncing '{local_root}' to {args.user}@{args.host}:{args.remote}")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # The local manifest is built while the remote one is fetched
+        local_future = pool.submit(build_manifest, local_root, args.hash_workers)
+        with SSHConnection(args.user, args.host, args.key) as connection:
+            try:
+                remote = fetch_remote_manifest(connection, args.remote)
+            except (RuntimeError, ValueError, OSError) as e:
+                print(f"❌ Can't read the Pi5 manifest: {e}")
+                return 1
+            local = local_future.result()
+            remote_files = {key: tuple(record) for key, record in remote["files"].items()}
+            send, extra, unchanged = diff_manifests(local, remote_files)
+            send_bytes = sum(local[key][0] for key in send)
+            print(f"📋 {len(local)} local, {len(remote_files)} on Pi5: {len(send)} to send "
+                  f"({format_size(send_bytes)}), {unchanged} unchanged, {len(extra)} only on Pi5 "
+                  f"[{time.monotonic() - started:.1f}s]")
+
+            folders = sorted({key.rpartition("/")[0] or "." for key in send})
+            for folder in folders:
+                count = sum(1 for key in send if (key.rpartition("/")[0] or ".") == folder)
+                print(f"   📂 {folder}: {count} files")
+            if args.delete and extra:
+                print(f"   🗑️  {len(extra)} files to remove from the Pi5")
+
+            if args.dry_run:
+                for key in send[:args.show]:
+                    print(f"      📄 {key}")
+                if len(send) > args.show:
+                    print(f"      ... and {len(send) - args.show} more files")
+                print("🧪 [DRY RUN] No changes made")
+                return 0
+
+            required = send_bytes + send_bytes * SPACE_BUFFER_PERCENT // 100
+            if send_bytes and remote["free_bytes"] < required:
+                print(f"❌ Not enough space on Pi5. Available: {format_size(remote['free_bytes'])}, "
+                      f"Required (with {SPACE_BUFFER_PERCENT}% buffer): {format_size(required)}")
+                return 1
+
+            failed = False
+            if send:
+                streams = split_streams(send, local, args.streams)
+                done = [0]
+                lock = threading.Lock()
+
+                def progress(key):
+                    with lock:
+                        done[0] += 1
+                        logger.debug(f"📤 [{done[0]}/{len(send)}] {key}")
+
+                transfer_started = time.monotonic()
+                with ThreadPoolExecutor(max_workers=len(streams)) as stream_pool:
+                    results = list(stream_pool.map(
+                        lambda keys: send_stream(connection, local_root, args.remote, keys, progress), streams
+                    ))
+                elapsed = max(time.monotonic() - transfer_started, 1e-6)
+                sent_files = sum(files for files, _bytes, _error in results)
+                sent_bytes = sum(size for _files, size, _error in results)
+                for _files, _bytes, error in results:
+                    if error:
+                        failed = True
+                        print(f"❌ Stream failed: {error}")
+                print(f"📤 Sent {sent_files} files ({format_size(sent_bytes)}) over {len(streams)} streams "
+                      f"in {elapsed:.1f}s ({sent_bytes / elapsed / 1024 / 1024:.1f}MB/s)")
+
+            if args.verify and send and not failed:
+                check = fetch_remote_manifest(connection, args.remote)["files"]
+                mismatched = [key for key in send if key not in check or check[key][2] != local[key][2]]
+                if mismatched:
+                    failed = True
+                    print(f"❌ {len(mismatched)} files don't match after the transfer, e.g. {mismatched[0]}")
+                else:
+                    print(f"✅ Verified {len(send)} files on the Pi5")
+
+            if args.delete and extra and not failed:
+                try:
+                    delete_remote(connection, args.remote, extra)
+                    print(f"🗑️  Removed {len(extra)} files from the Pi5")
+                except RuntimeError as e:
+                    failed = True
+                    print(f"❌ Delete failed: {e}")
+
+    if failed:
+        print("❌ Image sync failed!")
+        return 1
+    print(f"✅ Sync complete in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Delta sync of portfolio images to the Pi5")
+    parser.add_argument("--local", default=LOCAL_PATH, help=f"folder to send (default {LOCAL_PATH})")
+    parser.add_argument("--remote", default=PI_PATH, help=f"images folder on the Pi5 (default {PI_PATH})")
+    parser.add_argument("--user", default=PI_USER)
+    parser.add_argument("--host", default=PI_HOST)
+    parser.add_argument("--key", default=SSH_KEY, help="SSH key ('' for the SSH default)")
+    parser.add_argument("--streams", type=int, default=STREAMS, help="parallel transfer streams")
+    parser.add_argument("--hash-workers", type=int, default=HASH_WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="show what would be sent")
+    parser.add_argument("--show", type=int, default=20, help="files listed by --dry-run")
+    parser.add_argument("--delete", action="store_true", help="remove Pi5 images that aren't on the Mac")
+    parser.add_argument("--verify", action="store_true", help="re-hash sent files on the Pi5 afterwards")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    commands = parser.add_subparsers(dest="command")
+    manifest_parser = commands.add_parser("manifest", help="print a gzipped JSON manifest of a folder")
+    manifest_parser.add_argument("root")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        stream=sys.stderr
+    )
+    if args.command == "manifest":
+        return print_manifest(os.path.abspath(args.root))
+    return sync(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Responsive image variants for the photo portfolio
+Builds the thumbnails/previews/large/full images that CategoryGallery.jsx
+loads from images/optimized/, plus WebP and AVIF versions of each width,
+in a pool of low-priority worker processes. Runs as a watch-folders.py
+stage, or on its own to backfill a tree:
+
+    python3 portfolio_thumbnails.py /mnt/Plex/photo-portfolio/images
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from portfolio_catalog import file_hash
+
+try:
+    from PIL import Image, ImageOps
+    try:
+        import pillow_avif  # noqa: F401  (registers AVIF on Pillow < 11.2)
+    except ImportError:
+        pass
+except ImportError:
+    Image = ImageOps = None
+
+# ==================== CONFIGURATION ====================
+OPTIMIZED_DIR_NAME = "optimized"    # Variants go to <root>/optimized/<size>/<relative path>
+VARIANT_SIZES = {                   # Size folder -> longest edge in pixels (never upscaled)
+    "thumbnails": 300,
+    "previews": 800,
+    "large": 1200,
+}
+VARIANT_FORMATS = ("webp", "avif")  # Written next to each JPEG variant, same name and width
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+WORKERS = max(1, (os.cpu_count() or 4) - 1)  # Leave a core for the web server
+NICENESS = 10                       # Worker process priority (0 normal, 19 lowest)
+STATE_DB_NAME = ".variants.db"      # Source signatures, kept inside the optimized dir
+SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff"}
+# =======================================================
+
+logger = logging.getLogger("portfolio_thumbnails")
+
+
+def avif_supported() -> bool:
+    return Image is not None and ".avif" in Image.registered_extensions()
+
+
+def variant_paths(optimized_dir: str, relative_path: str, formats=VARIANT_FORMATS,
+                  full_copy: bool = True) -> List[str]:
+    """Every file generated for one source image."""
+    stem = os.path.splitext(relative_path)[0]
+    paths = [os.path.join(optimized_dir, "full", relative_path)] if full_copy else []
+    for size in VARIANT_SIZES:
+        paths.append(os.path.join(optimized_dir, size, relative_path))
+        paths.extend(os.path.join(optimized_dir, size, f"{stem}.{fmt}") for fmt in formats)
+    return paths
+
+
+def _save_atomic(image, path: str, fmt: str, **options):
+    """Save through a temporary file so the web server never serves a partial image."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        image.save(tmp_path, fmt, **options)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _flatten(image):
+    """Composite a transparent image onto white, for formats without alpha."""
+    if image.mode != "RGBA":
+        return image
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def _init_worker(niceness: int):
+    """Lower the worker's priority so nginx and node stay responsive."""
+    try:
+        os.nice(niceness)
+    except OSError:
+        pass
+
+
+def render_variants(source: str, optimized_dir: str, relative_path: str,
+                    formats: Tuple[str, ...], full_copy: bool = True) -> Dict[str, float]:
+    """Decode one image once and write every variant; returns phase timings.
+
+    Runs in a worker process. JPEGs are decoded in draft mode, at the
+    smallest DCT scale that still covers the largest variant.
+    """
+    timings = {}
+    started = time.monotonic()
+    stem = os.path.splitext(relative_path)[0]
+    is_jpeg = os.path.splitext(source)[1].lower() in (".jpg", ".jpeg")
+
+    # Originals are served as-is for fullscreen unless portfolio_optimize.py writes "full"
+    if full_copy:
+        full_path = os.path.join(optimized_dir, "full", relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.tmp{os.getpid()}"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, full_path)
+    # The same-name variant keeps the source's format, as the gallery requests it by that name
+    same_name_format = Image.registered_extensions().get(os.path.splitext(source)[1].lower(), "JPEG")
+    same_name_options = {
+        "JPEG": {"quality": JPEG_QUALITY, "optimize": True, "progressive": True},
+        "PNG": {"optimize": True},
+        "WEBP": {"quality": WEBP_QUALITY, "method": 4},
+    }.get(same_name_format, {})
+
+    with Image.open(source) as image:
+        icc_profile = image.info.get("icc_profile")
+        if is_jpeg:
+            # Up to 8x less decode work; draft keeps at least the requested size
+            longest = max(VARIANT_SIZES.values())
+            scale = longest / max(image.size)
+            image.draft("RGB", (int(image.size[0] * scale) + 1, int(image.size[1] * scale) + 1))
+        image.load()
+        timings["decode"] = time.monotonic() - started
+        image = ImageOps.exif_transpose(image)
+        # Transparency survives into PNG/WebP/AVIF; JPEG output is flattened onto white
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        # Largest first, each size downscaled from the one before it
+        current = image
+        for size, edge in sorted(VARIANT_SIZES.items(), key=lambda item: -item[1]):
+            encode_started = time.monotonic()
+            if max(current.size) > edge:
+                current = current.copy()
+                current.thumbnail((edge, edge), Image.LANCZOS)
+            folder = os.path.join(optimized_dir, size)
+            _save_atomic(
+                _flatten(current) if same_name_format == "JPEG" else current,
+                os.path.join(folder, relative_path), same_name_format,
+                icc_profile=icc_profile, **same_name_options
+            )
+            # A WebP source's same-name variant already is the .webp one
+            if "webp" in formats and same_name_format != "WEBP":
+                _save_atomic(current, os.path.join(folder, f"{stem}.webp"), "WEBP",
+                             quality=WEBP_QUALITY, method=4, icc_profile=icc_profile)
+            if "avif" in formats:
+                _save_atomic(current, os.path.join(folder, f"{stem}.avif"), "AVIF",
+                             quality=AVIF_QUALITY, speed=8)
+            timings[f"encode_{size}"] = time.monotonic() - encode_started
+
+    timings["total"] = time.monotonic() - started
+    return timings
+
+
+def _variant_job(source: str, optimized_dir: str, relative_path: str, formats: Tuple[str, ...],
+                 previous: Optional[Tuple[int, int, str]],
+                 full_copy: bool = True) -> Tuple[str, Optional[Tuple[int, int, str]], Optional[dict], Optional[str]]:
+    """Worker entry point: skip unchanged sources, else render.
+
+    Returns (relative_path, signature, timings, error); timings is None
+    when the variants were already up to date.
+    """
+    try:
+        stat = os.stat(source)
+        missing = any(not os.path.exists(path)
+                      for path in variant_paths(optimized_dir, relative_path, formats, full_copy))
+        if previous is not None and not missing:
+            if (stat.st_size, stat.st_mtime_ns) == previous[:2]:
+                return relative_path, previous, None, None
+            content_hash = file_hash(source)
+            if content_hash == previous[2]:
+                # Touched or re-copied, same content
+                return relative_path, (stat.st_size, stat.st_mtime_ns, content_hash), None, None
+        else:
+            content_hash = file_hash(source)
+        timings = render_variants(source, optimized_dir, relative_path, formats, full_copy)
+        return relative_path, (stat.st_size, stat.st_mtime_ns, content_hash), timings, None
+    except Exception as e:
+        return relative_path, None, None, f"{type(e).__name__}: {e}"
+
+
+class VariantState:
+    """Source signatures (size, mtime, hash) of the images variants were built from."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT, built REAL)"
+        )
+        self.db.commit()
+
+    def get(self, relative_path: str) -> Optional[Tuple[int, int, str]]:
+        row = self.db.execute(
+            "SELECT size, mtime_ns, hash FROM sources WHERE path = ?", (relative_path,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def put_many(self, rows):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO sources (path, size, mtime_ns, hash, built) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        self.db.commit()
+
+    def delete_many(self, relative_paths):
+        self.db.executemany("DELETE FROM sources WHERE path = ?", [(p,) for p in relative_paths])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class ThumbnailStage:
+    """watch-folders.py stage that builds responsive variants for each batch."""
+
+    name = "thumbnails"
+
+    def __init__(self, workers: int = WORKERS, niceness: int = NICENESS, formats=VARIANT_FORMATS,
+                 optimized_dir: Optional[str] = None, full_copy: bool = True):
+        if Image is None:
+            raise RuntimeError("Pillow is required for thumbnails: pip3 install Pillow")
+        self.workers = max(1, workers)
+        self.niceness = niceness
+        self.formats = tuple(fmt for fmt in formats if fmt != "avif" or avif_supported())
+        if "avif" in formats and "avif" not in self.formats:
+            logger.warning("This Pillow has no AVIF support (pip3 install pillow-avif-plugin); skipping AVIF")
+        self.optimized_dir = optimized_dir
+        self.full_copy = full_copy
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.state: Optional[VariantState] = None
+
+    def _start(self, root: str):
+        if self.optimized_dir is None:
+            self.optimized_dir = os.path.join(root, OPTIMIZED_DIR_NAME)
+        if self.state is None:
+            self.state = VariantState(os.path.join(self.optimized_dir, STATE_DB_NAME))
+        if self.pool is None:
+            # spawn: the watcher runs observer threads, which fork() doesn't mix with
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.niceness,),
+            )
+
+    def process(self, batch):
+        self._start(batch.root)
+        started = time.monotonic()
+
+        sources = [
+            path for path in batch.files
+            if os.path.splitext(path)[1].lower() in SOURCE_EXTENSIONS
+        ]
+        futures = []
+        for path in sources:
+            relative_path = os.path.relpath(path, batch.root)
+            futures.append((path, self.pool.submit(
+                _variant_job, path, self.optimized_dir, relative_path, self.formats,
+                self.state.get(relative_path), self.full_copy
+            )))
+
+        built = skipped = failed = 0
+        rows = []
+        for path, future in futures:
+            relative_path, signature, timings, error = future.result()
+            if error is not None:
+                failed += 1
+                batch.failed.add(path)
+                logger.error(f"❌ Variants failed for {relative_path}: {error}")
+                continue
+            rows.append((relative_path, *signature, time.time()))
+            if timings is None:
+                skipped += 1
+            else:
+                built += 1
+                logger.debug(f"{relative_path}: {', '.join(f'{k} {v:.2f}s' for k, v in timings.items())}")
+        self.state.put_many(rows)
+
+        removed = self._remove(batch)
+        if sources or removed:
+            logger.info(
+                f"🖼️  Variants: {built} built, {skipped} unchanged, {failed} failed, "
+                f"{removed} removed in {time.monotonic() - started:.1f}s"
+            )
+
+    def _remove(self, batch) -> int:
+        """Delete the variants of removed source images."""
+        relative_paths = [os.path.relpath(path, batch.root) for path in batch.deleted]
+        for relative_path in relative_paths:
+            for path in variant_paths(self.optimized_dir, relative_path, VARIANT_FORMATS, full_copy=self.full_copy):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self.state.delete_many(relative_paths)
+        return len(relative_paths)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.state is not None:
+            self.state.close()
+            self.state = None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build responsive image variants for the portfolio")
+    parser.add_argument("root", help="portfolio images folder (variants go to <root>/optimized)")
+    parser.add_argument("paths", nargs="*", help="only these files or folders (default: whole tree)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"worker processes (default {WORKERS})")
+    parser.add_argument("--nice", type=int, default=NICENESS, help=f"worker niceness (default {NICENESS})")
+    parser.add_argument("--no-avif", action="store_true", help="skip AVIF variants")
+    parser.add_argument("--no-full", action="store_true",
+                        help="don't copy originals to optimized/full (portfolio_optimize.py writes them)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if Image is None:
+        print("Missing required packages. Install with:")
+        print("pip3 install Pillow pillow-avif-plugin")
+        return 1
+
+    root = os.path.abspath(args.root)
+    files = []
+    for start in [os.path.abspath(p) for p in args.paths] or [root]:
+        if os.path.isfile(start):
+            files.append(start)
+            continue
+        for dirpath, dirnames, filenames in os.walk(start):
+            dirnames[:] = [d for d in dirnames if d != OPTIMIZED_DIR_NAME and not d.startswith(".")]
+            files.extend(
+                os.path.join(dirpath, name) for name in filenames
+                if not name.startswith(".") and os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS
+            )
+
+    formats = tuple(fmt for fmt in VARIANT_FORMATS if not (args.no_avif and fmt == "avif"))
+    stage = ThumbnailStage(workers=args.workers, niceness=args.nice, formats=formats, full_copy=not args.no_full)
+    batch = SimpleNamespace(root=root, files=sorted(files), deleted=[], failed=set())
+    try:
+        stage.process(batch)
+    finally:
+        stage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
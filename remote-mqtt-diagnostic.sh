@@ -182,7 +182,7 @@ echo ""
 
 # Show current configuration
 echo -e "${BLUE}=== Current Configuration ===${NC}"
-CONFIG_CHECK=$(ssh "$BRIDGE_PI" "sudo grep -E '(MQTT_BROKER|MQTT_PORT|MQTT_USERNAME|SENSOR_MAC)' /opt/xiaomi-ble-bridge/xiaomi_ble_mqtt_bridge.py 2>/dev/null | grep -v '^#' | head -5" || echo "Configuration file not found")
+CONFIG_CHECK=$(ssh "$BRIDGE_PI" "sudo grep -E '(MQTT_BROKER|MQTT_PORT|MQTT_USERNAME|\"mac\")' /opt/xiaomi-ble-bridge/xiaomi_ble_mqtt_bridge.py 2>/dev/null | grep -v '^ *#' | head -8" || echo "Configuration file not found")
 echo "$CONFIG_CHECK"
 echo ""
 
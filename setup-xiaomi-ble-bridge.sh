@@ -88,10 +88,10 @@ echo "   exit"
 echo ""
 echo "2. Edit the configuration in $INSTALL_DIR/xiaomi_ble_mqtt_bridge.py:"
 echo "   sudo nano $INSTALL_DIR/xiaomi_ble_mqtt_bridge.py"
-echo "   - Set SENSOR_MAC to your sensor's MAC address"
+echo "   - Add each sensor's MAC address and name to SENSORS"
 echo "   - Set MQTT_BROKER to your Home Assistant Pi's IP"
 echo "   - Set MQTT_USERNAME and MQTT_PASSWORD if needed"
-echo "   - Adjust SENSOR_NAME and UPDATE_INTERVAL as desired"
+echo "   - Adjust UPDATE_INTERVAL as desired"
 echo ""
 echo "3. Enable and start the service:"
 echo "   sudo systemctl daemon-reload"
@@ -0,0 +1,24 @@
+"""
+Speedtest engine for the Pi5
+One code path for the cron speedtests: a connectivity check, a measurement
+backend (the speedtest library, the `python3 -m speedtest` subprocess, or
+ping for latency only) tried under a shared retry/backoff policy, and the
+Ubidots upload, spooled and batched by telemetry_uploader.py. Backends
+import their dependencies only when they run, so a cron run loads just
+what it uses.
+
+    python3 -m speedtest_engine
+    python3 -m speedtest_engine --backend subprocess --no-upload --json
+
+The old scripts (speedtest_simple.py, robust_speedtest_fixed.py, ...) are
+thin wrappers around this so the cron wrappers keep working.
+"""
+
+from .backends import BACKENDS, BackendUnavailable, MeasurementError, SpeedResult, get_backend
+from .engine import run_speedtest
+from .retry import RetryPolicy
+
+__all__ = [
+    "BACKENDS", "BackendUnavailable", "MeasurementError", "RetryPolicy", "SpeedResult",
+    "get_backend", "run_speedtest",
+]
@@ -0,0 +1,145 @@
+"""Measurement backends; each imports what it needs only when it runs."""
+
+import json
+import logging
+import subprocess
+import sys
+from typing import Dict, Optional, Type
+
+from . import config
+
+logger = logging.getLogger("speedtest_engine")
+
+
+class MeasurementError(Exception):
+    """A measurement failed; worth retrying."""
+
+
+class BackendUnavailable(MeasurementError):
+    """The backend can't run here (missing package or command); retrying won't help."""
+
+
+class SpeedResult:
+    """One measurement. Download/upload in Mbps and ping in ms, None when not measured."""
+
+    def __init__(self, download: Optional[float], upload: Optional[float], ping: Optional[float],
+                 backend: str, server: Optional[str] = None):
+        self.download = download
+        self.upload = upload
+        self.ping = ping
+        self.backend = backend
+        self.server = server
+        self.latency: Dict[str, dict] = {}  # Per-target ping statistics, when measured
+
+    def payload(self) -> Dict[str, float]:
+        """Ubidots variables for the values that were measured."""
+        values = {"Download": self.download, "Upload": self.upload, "Ping": self.ping}
+        return {name: value for name, value in values.items() if value is not None}
+
+    def as_dict(self) -> dict:
+        return {"download": self.download, "upload": self.upload, "ping": self.ping,
+                "backend": self.backend, "server": self.server, "latency": self.latency}
+
+    def __repr__(self) -> str:
+        return (f"SpeedResult({self.download} Mbps down, {self.upload} Mbps up, {self.ping} ms, "
+                f"{self.backend})")
+
+
+def _mbps(bits_per_second: float) -> float:
+    return round(bits_per_second / 1_000_000, 2)
+
+
+class LibraryBackend:
+    """The speedtest library (pip3 install speedtest-cli), in this process."""
+
+    name = "library"
+
+    def __init__(self, secure: bool = False):
+        self.secure = secure
+
+    def measure(self) -> SpeedResult:
+        try:
+            import speedtest
+        except ImportError:
+            raise BackendUnavailable("speedtest library not installed (pip3 install speedtest-cli)")
+        try:
+            st = speedtest.Speedtest(secure=self.secure)
+            st.timeout = config.SPEEDTEST_TIMEOUT
+            server = st.get_best_server()
+            logger.info(f"Server: {server.get('sponsor')} ({server.get('country')})")
+            logger.info("Running download test...")
+            download = _mbps(st.download())
+            logger.info("Running upload test...")
+            upload = _mbps(st.upload())
+        except speedtest.SpeedtestException as e:
+            raise MeasurementError(f"{type(e).__name__}: {e}")
+        return SpeedResult(download, upload, round(st.results.ping, 2), self.name, server.get("sponsor"))
+
+
+class SubprocessBackend:
+    """`python3 -m speedtest --json` in a child process, for when the library misbehaves in-process."""
+
+    name = "subprocess"
+
+    def __init__(self, secure: bool = False):
+        self.secure = secure
+
+    def measure(self) -> SpeedResult:
+        command = [sys.executable, "-m", "speedtest", "--json", "--timeout", str(config.SPEEDTEST_TIMEOUT)]
+        if self.secure:
+            command.append("--secure")
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=config.SUBPROCESS_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise MeasurementError(f"no result after {config.SUBPROCESS_TIMEOUT}s")
+        if result.returncode != 0:
+            if "No module named speedtest" in result.stderr:
+                raise BackendUnavailable("speedtest module not installed (pip3 install speedtest-cli)")
+            raise MeasurementError(result.stderr.strip().splitlines()[-1] if result.stderr.strip()
+                                   else f"exit code {result.returncode}")
+        try:
+            data = json.loads(result.stdout)
+        except ValueError:
+            raise MeasurementError(f"unreadable output: {result.stdout[:200]!r}")
+        server = data.get("server") or {}
+        return SpeedResult(_mbps(data.get("download", 0)), _mbps(data.get("upload", 0)),
+                           round(data.get("ping", 0), 2), self.name, server.get("sponsor"))
+
+
+class PingBackend:
+    """Latency only: every PING_TARGETS host pinged at once, the fastest one reported."""
+
+    name = "ping"
+
+    def __init__(self, secure: bool = False):
+        pass
+
+    def measure(self) -> SpeedResult:
+        from .ping import best, ping_targets
+
+        try:
+            stats = ping_targets()
+        except FileNotFoundError:
+            raise BackendUnavailable("ping command not found")
+        for target_stats in stats.values():
+            logger.info(f"Ping {target_stats}")
+        fastest = best(stats)
+        if fastest is None:
+            raise MeasurementError("no ping target answered")
+        result = SpeedResult(None, None, round(fastest.avg, 2), self.name, fastest.target)
+        result.latency = {target: target_stats.as_dict() for target, target_stats in stats.items()}
+        return result
+
+
+BACKENDS: Dict[str, Type] = {
+    LibraryBackend.name: LibraryBackend,
+    SubprocessBackend.name: SubprocessBackend,
+    PingBackend.name: PingBackend,
+}
+
+
+def get_backend(name: str, secure: bool = False):
+    try:
+        return BACKENDS[name](secure=secure)
+    except KeyError:
+        raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(BACKENDS)}")
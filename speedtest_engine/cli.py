@@ -0,0 +1,62 @@
+"""Command line entry point: python3 -m speedtest_engine."""
+
+import argparse
+import json
+import logging
+import sys
+from typing import List, Optional
+
+from . import config
+from .backends import BACKENDS, BackendUnavailable
+from .connectivity import check_internet
+from .engine import run_speedtest
+from .history import History, main as history_main
+from .retry import RetryPolicy
+from .upload import post_ubidots
+
+logger = logging.getLogger("speedtest_engine")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["history"]:
+        return history_main(argv[1:])
+
+    parser = argparse.ArgumentParser(prog="speedtest_engine", description="Measure the connection and post it to Ubidots")
+    parser.add_argument("--backend", action="append", choices=list(BACKENDS),
+                        help=f"backend to try, repeatable, in order (default: {', '.join(config.DEFAULT_BACKENDS)})")
+    parser.add_argument("--secure", action="store_true", help="talk to speedtest servers over HTTPS")
+    parser.add_argument("--attempts", type=int, default=config.RETRY_ATTEMPTS,
+                        help=f"tries per backend (default {config.RETRY_ATTEMPTS})")
+    parser.add_argument("--no-check", action="store_true", help="skip the connectivity check")
+    parser.add_argument("--check-only", action="store_true", help="only check connectivity (exit 1 when offline)")
+    parser.add_argument("--no-upload", action="store_true", help="measure only, don't post to Ubidots")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--no-history", action="store_true", help="don't add the result to the local history")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="[%(asctime)s] %(message)s", stream=sys.stdout)
+    if args.check_only:
+        return 0 if check_internet() else 1
+    logger.info("=== Speedtest ===")
+    policy = RetryPolicy(attempts=args.attempts, give_up_on=(BackendUnavailable,))
+    result = run_speedtest(args.backend or config.DEFAULT_BACKENDS, secure=args.secure,
+                           check_connectivity=not args.no_check, policy=policy)
+    if not args.no_history:
+        history = History()
+        try:
+            if result is None:
+                history.record_failure("connectivity check or every backend failed")
+            else:
+                history.record(result)
+        finally:
+            history.close()
+    if result is None:
+        return 1
+    if args.json:
+        print(json.dumps(result.as_dict()))
+    if args.no_upload:
+        return 0
+    return 0 if post_ubidots(result.payload()) else 1
@@ -0,0 +1,39 @@
+"""Settings shared by the speedtest engine modules."""
+
+import os
+
+# ==================== CONFIGURATION ====================
+# Ubidots device the results are posted to
+UBIDOTS_TOKEN = os.environ.get("UBIDOTS_TOKEN", "BBFF-lJ6UBSIbrGd1qSNf0q7gxYOAcqUl9U")
+UBIDOTS_DEVICE = "raspberry-pi"
+UBIDOTS_API = "http://industrial.api.ubidots.com/api/v1.6"  # Spooling and retries: telemetry_uploader.py
+
+# Local history of every run (next to the scripts, like speedtest.log)
+HISTORY_PATH = os.environ.get(
+    "SPEEDTEST_HISTORY",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "speedtest_history.db"),
+)
+
+# Measurement
+DEFAULT_BACKENDS = ("library", "subprocess")  # Tried in order until one succeeds
+SPEEDTEST_TIMEOUT = 30              # Seconds per speedtest HTTP request
+SUBPROCESS_TIMEOUT = 120            # Seconds for a whole `python3 -m speedtest` run
+
+# Retries: attempt n waits min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**n), minus up to RETRY_JITTER of it
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 10.0
+RETRY_MAX_DELAY = 60.0
+RETRY_JITTER = 0.5
+
+# Connectivity check: all probes run at once, the first HTTP 204 ends it
+CONNECTIVITY_HTTP = ("http://connectivitycheck.gstatic.com/generate_204", "http://cp.cloudflare.com/")
+CONNECTIVITY_TCP = (("1.1.1.1", 443), ("8.8.8.8", 53))  # By IP address: routing without DNS
+CONNECTIVITY_DNS = ("www.google.com", "one.one.one.one")
+CONNECTIVITY_TIMEOUT = 3            # Seconds per probe
+
+# Ping: every target at once (latency when the backend doesn't report it)
+PING_TARGETS = ("8.8.8.8", "1.1.1.1", "208.67.222.222")  # Google, Cloudflare, OpenDNS
+PING_COUNT = 5                      # Echo requests per target
+PING_INTERVAL = 0.2                 # Seconds between them (the least ping allows without root)
+PING_WAIT = 2                       # Seconds to wait for the last reply
+# =======================================================
@@ -0,0 +1,121 @@
+"""Is the internet reachable before spending a minute on a speedtest?
+
+DNS lookups, TCP connects to fixed IPs and HTTP requests to endpoints that
+answer an empty 204 all run at once; the check returns as soon as one HTTP
+probe succeeds (which needs every layer), normally in one round trip. When
+none does, the other probes tell which layer is broken
+(python3 -m speedtest_engine --check-only).
+"""
+
+import http.client
+import logging
+import queue
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from . import config
+
+logger = logging.getLogger("speedtest_engine")
+
+LAYERS = ("dns", "routing", "http")
+
+
+def probe_dns(host: str, timeout: float) -> str:
+    # getaddrinfo has no timeout of its own; the caller stops waiting at the deadline
+    address = socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)[0][4][0]
+    return f"{host} -> {address}"
+
+
+def probe_tcp(address: Tuple[str, int], timeout: float) -> str:
+    with socket.create_connection(address, timeout=timeout):
+        return f"connected to {address[0]}:{address[1]}"
+
+
+def probe_http(url: str, timeout: float) -> str:
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    try:
+        connection.request("GET", parts.path or "/", headers={"Connection": "close"})
+        status = connection.getresponse().status
+    finally:
+        connection.close()
+    if status != 204:
+        # A captive portal or proxy answering in place of the real endpoint
+        raise ConnectionError(f"HTTP {status} instead of 204")
+    return f"{url} answered 204"
+
+
+class Connectivity:
+    """Outcome of a check: ok, or the first layer that failed, plus every probe result so far."""
+
+    def __init__(self, ok: bool, layer: Optional[str], via: Optional[str], elapsed: float,
+                 results: Dict[str, List[Tuple[str, bool, str]]]):
+        self.ok = ok
+        self.layer = layer
+        self.via = via
+        self.elapsed = elapsed
+        self.results = results
+
+    def describe(self) -> str:
+        if self.ok:
+            return f"online via {self.via} ({self.elapsed * 1000:.0f} ms)"
+        reasons = "; ".join(f"{target}: {detail}" for target, success, detail in self.results.get(self.layer, [])
+                            if not success)
+        return {
+            "dns": "DNS lookups fail, though IP routing works",
+            "routing": "no route out: TCP connects to public IPs fail",
+            "http": "DNS and routing work, but HTTP probes fail",
+        }.get(self.layer, "no probe answered") + (f" ({reasons})" if reasons else "")
+
+
+def check_connectivity(timeout: float = config.CONNECTIVITY_TIMEOUT) -> Connectivity:
+    """Race every probe; return at the first HTTP success or when all are done or timed out."""
+    probes: List[Tuple[str, str, Callable, object]] = (
+        [("dns", host, probe_dns, host) for host in config.CONNECTIVITY_DNS]
+        + [("routing", f"{host}:{port}", probe_tcp, (host, port)) for host, port in config.CONNECTIVITY_TCP]
+        + [("http", url, probe_http, url) for url in config.CONNECTIVITY_HTTP]
+    )
+    started = time.monotonic()
+    answers: "queue.Queue" = queue.Queue()
+
+    def run(layer: str, target: str, function: Callable, argument):
+        try:
+            answers.put((layer, target, True, function(argument, timeout)))
+        except Exception as e:
+            answers.put((layer, target, False, str(e) or type(e).__name__))
+
+    for probe in probes:
+        # Daemon threads: a probe stuck in DNS can't hold up the check or the exit
+        threading.Thread(target=run, args=probe, daemon=True).start()
+
+    results: Dict[str, List[Tuple[str, bool, str]]] = {layer: [] for layer in LAYERS}
+    deadline = started + timeout + 0.5
+    for _ in probes:
+        try:
+            layer, target, success, detail = answers.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        results[layer].append((target, success, detail))
+        logger.debug(f"{layer} probe {target}: {'ok' if success else 'failed'}, {detail}")
+        if success and layer == "http":
+            return Connectivity(True, None, target, time.monotonic() - started, results)
+
+    elapsed = time.monotonic() - started
+    for layer in ("routing", "dns"):
+        if not any(success for _, success, _ in results[layer]):
+            return Connectivity(False, layer, None, elapsed, results)
+    return Connectivity(False, "http", None, elapsed, results)
+
+
+def check_internet() -> bool:
+    """True when the internet is usable; logs the failed layer otherwise."""
+    result = check_connectivity()
+    if result.ok:
+        logger.info(f"✅ Internet connectivity confirmed: {result.describe()}")
+    else:
+        logger.error(f"❌ No internet connectivity: {result.describe()}")
+    return result.ok
+
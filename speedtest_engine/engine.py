@@ -0,0 +1,47 @@
+"""The speedtest run: connectivity check, backends in order, ping fill-in."""
+
+import logging
+from typing import Iterable, Optional
+
+from . import config
+from .backends import BackendUnavailable, MeasurementError, SpeedResult, get_backend
+from .connectivity import check_internet
+from .retry import RetryPolicy
+
+logger = logging.getLogger("speedtest_engine")
+
+
+def run_speedtest(backends: Iterable[str] = config.DEFAULT_BACKENDS, secure: bool = False,
+                  check_connectivity: bool = True, policy: Optional[RetryPolicy] = None) -> Optional[SpeedResult]:
+    """Measure with the first backend that succeeds (each under the retry policy); None if all fail."""
+    policy = policy or RetryPolicy(give_up_on=(BackendUnavailable,))
+    if check_connectivity and not check_internet():
+        return None
+
+    result = None
+    for name in backends:
+        backend = get_backend(name, secure)
+        logger.info(f"Measuring with the {backend.name} backend...")
+        try:
+            result = policy.call(backend.measure, f"{backend.name} backend")
+            break
+        except BackendUnavailable as e:
+            logger.warning(f"{backend.name} backend unavailable: {e}")
+        except Exception:
+            # policy.call has logged it
+            continue
+    if result is None:
+        logger.error("❌ Every backend failed")
+        return None
+
+    if result.backend != "ping":
+        # Latency per target for the record; the ping figure too when the backend had none
+        try:
+            latency = get_backend("ping").measure()
+            result.latency = latency.latency
+            if result.ping is None:
+                result.ping = latency.ping
+        except MeasurementError as e:
+            logger.warning(f"No ping: {e}")
+    logger.info(f"Results: {result.download} Mbps down, {result.upload} Mbps up, {result.ping} ms ping")
+    return result
@@ -0,0 +1,172 @@
+"""Local history of every speedtest run.
+
+Each run is appended to an SQLite table indexed by time (a failed run as
+a row with an error and no figures), so nothing depends on the Ubidots
+POST getting through, and weeks of results can be queried or rolled up
+into hourly/daily percentiles straight from the Pi:
+
+    python3 -m speedtest_engine history --since 7d
+    python3 -m speedtest_engine history --since 30d --rollup daily --metric download
+"""
+
+import argparse
+import json
+import math
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from . import config
+from .backends import SpeedResult
+
+METRICS = ("download", "upload", "ping", "jitter", "loss")
+ROLLUPS = {"hourly": "%Y-%m-%d %H:00", "daily": "%Y-%m-%d"}
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted values."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def parse_time(text: str) -> float:
+    """Epoch seconds from "7d", "12h", "30m" (that long ago) or an ISO date/time (local)."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([dhm])", text.strip())
+    if match:
+        return time.time() - float(match.group(1)) * {"d": 86400, "h": 3600, "m": 60}[match.group(2)]
+    return datetime.fromisoformat(text).timestamp()
+
+
+class History:
+    """Speedtest results by time."""
+
+    def __init__(self, path: str = config.HISTORY_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id INTEGER PRIMARY KEY, ts REAL NOT NULL, download REAL, upload REAL, ping REAL, "
+            "jitter REAL, loss REAL, backend TEXT, server TEXT, latency TEXT, error TEXT)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_ts ON results (ts)")
+        self.db.commit()
+
+    def record(self, result: SpeedResult, ts: Optional[float] = None):
+        """Append a measurement; jitter and loss come from the ping target that was reported."""
+        fastest = min((stats for stats in result.latency.values() if stats.get("avg") is not None),
+                      key=lambda stats: stats["avg"], default={})
+        with self.db:
+            self.db.execute(
+                "INSERT INTO results (ts, download, upload, ping, jitter, loss, backend, server, latency) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ts or time.time(), result.download, result.upload, result.ping, fastest.get("jitter"),
+                 fastest.get("loss"), result.backend, result.server,
+                 json.dumps(result.latency) if result.latency else None)
+            )
+
+    def record_failure(self, error: str, ts: Optional[float] = None):
+        with self.db:
+            self.db.execute("INSERT INTO results (ts, error) VALUES (?, ?)", (ts or time.time(), error))
+
+    def results(self, since: Optional[float] = None, until: Optional[float] = None) -> List[dict]:
+        """Rows in [since, until), oldest first."""
+        cursor = self.db.execute(
+            "SELECT ts, download, upload, ping, jitter, loss, backend, server, error FROM results "
+            "WHERE ts >= ? AND ts < ? ORDER BY ts",
+            (since or 0, until or math.inf)
+        )
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def rollup(self, period: str, metrics: Iterable[str] = ("download", "upload", "ping"),
+               since: Optional[float] = None, until: Optional[float] = None) -> List[dict]:
+        """Per local hour or day: runs, failures and count/min/p50/p95/max/avg of each metric."""
+        metrics = list(metrics)
+        cursor = self.db.execute(
+            f"SELECT strftime(?, ts, 'unixepoch', 'localtime') AS bucket, error, {', '.join(metrics)} "
+            f"FROM results WHERE ts >= ? AND ts < ? ORDER BY ts",
+            (ROLLUPS[period], since or 0, until or math.inf)
+        )
+        buckets: Dict[str, dict] = {}
+        for bucket, error, *values in cursor:
+            entry = buckets.setdefault(bucket, {"period": bucket, "runs": 0, "failures": 0,
+                                                "values": {metric: [] for metric in metrics}})
+            entry["runs"] += 1
+            entry["failures"] += error is not None
+            for metric, value in zip(metrics, values):
+                if value is not None:
+                    entry["values"][metric].append(value)
+        rows = []
+        for entry in buckets.values():
+            values = entry.pop("values")
+            for metric in metrics:
+                ordered = sorted(values[metric])
+                entry[metric] = {
+                    "count": len(ordered),
+                    "min": ordered[0] if ordered else None,
+                    "p50": percentile(ordered, 50),
+                    "p95": percentile(ordered, 95),
+                    "max": ordered[-1] if ordered else None,
+                    "avg": round(sum(ordered) / len(ordered), 2) if ordered else None,
+                }
+            rows.append(entry)
+        return rows
+
+    def close(self):
+        self.db.close()
+
+
+def _cell(value) -> str:
+    return "-" if value is None else f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="speedtest_engine history", description="Show the local speedtest history")
+    parser.add_argument("--since", type=parse_time, default=parse_time("7d"), help='e.g. 7d, 12h, 2025-10-01 (default 7d)')
+    parser.add_argument("--until", type=parse_time)
+    parser.add_argument("--rollup", choices=list(ROLLUPS), help="percentiles per hour or day instead of every run")
+    parser.add_argument("--metric", action="append", choices=METRICS,
+                        help="metric(s) to roll up (default download, upload, ping)")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--db", default=config.HISTORY_PATH, help=f"history database (default {config.HISTORY_PATH})")
+    args = parser.parse_args(argv)
+
+    history = History(args.db)
+    try:
+        if args.rollup:
+            metrics = args.metric or ["download", "upload", "ping"]
+            rows = history.rollup(args.rollup, metrics, args.since, args.until)
+            if args.json:
+                print(json.dumps(rows, indent=2))
+                return 0
+            for row in rows:
+                figures = "  ".join(
+                    f"{metric} p50 {_cell(row[metric]['p50'])} p95 {_cell(row[metric]['p95'])}" for metric in metrics
+                )
+                print(f"{row['period']:16}  {row['runs']:3d} run(s) {row['failures']:2d} failed  {figures}")
+            return 0
+
+        rows = history.results(args.since, args.until)
+        if args.json:
+            print(json.dumps(rows, indent=2))
+            return 0
+        for row in rows:
+            when = datetime.fromtimestamp(row["ts"]).strftime("%Y-%m-%d %H:%M")
+            if row["error"]:
+                print(f"{when}  failed: {row['error']}")
+            else:
+                print(f"{when}  {_cell(row['download']):>7} down  {_cell(row['upload']):>7} up  "
+                      f"{_cell(row['ping']):>6} ms  jitter {_cell(row['jitter'])}  loss {_cell(row['loss'])}")
+        print(f"📊 {len(rows)} run(s)")
+        return 0
+    finally:
+        history.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Latency to several targets at once.
+
+Every target gets its own `ping` child process, all started together under
+asyncio, and each reply line is parsed as it arrives; so every RTT sample
+is kept, and all targets together take about as long as one ping run.
+"""
+
+import asyncio
+import logging
+import math
+import re
+from typing import Dict, Iterable, List, Optional
+
+from . import config
+
+logger = logging.getLogger("speedtest_engine")
+
+# iputils: "64 bytes from 8.8.8.8: icmp_seq=1 ttl=117 time=11.9 ms"; busybox: "seq=0 ttl=117 time=11.940 ms"
+REPLY_PATTERN = re.compile(r"seq=(\d+)\b.*?time[=<]([\d.]+) ?ms")
+
+
+class PingStats:
+    """RTT samples (ms) of one target and the summary figures drawn from them."""
+
+    def __init__(self, target: str, sent: int, samples: List[float], error: Optional[str] = None):
+        self.target = target
+        self.sent = sent
+        self.samples = samples
+        self.error = error
+
+    @property
+    def received(self) -> int:
+        return len(self.samples)
+
+    @property
+    def loss(self) -> float:
+        """Lost share of the echo requests, 0..1."""
+        return 1 - min(self.received, self.sent) / self.sent if self.sent else 1.0
+
+    @property
+    def min(self) -> Optional[float]:
+        return min(self.samples) if self.samples else None
+
+    @property
+    def avg(self) -> Optional[float]:
+        return sum(self.samples) / len(self.samples) if self.samples else None
+
+    @property
+    def p95(self) -> Optional[float]:
+        """95th percentile, nearest rank."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+    @property
+    def jitter(self) -> Optional[float]:
+        """Mean difference between consecutive samples."""
+        if len(self.samples) < 2:
+            return 0.0 if self.samples else None
+        return sum(abs(b - a) for a, b in zip(self.samples, self.samples[1:])) / (len(self.samples) - 1)
+
+    def as_dict(self) -> dict:
+        values = {"min": self.min, "avg": self.avg, "p95": self.p95, "jitter": self.jitter}
+        summary = {name: round(value, 2) if value is not None else None for name, value in values.items()}
+        summary.update(target=self.target, sent=self.sent, received=self.received, loss=round(self.loss, 3))
+        if self.error:
+            summary["error"] = self.error
+        return summary
+
+    def __str__(self) -> str:
+        if not self.samples:
+            return f"{self.target}: no replies ({self.error or '100% loss'})"
+        return (f"{self.target}: min {self.min:.1f} / avg {self.avg:.1f} / p95 {self.p95:.1f} ms, "
+                f"jitter {self.jitter:.1f} ms, {self.loss:.0%} loss")
+
+
+async def ping_target(target: str, count: int = config.PING_COUNT, interval: float = config.PING_INTERVAL,
+                      wait: float = config.PING_WAIT) -> PingStats:
+    """Ping one target, collecting each reply's RTT as its line arrives."""
+    command = ["ping", "-n", "-c", str(count), "-i", str(interval), "-W", str(int(math.ceil(wait))), target]
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    replies: Dict[int, float] = {}
+
+    async def read_replies():
+        async for line in process.stdout:
+            match = REPLY_PATTERN.search(line.decode(errors="replace"))
+            if match:
+                replies.setdefault(int(match.group(1)), float(match.group(2)))    # Ignores DUP! replies
+
+    try:
+        await asyncio.wait_for(read_replies(), timeout=count * interval + wait + 5)
+        await process.wait()
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+    error = None
+    if not replies:
+        stderr = (await process.stderr.read()).decode(errors="replace").strip()
+        error = stderr.splitlines()[-1] if stderr else f"exit code {process.returncode}"
+    return PingStats(target, count, [replies[seq] for seq in sorted(replies)], error)
+
+
+async def ping_all(targets: Iterable[str], **options) -> Dict[str, PingStats]:
+    targets = list(targets)
+    results = await asyncio.gather(*(ping_target(target, **options) for target in targets))
+    return dict(zip(targets, results))
+
+
+def ping_targets(targets: Iterable[str] = config.PING_TARGETS, **options) -> Dict[str, PingStats]:
+    """Ping every target concurrently; raises FileNotFoundError without a ping command."""
+    return asyncio.run(ping_all(targets, **options))
+
+
+def best(stats: Dict[str, PingStats]) -> Optional[PingStats]:
+    """The answering target with the lowest average RTT."""
+    answered = [result for result in stats.values() if result.samples]
+    return min(answered, key=lambda result: result.avg) if answered else None
@@ -0,0 +1,45 @@
+"""Retry with exponential backoff and jitter, shared by every backend."""
+
+import logging
+import random
+import time
+from typing import Callable, Tuple, Type
+
+from . import config
+
+logger = logging.getLogger("speedtest_engine")
+
+
+class RetryPolicy:
+    """Call a function up to `attempts` times, sleeping a growing, jittered delay in between."""
+
+    def __init__(self, attempts: int = config.RETRY_ATTEMPTS, base_delay: float = config.RETRY_BASE_DELAY,
+                 max_delay: float = config.RETRY_MAX_DELAY, jitter: float = config.RETRY_JITTER,
+                 give_up_on: Tuple[Type[BaseException], ...] = ()):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.give_up_on = give_up_on
+        self.sleep = time.sleep
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number `attempt` (0-based)."""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+    def call(self, function: Callable, description: str):
+        """Return function()'s result, retrying on exceptions; re-raises the last one."""
+        for attempt in range(self.attempts):
+            try:
+                return function()
+            except self.give_up_on:
+                raise
+            except Exception as e:
+                if attempt == self.attempts - 1:
+                    logger.error(f"❌ {description} failed after {self.attempts} attempt(s): {e}")
+                    raise
+                wait = self.delay(attempt)
+                logger.warning(f"{description} attempt {attempt + 1}/{self.attempts} failed: {e}; "
+                               f"retrying in {wait:.0f}s")
+                self.sleep(wait)
@@ -0,0 +1,34 @@
+"""Post results to Ubidots through the shared telemetry uploader."""
+
+import logging
+import time
+from typing import Dict, Optional
+
+from . import config
+
+logger = logging.getLogger("speedtest_engine")
+
+
+def post_ubidots(payload: Dict[str, float], ts: Optional[float] = None) -> bool:
+    """Spool the variables for the Ubidots device and send the backlog.
+
+    True once the reading is safely spooled, even if the upload itself has
+    to wait for the next run: re-running the speedtest wouldn't help.
+    """
+    from telemetry_uploader import TelemetryUploader
+
+    logger.info(f"Sending to Ubidots: {payload}")
+    try:
+        uploader = TelemetryUploader(token=config.UBIDOTS_TOKEN, api_url=config.UBIDOTS_API)
+    except RuntimeError as e:
+        logger.error(f"❌ {e}")
+        return False
+    try:
+        if not uploader.send(config.UBIDOTS_DEVICE, payload, ts or time.time()):
+            logger.warning("⚠️  Ubidots upload deferred; the reading stays spooled")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Couldn't spool the reading: {e}")
+        return False
+    finally:
+        uploader.close()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Telemetry uploader for Ubidots
+Every reading is first written to a local SQLite spool, then the backlog is
+sent in bulk (one request per device, every variable with its timestamps)
+over a pooled HTTP session. When Ubidots is unreachable or rate-limits,
+readings stay spooled and the next flush resumes, honouring Retry-After
+even across separate cron runs; nothing is lost to a network drop. Used by
+speedtest_engine, and usable by anything else that posts metrics:
+
+    python3 telemetry_uploader.py send raspberry-pi Download=94.2 Upload=19.8
+    python3 telemetry_uploader.py flush
+    python3 telemetry_uploader.py status
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = HTTPAdapter = None
+
+# ==================== CONFIGURATION ====================
+API_URL = "http://industrial.api.ubidots.com/api/v1.6"
+TOKEN = os.environ.get("UBIDOTS_TOKEN")     # Callers may pass their own
+SPOOL_PATH = os.environ.get(
+    "TELEMETRY_SPOOL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetry_spool.db")
+)
+REQUEST_TIMEOUT = 30                # Seconds per request
+BATCH_SIZE = 500                    # Readings per bulk request
+ATTEMPTS = 3                        # Tries per flush before leaving the rest for the next one
+BACKOFF_BASE = 5.0                  # Seconds; doubles per failed attempt, with jitter
+BACKOFF_MAX = 3600.0
+MAX_INLINE_WAIT = 60.0              # Longer waits are left to the next flush instead of sleeping
+SPOOL_MAX_AGE = 30 * 86400          # Seconds a reading may wait before it is dropped
+SPOOL_MAX_READINGS = 100_000
+# =======================================================
+
+logger = logging.getLogger("telemetry_uploader")
+
+# Statuses worth retrying; anything else 4xx means the batch itself is bad
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delay in seconds or an HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TelemetrySpool:
+    """Readings waiting to be sent, oldest first, plus the earliest time to try again."""
+
+    def __init__(self, path: str = SPOOL_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, device TEXT NOT NULL, variable TEXT NOT NULL, "
+            "value REAL NOT NULL, ts REAL NOT NULL, context TEXT)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value REAL)")
+        self.db.commit()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def append(self, device: str, values: Dict[str, float], ts: float, context: Optional[dict] = None):
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO readings (device, variable, value, ts, context) VALUES (?, ?, ?, ?, ?)",
+                [(device, variable, float(value), ts, json.dumps(context) if context else None)
+                 for variable, value in values.items() if value is not None]
+            )
+        self._evict()
+
+    def _evict(self):
+        with self.db:
+            dropped = self.db.execute("DELETE FROM readings WHERE ts < ?", (time.time() - SPOOL_MAX_AGE,)).rowcount
+            dropped += self.db.execute(
+                "DELETE FROM readings WHERE id <= (SELECT id FROM readings ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (SPOOL_MAX_READINGS,)
+            ).rowcount
+        if dropped:
+            logger.warning(f"Dropped {dropped} spooled reading(s) over the spool limits")
+
+    def peek(self, limit: int) -> List[Tuple[int, str, str, float, float, Optional[str]]]:
+        return list(self.db.execute(
+            "SELECT id, device, variable, value, ts, context FROM readings ORDER BY id LIMIT ?", (limit,)
+        ))
+
+    def remove(self, ids: List[int]):
+        with self.db:
+            self.db.executemany("DELETE FROM readings WHERE id = ?", [(i,) for i in ids])
+
+    def get_state(self, key: str, default: float = 0.0) -> float:
+        row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key: str, value: float):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        self.db.close()
+
+
+class TelemetryUploader:
+    """Spool readings and send the backlog to Ubidots in bulk over one pooled session."""
+
+    def __init__(self, token: Optional[str] = TOKEN, api_url: str = API_URL, spool_path: str = SPOOL_PATH):
+        if requests is None:
+            raise RuntimeError("requests is required for uploads: pip3 install requests")
+        if not token:
+            raise RuntimeError("No Ubidots token: set UBIDOTS_TOKEN or pass one")
+        self.api_url = api_url.rstrip("/")
+        self.spool = TelemetrySpool(spool_path)
+        self.session = requests.Session()
+        self.session.headers.update({"X-Auth-Token": token, "Content-Type": "application/json"})
+        # Our own retry policy below; the adapter only pools connections
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0))
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0))
+
+    def send(self, device: str, values: Dict[str, float], ts: Optional[float] = None,
+             context: Optional[dict] = None) -> bool:
+        """Spool one reading, then flush; True when the spool was emptied."""
+        self.spool.append(device, values, ts or time.time(), context)
+        return self.flush()
+
+    def flush(self) -> bool:
+        """Send spooled readings oldest first; True when nothing is left."""
+        not_before = self.spool.get_state("not_before")
+        if time.time() < not_before:
+            logger.info(f"Uploads paused for {not_before - time.time():.0f}s more; "
+                        f"{len(self.spool)} reading(s) spooled")
+            return False
+
+        failures = int(self.spool.get_state("failures"))
+        attempts = 0
+        while True:
+            rows = self.spool.peek(BATCH_SIZE)
+            if not rows:
+                if failures:
+                    self.spool.set_state("failures", 0)
+                return True
+            by_device: Dict[str, list] = {}
+            for row in rows:
+                by_device.setdefault(row[1], []).append(row)
+
+            # Each device's readings are sent, dropped or kept on their own
+            wait = None
+            retry = False
+            for device, device_rows in by_device.items():
+                outcome, wait = self._post(device, device_rows)
+                if outcome == "retry":
+                    retry = True
+                    break
+                # "rejected": retrying the same readings would fail forever
+                self.spool.remove([row[0] for row in device_rows])
+                if outcome == "sent":
+                    failures = attempts = 0
+            if not retry:
+                continue
+
+            failures += 1
+            attempts += 1
+            if wait is None:
+                wait = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1)) * (0.5 + random.random() / 2)
+            if attempts >= ATTEMPTS or wait > MAX_INLINE_WAIT:
+                self.spool.set_state("failures", failures)
+                self.spool.set_state("not_before", time.time() + wait)
+                logger.warning(f"⏳ {len(self.spool)} reading(s) kept for later; next try in {wait:.0f}s")
+                return False
+            logger.info(f"Retrying upload in {wait:.0f}s")
+            time.sleep(wait)
+
+    def _post(self, device: str, rows) -> Tuple[str, Optional[float]]:
+        """Send one device's readings: ("sent" | "retry" | "rejected", Retry-After seconds or None)."""
+        body: Dict[str, list] = {}
+        for _, _, variable, value, ts, context in rows:
+            dot = {"value": value, "timestamp": int(ts * 1000)}
+            if context:
+                dot["context"] = json.loads(context)
+            body.setdefault(variable, []).append(dot)
+
+        try:
+            response = self.session.post(f"{self.api_url}/devices/{device}/", json=body, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            logger.warning(f"Ubidots unreachable: {e}")
+            return "retry", None
+        if response.status_code in RETRY_STATUSES:
+            logger.warning(f"Ubidots answered {response.status_code}")
+            return "retry", retry_after(response.headers.get("Retry-After"))
+        if response.status_code in (401, 403):
+            # A token problem: keep the readings until it is fixed
+            logger.error(f"❌ Ubidots refused the token ({response.status_code}); readings kept")
+            return "retry", BACKOFF_MAX
+        if not 200 <= response.status_code < 300:
+            logger.error(f"❌ Ubidots rejected {len(rows)} reading(s) for {device} "
+                         f"({response.status_code}): {response.text[:200]}")
+            return "rejected", None
+        logger.info(f"✅ Sent {len(rows)} reading(s) for {device} to Ubidots" if len(rows) > 1
+                    else "✅ Sent to Ubidots")
+        return "sent", None
+
+    def close(self):
+        self.session.close()
+        self.spool.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Spool and upload telemetry to Ubidots")
+    parser.add_argument("--spool", default=SPOOL_PATH, help=f"spool database (default {SPOOL_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    send_parser = commands.add_parser("send", help="queue a reading and flush")
+    send_parser.add_argument("device")
+    send_parser.add_argument("values", nargs="+", metavar="variable=value")
+    commands.add_parser("flush", help="send the spooled backlog now (ignores a pause)")
+    commands.add_parser("status", help="show the backlog")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s", stream=sys.stdout)
+    if args.command == "status":
+        spool = TelemetrySpool(args.spool)
+        rows = spool.peek(1)
+        not_before = spool.get_state("not_before")
+        print(f"📦 {len(spool)} reading(s) spooled"
+              + (f", oldest from {datetime.fromtimestamp(rows[0][4]):%Y-%m-%d %H:%M}" if rows else "")
+              + (f"; paused for {not_before - time.time():.0f}s" if not_before > time.time() else ""))
+        spool.close()
+        return 0
+
+    try:
+        uploader = TelemetryUploader(spool_path=args.spool)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    try:
+        if args.command == "send":
+            values = {}
+            for item in args.values:
+                variable, _, value = item.partition("=")
+                values[variable] = float(value)
+            return 0 if uploader.send(args.device, values) else 1
+        uploader.spool.set_state("not_before", 0)
+        return 0 if uploader.flush() else 1
+    finally:
+        uploader.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Tests for watch-folders.py: python3 -m unittest test_watch_folders"""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import portfolio_journal
+
+spec = importlib.util.spec_from_file_location(
+    "watch_folders", os.path.join(os.path.dirname(os.path.abspath(__file__)), "watch-folders.py")
+)
+watch_folders = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(watch_folders)
+
+
+class RecordStage:
+    name = "record"
+
+    def __init__(self):
+        self.batches = []
+
+    def process(self, batch):
+        self.batches.append(batch)
+
+
+class DirectoryMoveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "tree")
+        os.makedirs(os.path.join(self.root, "dogs", "puppies"))
+        self.images = [os.path.join(self.root, "dogs", "a.jpg"),
+                       os.path.join(self.root, "dogs", "puppies", "b.jpg")]
+        for path in self.images:
+            with open(path, "wb") as f:
+                f.write(b"\xff\xd8 not really a jpeg")
+
+        # The folder was processed before, so only the journal knows its files
+        self.journal = portfolio_journal.IngestJournal(self.root)
+        self.journal.record(self.images)
+        self.stage = RecordStage()
+        self.pipeline = watch_folders.IngestPipeline([self.stage, portfolio_journal.JournalStage(self.journal)])
+        self.debouncer = watch_folders.IngestDebouncer(
+            self.root, self.pipeline, settle=0.1, batch_quiet=0.2, known=self.journal.under
+        )
+        self.observer = watch_folders.Observer()
+        self.observer.schedule(watch_folders.WatcherHandler(self.debouncer), path=self.root, recursive=True)
+        self.stop = threading.Event()
+        self.runner = threading.Thread(target=self.debouncer.run, args=(self.stop,))
+        self.pipeline.start()
+        self.observer.start()
+        self.runner.start()
+
+    def tearDown(self):
+        self.stop.set()
+        self.runner.join()
+        self.observer.stop()
+        self.observer.join()
+        self.pipeline.stop()
+        shutil.rmtree(self.tmp)
+
+    def deleted(self):
+        return {path for batch in self.stage.batches for path in batch.deleted}
+
+    def test_folder_moved_out_of_the_tree_is_removed(self):
+        shutil.move(os.path.join(self.root, "dogs"), os.path.join(self.tmp, "dogs"))
+        deadline = time.monotonic() + 10
+        while self.deleted() != set(self.images) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.assertEqual(self.deleted(), set(self.images))
+        self.assertEqual(self.journal.under(os.path.join(self.root, "dogs")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
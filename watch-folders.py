@@ -1,46 +1,510 @@
 #!/usr/bin/env python3
+"""
+Portfolio ingest daemon
+Watches the portfolio tree recursively, waits for copied files to finish
+(their size stops changing), and hands them to the processing stages in
+ordered batches, so a 2,000-photo import is handled as one batch instead
+of 2,000 separate reactions.
+
+On startup, files added, changed or removed while it wasn't running are
+found by comparing the tree with the ingest journal, and queued.
+
+Usage:
+    python3 watch-folders.py /mnt/Plex/photo-portfolio/images
+    PORTFOLIO_PATH=/mnt/Plex/photo-portfolio/images python3 watch-folders.py
+"""
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-import time
+import argparse
+import logging
 import os
+import queue
+import signal
 import sys
+import threading
+import time
+from typing import Callable, List, Optional
+
+import portfolio_catalog
+import portfolio_dedupe
+import portfolio_exif
+import portfolio_integrity
+import portfolio_journal
+import portfolio_manifest
+import portfolio_optimize
+import portfolio_thumbnails
+
+# ==================== CONFIGURATION ====================
+SETTLE_SECONDS = 3.0        # A file is finished once its size/mtime hold this long
+POLL_INTERVAL = 0.5         # Seconds between size checks of files still being copied
+BATCH_QUIET = 5.0           # Close a batch after this long without new files
+BATCH_MAX_FILES = 5000      # ...or once it holds this many files
+BATCH_MAX_AGE = 300.0       # ...or once it has been open this many seconds
+QUEUE_SIZE = 8              # Batches waiting for a worker before the watcher holds back
+WORKERS = 1                 # Worker threads; more than one overlaps batches in different stages
+
+# Only these files are ingested; everything else in the tree is ignored
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".heic", ".tif", ".tiff", ".gif", ".bmp"}
+# Directories holding generated files, never ingested
+IGNORE_DIRS = {"optimized", ".thumbnails", ".git", "node_modules", "@eaDir"}
+# Partial downloads and copies in progress
+TEMP_SUFFIXES = (".part", ".tmp", ".crdownload", ".download", ".partial")
+
+LOG_LEVEL = logging.INFO
+# =======================================================
+
+logger = logging.getLogger("watch-folders")
+
+
+def is_ingestible(path: str) -> bool:
+    """True for image files outside generated or hidden directories."""
+    name = os.path.basename(path)
+    if name.startswith(".") or name.endswith(TEMP_SUFFIXES):
+        return False
+    if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+        return False
+    return not any(part in IGNORE_DIRS for part in path.split(os.sep))
+
+
+class Batch:
+    """Finished files (in path order) and deletions handed to the stages together.
+
+    Stages add files they couldn't handle to `failed`, so they aren't
+    journaled as done and get retried on the next start.
+    """
+
+    def __init__(self, root: str, files, deleted):
+        self.root = root
+        self.files = sorted(files)
+        self.deleted = sorted(deleted)
+        self.failed = set()
+        self.created = time.time()
+
+    def __len__(self):
+        return len(self.files) + len(self.deleted)
+
+
+class IngestPipeline:
+    """Bounded queue of batches drained by a pool of worker threads running the stages.
+
+    A stage is any object with a `name` and a `process(batch)` method; it may
+    also have `close()`, called once on shutdown. Stages run in list order
+    for each batch, and a failing stage doesn't stop the ones after it; its
+    whole batch is marked failed instead. With several workers, batches
+    overlap in different stages, but each stage only ever runs one batch at
+    a time, so stages needn't be thread-safe.
+    """
+
+    def __init__(self, stages, workers: int = WORKERS, queue_size: int = QUEUE_SIZE):
+        self.stages = list(stages)
+        self.stage_locks = [threading.Lock() for _ in self.stages]
+        self.queue: "queue.Queue[Batch]" = queue.Queue(maxsize=queue_size)
+        self.threads = [
+            threading.Thread(target=self._work, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, batch: Batch):
+        """Queue a batch, blocking while the queue is full."""
+        self.queue.put(batch)
+
+    def stop(self):
+        """Finish the queued batches, then stop the workers and close the stages."""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        for stage in self.stages:
+            close = getattr(stage, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logger.error(f"Error closing {stage.name}: {e}", exc_info=True)
+
+    def _work(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            for stage, lock in zip(self.stages, self.stage_locks):
+                with lock:
+                    started = time.monotonic()
+                    try:
+                        stage.process(batch)
+                    except Exception as e:
+                        logger.error(f"{stage.name} failed on a batch of {len(batch)}: {e}", exc_info=True)
+                        batch.failed.update(batch.files)
+                        continue
+                logger.debug(f"{stage.name}: {len(batch)} item(s) in {time.monotonic() - started:.2f}s")
+
+
+class IngestDebouncer:
+    """Merge bursts of events per path and release files once their size settles.
+
+    Watchdog threads only record paths here; a single thread stats the
+    pending files every POLL_INTERVAL and groups the finished ones into
+    batches for the pipeline. `known` lists the files already processed
+    below a directory, so a folder deleted or moved away removes them too.
+    """
+
+    def __init__(self, root: str, pipeline: IngestPipeline, settle: float = SETTLE_SECONDS,
+                 batch_quiet: float = BATCH_QUIET, batch_max_files: int = BATCH_MAX_FILES,
+                 batch_max_age: float = BATCH_MAX_AGE, known: Optional[Callable[[str], List[str]]] = None):
+        self.root = root
+        self.pipeline = pipeline
+        self.known = known
+        self.settle = settle
+        self.batch_quiet = batch_quiet
+        self.batch_max_files = batch_max_files
+        self.batch_max_age = batch_max_age
+        self.lock = threading.Lock()
+        # path -> [(size, mtime_ns) or None, time.monotonic() the signature last changed]
+        self.pending = {}
+        self.deleted = set()
+        self.last_activity = time.monotonic()
+        # Finished files collected into the open batch
+        self.ready = set()
+        self.ready_deleted = set()
+        self.batch_opened = None
+
+    def touch(self, path: str):
+        """Record a create/modify/move-in event; restarts the path's settle timer."""
+        now = time.monotonic()
+        with self.lock:
+            self.pending[path] = [None, now]
+            self.deleted.discard(path)
+            self.last_activity = now
+
+    def touch_tree(self, directory: str):
+        """Record every ingestible file below a directory that was created or moved in."""
+        stack = [directory]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in IGNORE_DIRS and not entry.name.startswith("."):
+                                stack.append(entry.path)
+                        elif is_ingestible(entry.path):
+                            self.touch(entry.path)
+            except OSError:
+                continue
+
+    def discard(self, path: str):
+        """Record a deletion or move-out."""
+        with self.lock:
+            self.pending.pop(path, None)
+            self.deleted.add(path)
+            self.last_activity = time.monotonic()
+
+    def discard_tree(self, directory: str):
+        """Record the deletion or move-out of a directory and everything below it."""
+        prefix = directory.rstrip(os.sep) + os.sep
+        known = []
+        if self.known is not None:
+            try:
+                known = self.known(directory)
+            except Exception as e:
+                logger.error(f"Can't list the files that were in {directory}: {e}")
+        with self.lock:
+            paths = [path for path in list(self.pending) + list(self.ready) if path.startswith(prefix)]
+            for path in paths:
+                self.pending.pop(path, None)
+            self.deleted.update(paths)
+            self.deleted.update(path for path in known if is_ingestible(path))
+            self.last_activity = time.monotonic()
+
+    def _check_pending(self, now: float):
+        """Move files whose signature held for `settle` seconds into the open batch."""
+        with self.lock:
+            items = list(self.pending.items())
+            deleted, self.deleted = self.deleted, set()
+
+        finished = []
+        for path, entry in items:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                deleted.add(path)
+                continue
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature != entry[0]:
+                entry[0], entry[1] = signature, now
+            elif now - entry[1] >= self.settle:
+                finished.append((path, entry))
+
+        with self.lock:
+            for path, entry in finished:
+                # Skip paths touched again since they were stat'ed
+                if self.pending.get(path) is entry:
+                    del self.pending[path]
+                    self.ready.add(path)
+            for path in deleted:
+                if path not in self.pending or not os.path.exists(path):
+                    self.pending.pop(path, None)
+                    self.ready.discard(path)
+                    self.ready_deleted.add(path)
+            if (self.ready or self.ready_deleted) and self.batch_opened is None:
+                self.batch_opened = now
+
+    def _take_batch(self, now: float, force: bool = False):
+        """Return the open batch when it is due, else None."""
+        with self.lock:
+            if self.batch_opened is None:
+                return None
+            size = len(self.ready) + len(self.ready_deleted)
+            quiet = not self.pending and now - self.last_activity >= self.batch_quiet
+            if not (force or quiet or size >= self.batch_max_files or now - self.batch_opened >= self.batch_max_age):
+                return None
+            batch = Batch(self.root, self.ready, self.ready_deleted)
+            self.ready, self.ready_deleted = set(), set()
+            self.batch_opened = None
+            return batch
+
+    def run(self, stop: threading.Event):
+        """Check pending files until `stop` is set, then flush the open batch."""
+        while not stop.wait(POLL_INTERVAL):
+            now = time.monotonic()
+            self._check_pending(now)
+            batch = self._take_batch(now)
+            if batch is not None:
+                self._submit(batch)
+        batch = self._take_batch(time.monotonic(), force=True)
+        if batch is not None:
+            self._submit(batch)
+
+    def _submit(self, batch: Batch):
+        with self.lock:
+            waiting = len(self.pending)
+        logger.info(
+            f"📦 Batch of {len(batch.files)} file(s), {len(batch.deleted)} deletion(s)"
+            + (f"; {waiting} file(s) still copying" if waiting else "")
+        )
+        self.pipeline.submit(batch)
 
 
 class WatcherHandler(FileSystemEventHandler):
+    """Forward watchdog events for image files to the debouncer."""
+
+    def __init__(self, debouncer: IngestDebouncer):
+        self.debouncer = debouncer
+
     def on_created(self, event):
-        if not event.is_directory:
-            print(f"🆕 File added: {os.path.basename(event.src_path)}")
+        if event.is_directory:
+            self.debouncer.touch_tree(event.src_path)
+        elif is_ingestible(event.src_path):
+            self.debouncer.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory and is_ingestible(event.src_path):
+            self.debouncer.touch(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            # A folder moved out of the tree only shows up as a delete; within it, as both
+            self.debouncer.discard_tree(event.src_path)
+            self.debouncer.touch_tree(event.dest_path)
+            return
+        if is_ingestible(event.src_path):
+            self.debouncer.discard(event.src_path)
+        if is_ingestible(event.dest_path):
+            self.debouncer.touch(event.dest_path)
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self.debouncer.discard_tree(event.src_path)
+        elif is_ingestible(event.src_path):
+            self.debouncer.discard(event.src_path)
+
+
+class LogStage:
+    """Log what each batch added or removed, per folder."""
+
+    name = "log"
+
+    def process(self, batch: Batch):
+        folders = {}
+        for path in batch.files:
+            folder = os.path.relpath(os.path.dirname(path), batch.root)
+            folders[folder] = folders.get(folder, 0) + 1
+        for folder, count in sorted(folders.items()):
+            logger.info(f"🆕 {count} file(s) added in {folder}")
+        for path in batch.deleted:
+            logger.info(f"🗑️  Removed: {os.path.relpath(path, batch.root)}")
+
+
+def build_stages(args):
+    """Processing stages, run in this order for every batch."""
+    stages = [LogStage()]
+    catalog_stage = None
+    if args.catalog:
+        catalog_stage = portfolio_catalog.CatalogStage()
+        stages.append(catalog_stage)
+    if args.integrity:
+        stages.append(portfolio_integrity.IntegrityStage(catalog_stage=catalog_stage))
+    if args.metadata:
+        if portfolio_exif.np is None:
+            logger.warning("NumPy is not installed (pip3 install numpy); metadata stage disabled")
+        else:
+            stages.append(portfolio_exif.MetadataStage())
+    if args.dedupe:
+        if portfolio_dedupe.Image is None:
+            logger.warning("Pillow is not installed (pip3 install Pillow); duplicate detection disabled")
+        else:
+            stages.append(portfolio_dedupe.DedupeStage())
+    optimize = args.optimize and portfolio_optimize.Image is not None
+    if args.thumbnails:
+        if portfolio_thumbnails.Image is None:
+            logger.warning("Pillow is not installed (pip3 install Pillow); thumbnail stage disabled")
+        else:
+            stages.append(portfolio_thumbnails.ThumbnailStage(
+                workers=args.thumbnail_workers, niceness=args.nice, full_copy=not optimize
+            ))
+    if args.optimize:
+        if not optimize:
+            logger.warning("Pillow is not installed (pip3 install Pillow); optimization stage disabled")
+        else:
+            stages.append(portfolio_optimize.OptimizeStage(workers=args.optimize_workers, niceness=args.nice))
+    if args.manifests:
+        if portfolio_manifest.Image is None:
+            logger.warning("Pillow is not installed (pip3 install Pillow); gallery manifests disabled")
+        else:
+            stages.append(portfolio_manifest.ManifestStage(catalog_stage=catalog_stage))
+    return stages
+
+
+def reconcile(journal: portfolio_journal.IngestJournal, debouncer: IngestDebouncer):
+    """Queue what changed while the watcher was down."""
+    started = time.monotonic()
+    changed, deleted, seeded = journal.reconcile(IGNORE_DIRS, is_ingestible)
+    for path in changed:
+        debouncer.touch(path)
+    for path in deleted:
+        debouncer.discard(path)
+    elapsed = time.monotonic() - started
+    if seeded:
+        logger.info(f"📓 Started the ingest journal with {seeded} existing file(s) in {elapsed:.1f}s")
+    else:
+        logger.info(f"📓 Since the last run: {len(changed)} new or changed, {len(deleted)} removed "
+                    f"(checked in {elapsed:.1f}s)")
+
+
+def known_files(root: str, journal: Optional[portfolio_journal.IngestJournal]):
+    """Lookup of the processed files below a directory: the journal, else the catalog."""
+    if journal is not None:
+        return journal.under
+    if not os.path.exists(os.path.join(root, portfolio_catalog.CATALOG_DB_NAME)):
+        return None
+    catalog = portfolio_catalog.ImageCatalog(root)
+    return lambda directory: [
+        os.path.join(root, key.replace("/", os.sep))
+        for key in catalog.under(portfolio_catalog.relative_key(root, directory))
+    ]
+
+
+def resolve_watch_path(args) -> str:
+    """Watch path from the command line, PORTFOLIO_PATH, or a prompt when interactive."""
+    if args.path:
+        return args.path
+    if os.environ.get("PORTFOLIO_PATH"):
+        return os.environ["PORTFOLIO_PATH"]
+    if sys.stdin.isatty():
+        try:
+            return input("📁 Enter the full path to the folder you want to monitor:\n> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            return ""
+    return ""
 
 
 def main() -> int:
-    try:
-        watch_path = input("📁 Enter the full path to the folder you want to monitor:\n> ").strip()
-    except (EOFError, KeyboardInterrupt):
-        return 1
+    parser = argparse.ArgumentParser(description="Watch the portfolio tree and process new images in batches")
+    parser.add_argument("path", nargs="?", help="folder to watch (default: $PORTFOLIO_PATH)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help=f"worker threads; batches overlap across stages, one per stage at a time (default {WORKERS})")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="batches queued before holding back")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="seconds a file's size must hold before it counts as finished")
+    parser.add_argument("--batch-quiet", type=float, default=BATCH_QUIET,
+                        help="seconds without new files that close a batch")
+    parser.add_argument("--batch-max-files", type=int, default=BATCH_MAX_FILES)
+    parser.add_argument("--no-catalog", dest="catalog", action="store_false",
+                        help="don't keep the image catalog up to date")
+    parser.add_argument("--no-integrity", dest="integrity", action="store_false",
+                        help="don't check new images for corruption")
+    parser.add_argument("--no-metadata", dest="metadata", action="store_false",
+                        help="don't read EXIF/XMP metadata of new images")
+    parser.add_argument("--no-dedupe", dest="dedupe", action="store_false",
+                        help="don't look for duplicates of new images")
+    parser.add_argument("--no-thumbnails", dest="thumbnails", action="store_false",
+                        help="don't build responsive image variants")
+    parser.add_argument("--no-optimize", dest="optimize", action="store_false",
+                        help="serve fullscreen images as copies of the originals instead of re-encoding them")
+    parser.add_argument("--no-manifests", dest="manifests", action="store_false",
+                        help="don't rewrite the per-category gallery manifests")
+    parser.add_argument("--no-journal", dest="journal", action="store_false",
+                        help="don't record processed files or catch up on changes made while stopped")
+    parser.add_argument("--thumbnail-workers", type=int, default=portfolio_thumbnails.WORKERS,
+                        help=f"variant worker processes (default {portfolio_thumbnails.WORKERS})")
+    parser.add_argument("--optimize-workers", type=int, default=portfolio_optimize.WORKERS,
+                        help=f"full-size encoder processes (default {portfolio_optimize.WORKERS})")
+    parser.add_argument("--nice", type=int, default=portfolio_thumbnails.NICENESS,
+                        help=f"niceness of the image worker processes (default {portfolio_thumbnails.NICENESS})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="debug logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else LOG_LEVEL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
 
-    if not os.path.isdir(watch_path):
-        print(f"❌ That path doesn’t exist or isn’t a directory: {watch_path}")
+    watch_path = resolve_watch_path(args)
+    if not watch_path or not os.path.isdir(watch_path):
+        logger.error(f"❌ That path doesn’t exist or isn’t a directory: {watch_path}")
         return 1
+    watch_path = os.path.abspath(watch_path)
 
-    print(f"🔍 Now watching: {watch_path}")
+    stages = build_stages(args)
+    journal = portfolio_journal.IngestJournal(watch_path) if args.journal else None
+    if journal is not None:
+        stages.append(portfolio_journal.JournalStage(journal))
+    pipeline = IngestPipeline(stages, workers=args.workers, queue_size=args.queue_size)
+    debouncer = IngestDebouncer(
+        watch_path, pipeline, settle=args.settle,
+        batch_quiet=args.batch_quiet, batch_max_files=args.batch_max_files,
+        known=known_files(watch_path, journal)
+    )
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
 
-    event_handler = WatcherHandler()
+    pipeline.start()
     observer = Observer()
-    observer.schedule(event_handler, path=watch_path, recursive=False)
+    observer.schedule(WatcherHandler(debouncer), path=watch_path, recursive=True)
     observer.start()
+    logger.info(f"🔍 Now watching: {watch_path} (recursive, {args.workers} worker(s))")
+    if journal is not None:
+        # After the observer starts, so nothing slips between the walk and live events
+        reconcile(journal, debouncer)
+
     try:
-        while True:
-            time.sleep(1)
+        debouncer.run(stop)
     except KeyboardInterrupt:
+        stop.set()
+        debouncer.run(stop)
+    finally:
         observer.stop()
-    observer.join()
+        observer.join()
+        pipeline.stop()
+        logger.info("Stopped")
     return 0
 
 
 if __name__ == "__main__":
     sys.exit(main())
-
-
-
-
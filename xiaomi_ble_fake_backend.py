@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+Simulated BLE backend and MQTT broker for the Xiaomi BLE to MQTT Bridge
+Replays synthetic or recorded advertisements and GATT responses for
+hundreds of virtual sensors, so the bridge can be load-tested on any Linux
+box without Bluetooth hardware. Used by benchmark-xiaomi-bridge.py.
+
+Record real advertisements for replay with:
+    python3 xiaomi_ble_fake_backend.py record capture.jsonl --seconds 120
+"""
+
+import argparse
+import asyncio
+import bisect
+import heapq
+import json
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+from xiaomi_ble_mqtt_bridge import (
+    ADVERTISEMENT_DECODERS,
+    BTHOME_UUID,
+    ENVIRONMENTAL_SENSING_UUID,
+    MIBEACON_UUID,
+    XiaomiSensor,
+)
+
+# Firmware flavours a virtual sensor can advertise as. "stock" advertises
+# only an encrypted MiBeacon frame, so the bridge has to read it over GATT.
+FIRMWARES = ("atc", "pvvx", "bthome", "stock")
+
+# Same shapes as bleak's BLEDevice and AdvertisementData, as far as the bridge uses them
+FakeDevice = namedtuple("FakeDevice", ["address", "name"])
+FakeAdvertisementData = namedtuple("FakeAdvertisementData", ["rssi", "service_data", "local_name"])
+
+# Encrypted MiBeacon frame (frame control 0x0058), ignored by the bridge's decoder
+ENCRYPTED_MIBEACON = bytes.fromhex("58585b0500000000000000000000")
+
+
+class FakeBleakError(Exception):
+    """Simulated connection or read failure."""
+
+
+def _mac_bytes(mac: str) -> bytes:
+    return bytes.fromhex(mac.replace(":", ""))
+
+
+def encode_advertisement(firmware: str, mac: str, temperature: float, humidity: float,
+                         battery: int, counter: int) -> Dict[str, bytes]:
+    """Build the service data a sensor with the given firmware advertises."""
+    if firmware == "atc":
+        data = (
+            _mac_bytes(mac)
+            + int(round(temperature * 10)).to_bytes(2, "big", signed=True)
+            + bytes([int(humidity), battery])
+            + (2500 + battery * 7).to_bytes(2, "big")
+            + bytes([counter & 0xFF])
+        )
+        return {ENVIRONMENTAL_SENSING_UUID: data}
+    if firmware == "pvvx":
+        data = (
+            _mac_bytes(mac)[::-1]
+            + int(round(temperature * 100)).to_bytes(2, "little", signed=True)
+            + int(round(humidity * 100)).to_bytes(2, "little")
+            + (2500 + battery * 7).to_bytes(2, "little")
+            + bytes([battery, counter & 0xFF, 0x04])
+        )
+        return {ENVIRONMENTAL_SENSING_UUID: data}
+    if firmware == "bthome":
+        data = (
+            bytes([0x40, 0x00, counter & 0xFF, 0x01, battery, 0x02])
+            + int(round(temperature * 100)).to_bytes(2, "little", signed=True)
+            + bytes([0x03])
+            + int(round(humidity * 100)).to_bytes(2, "little")
+        )
+        return {BTHOME_UUID: data}
+    return {MIBEACON_UUID: ENCRYPTED_MIBEACON}
+
+
+def encode_temperature_humidity(temperature: float, humidity: float) -> bytes:
+    """LYWSD03MMC temperature/humidity characteristic value (temp x100, humidity %, mV)."""
+    return (
+        int(round(temperature * 100)).to_bytes(2, "little", signed=True)
+        + bytes([int(humidity)])
+        + (3000).to_bytes(2, "little")
+    )
+
+
+class VirtualSensor:
+    """One simulated LYWSD03MMC with a random-walk reading.
+
+    Every reading it hands out (advertisement, GATT read or notification) is
+    logged with its time.monotonic(), so the benchmark can match published
+    MQTT state back to the moment the reading left the "sensor".
+    """
+
+    def __init__(self, mac: str, name: str, firmware: str = "atc",
+                 advertise_interval: float = 2.0, rssi: int = -70,
+                 connect_latency: float = 0.5, read_latency: float = 0.1,
+                 failure_rate: float = 0.0, drop_rate: float = 0.0,
+                 notify_interval: float = 6.0):
+        self.mac = mac.upper()
+        self.name = name
+        self.firmware = firmware
+        self.advertise_interval = advertise_interval
+        self.rssi = rssi
+        self.connect_latency = connect_latency
+        self.read_latency = read_latency
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.notify_interval = notify_interval
+        self.device = FakeDevice(self.mac, "LYWSD03MMC" if firmware == "stock" else f"ATC_{self.mac[-5:]}")
+
+        # Whole 0.1 °C and 1 %RH steps survive every encoding unchanged
+        self.temperature = round(random.uniform(18.0, 24.0), 1)
+        self.humidity = float(random.randint(35, 60))
+        self.battery = random.randint(60, 100)
+        self.counter = 0
+
+        # Replayed advertisements and GATT values override the random walk
+        self.recorded_gatt: Dict[str, List[bytes]] = {}
+
+        # temperature -> monotonic times it was handed out
+        self.emitted: Dict[float, List[float]] = {}
+
+    def next_reading(self) -> Tuple[float, float, int]:
+        """Advance the random walk by at least one deadband step and log it."""
+        step = random.choice((-0.3, -0.2, -0.1, 0.1, 0.2, 0.3))
+        if not 15.0 <= self.temperature + step <= 30.0:
+            step = -step
+        self.temperature = round(self.temperature + step, 1)
+        self.humidity = float(min(90, max(10, self.humidity + random.choice((-1, 0, 1)))))
+        if random.random() < 0.01:
+            self.battery = max(1, self.battery - 1)
+        self.counter += 1
+        self.log_emission(self.temperature)
+        return self.temperature, self.humidity, self.battery
+
+    def log_emission(self, temperature: Optional[float]):
+        if temperature is not None:
+            self.emitted.setdefault(round(temperature, 1), []).append(time.monotonic())
+
+    def emitted_before(self, temperature: float, received: float) -> Optional[float]:
+        """Latest time the given temperature was handed out at or before `received`."""
+        times = self.emitted.get(round(temperature, 1))
+        if not times:
+            return None
+        i = bisect.bisect_right(times, received)
+        return times[i - 1] if i else None
+
+    def advertisement(self) -> FakeAdvertisementData:
+        """Next synthetic advertisement."""
+        if self.firmware == "stock":
+            self.counter += 1
+            service_data = encode_advertisement("stock", self.mac, 0, 0, 0, self.counter)
+        else:
+            temperature, humidity, battery = self.next_reading()
+            service_data = encode_advertisement(
+                self.firmware, self.mac, temperature, humidity, battery, self.counter
+            )
+        return FakeAdvertisementData(self.rssi + random.randint(-4, 4), service_data, self.device.name)
+
+    def read_characteristic(self, uuid: str) -> bytes:
+        """GATT value for a characteristic, recorded if available."""
+        recorded = self.recorded_gatt.get(uuid)
+        if recorded:
+            value = recorded[self.counter % len(recorded)]
+            self.counter += 1
+            if uuid == XiaomiSensor.TEMPERATURE_HUMIDITY_UUID:
+                self.log_emission(int.from_bytes(value[0:2], "little", signed=True) / 100.0)
+            return value
+        if uuid == XiaomiSensor.TEMPERATURE_HUMIDITY_UUID:
+            temperature, humidity, _battery = self.next_reading()
+            return encode_temperature_humidity(temperature, humidity)
+        if uuid == XiaomiSensor.BATTERY_UUID:
+            return bytes([self.battery])
+        raise FakeBleakError(f"Characteristic {uuid} not found")
+
+
+class FakeBleakScanner:
+    """Stand-in for bleak.BleakScanner driven by a SimulatedRadio."""
+
+    radio: "SimulatedRadio" = None
+
+    def __init__(self, detection_callback: Optional[Callable] = None, **kwargs):
+        self.detection_callback = detection_callback
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self.radio.broadcast(self))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class FakeBleakClient:
+    """Stand-in for bleak.BleakClient with simulated connect/read latency and failures."""
+
+    radio: "SimulatedRadio" = None
+
+    def __init__(self, address: str, timeout: float = 10.0,
+                 disconnected_callback: Optional[Callable] = None, **kwargs):
+        self.address = address.upper()
+        self.timeout = timeout
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self._notify_task: Optional[asyncio.Task] = None
+
+    def _sensor(self) -> VirtualSensor:
+        sensor = self.radio.sensors.get(self.address)
+        if sensor is None:
+            raise FakeBleakError(f"Device with address {self.address} was not found")
+        return sensor
+
+    async def __aenter__(self):
+        sensor = self._sensor()
+        self.radio.connections += 1
+        self.radio.peak_connections = max(self.radio.peak_connections, self.radio.connections)
+        try:
+            latency = sensor.connect_latency * random.uniform(0.5, 1.5)
+            if latency > self.timeout:
+                await asyncio.sleep(self.timeout)
+                raise FakeBleakError(f"Device {self.address} connection timed out")
+            await asyncio.sleep(latency)
+            if random.random() < sensor.failure_rate:
+                self.radio.failed_connections += 1
+                raise FakeBleakError("org.bluez.Error.Failed: le-connection-abort-by-local")
+        except BaseException:
+            self.radio.connections -= 1
+            raise
+        self.is_connected = True
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.disconnect()
+
+    async def disconnect(self):
+        if not self.is_connected:
+            return
+        self.is_connected = False
+        self.radio.connections -= 1
+        if self._notify_task is not None and self._notify_task is not asyncio.current_task():
+            self._notify_task.cancel()
+        self._notify_task = None
+
+    async def read_gatt_char(self, uuid: str) -> bytearray:
+        if not self.is_connected:
+            raise FakeBleakError("Not connected")
+        sensor = self._sensor()
+        await asyncio.sleep(sensor.read_latency * random.uniform(0.5, 1.5))
+        return bytearray(sensor.read_characteristic(uuid))
+
+    async def start_notify(self, uuid: str, callback: Callable):
+        if not self.is_connected:
+            raise FakeBleakError("Not connected")
+        self._notify_task = asyncio.create_task(self._notify(uuid, callback))
+
+    async def _notify(self, uuid: str, callback: Callable):
+        """Send notifications until cancelled or the simulated link drops."""
+        sensor = self._sensor()
+        while self.is_connected:
+            await asyncio.sleep(sensor.notify_interval * random.uniform(0.9, 1.1))
+            if random.random() < sensor.drop_rate:
+                self.radio.dropped_connections += 1
+                await self.disconnect()
+                if self.disconnected_callback is not None:
+                    self.disconnected_callback(self)
+                return
+            callback(uuid, bytearray(sensor.read_characteristic(uuid)))
+
+
+class SimulatedRadio:
+    """A fleet of virtual sensors plus the scanner and client classes that reach them."""
+
+    def __init__(self):
+        self.sensors: Dict[str, VirtualSensor] = {}
+        self.recording: List[Tuple[float, str, FakeAdvertisementData]] = []
+        self.advertisements = 0
+        self.connections = 0
+        self.peak_connections = 0
+        self.failed_connections = 0
+        self.dropped_connections = 0
+
+    def add(self, sensor: VirtualSensor) -> VirtualSensor:
+        self.sensors[sensor.mac] = sensor
+        return sensor
+
+    @classmethod
+    def synthetic(cls, count: int, firmware_mix: Dict[str, float],
+                  advertise_interval: float = 2.0, **sensor_options) -> "SimulatedRadio":
+        """Radio with `count` virtual sensors, firmwares drawn from firmware_mix weights."""
+        radio = cls()
+        firmwares, weights = zip(*firmware_mix.items())
+        for i in range(count):
+            mac = f"A4:C1:38:{(i >> 16) & 0xFF:02X}:{(i >> 8) & 0xFF:02X}:{i & 0xFF:02X}"
+            radio.add(VirtualSensor(
+                mac, f"virtual_{i:04d}", random.choices(firmwares, weights)[0],
+                advertise_interval=advertise_interval * random.uniform(0.8, 1.2),
+                rssi=random.randint(-95, -55), **sensor_options
+            ))
+        return radio
+
+    @classmethod
+    def from_recording(cls, path: str, **sensor_options) -> "SimulatedRadio":
+        """Radio replaying a JSON-lines capture, looped for as long as it runs.
+
+        Each line is {"t": seconds, "mac": ..., "rssi": ..., "service_data":
+        {uuid: hex}} for an advertisement, or {"mac": ..., "gatt": {uuid:
+        hex}} for a GATT value served (in turn) to reads of that sensor.
+        """
+        radio = cls()
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                mac = record["mac"].upper()
+                sensor = radio.sensors.get(mac) or radio.add(VirtualSensor(
+                    mac, record.get("name") or f"replay_{mac.replace(':', '')[-6:].lower()}",
+                    "replay", **sensor_options
+                ))
+                for uuid, value in record.get("gatt", {}).items():
+                    sensor.recorded_gatt.setdefault(uuid, []).append(bytes.fromhex(value))
+                if "service_data" in record:
+                    service_data = {uuid: bytes.fromhex(value) for uuid, value in record["service_data"].items()}
+                    advertisement = FakeAdvertisementData(record.get("rssi", sensor.rssi), service_data, None)
+                    radio.recording.append((float(record.get("t", 0)), mac, advertisement))
+        radio.recording.sort(key=lambda entry: entry[0])
+        return radio
+
+    def backend(self) -> Tuple[type, type]:
+        """Scanner and client classes bound to this radio, for use_ble_backend()."""
+        scanner = type("FakeBleakScanner", (FakeBleakScanner,), {"radio": self})
+        client = type("FakeBleakClient", (FakeBleakClient,), {"radio": self})
+        return scanner, client
+
+    async def broadcast(self, scanner: FakeBleakScanner):
+        """Deliver advertisements to the scanner's callback until cancelled."""
+        if self.recording:
+            await self._replay(scanner)
+        else:
+            await self._synthesize(scanner)
+
+    async def _synthesize(self, scanner: FakeBleakScanner):
+        # One timer heap for the whole fleet instead of a task per sensor
+        now = time.monotonic()
+        schedule = [(now + random.uniform(0, s.advertise_interval), s.mac) for s in self.sensors.values()]
+        heapq.heapify(schedule)
+        while schedule:
+            due, mac = schedule[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            now = time.monotonic()
+            while schedule and schedule[0][0] <= now:
+                due, mac = heapq.heappop(schedule)
+                sensor = self.sensors[mac]
+                scanner.detection_callback(sensor.device, sensor.advertisement())
+                self.advertisements += 1
+                heapq.heappush(schedule, (due + sensor.advertise_interval, mac))
+
+    async def _replay(self, scanner: FakeBleakScanner):
+        span = self.recording[-1][0] - self.recording[0][0] + 1.0
+        start = time.monotonic() - self.recording[0][0]
+        while True:
+            for offset, mac, advertisement in self.recording:
+                delay = start + offset - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                sensor = self.sensors[mac]
+                for uuid, data in advertisement.service_data.items():
+                    decoder = ADVERTISEMENT_DECODERS.get(uuid)
+                    readings = decoder(data) if decoder else None
+                    if readings:
+                        sensor.log_emission(readings.get("temperature"))
+                        break
+                scanner.detection_callback(sensor.device, advertisement)
+                self.advertisements += 1
+            start += span
+
+
+class MiniMQTTBroker:
+    """Minimal in-process MQTT 3.1.1 broker: accepts every client and acknowledges QoS 0/1.
+
+    Only what the bridge needs (CONNECT, PUBLISH, PINGREQ, DISCONNECT); nothing
+    is routed to subscribers. Every received publish is handed to on_message
+    with its arrival time.monotonic().
+    """
+
+    def __init__(self, on_message: Optional[Callable[[str, bytes, float], None]] = None):
+        self.on_message = on_message
+        self.messages = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.server: Optional[asyncio.base_events.Server] = None
+        self.port: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                packet_type = header >> 4
+
+                if packet_type == 1:  # CONNECT
+                    writer.write(b"\x20\x02\x00\x00")
+                elif packet_type == 3:  # PUBLISH
+                    received = time.monotonic()
+                    qos = (header >> 1) & 0x03
+                    topic_length = int.from_bytes(body[0:2], "big")
+                    topic = body[2:2 + topic_length].decode()
+                    i = 2 + topic_length
+                    if qos:
+                        packet_id = body[i:i + 2]
+                        i += 2
+                        writer.write(b"\x40\x02" + packet_id)
+                    self.messages += 1
+                    if self.on_message is not None:
+                        self.on_message(topic, body[i:], received)
+                elif packet_type == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif packet_type == 14:  # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Listen on the running loop; returns the bound port."""
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Run the broker on its own thread and loop, so its CPU can be told apart."""
+        ready = threading.Event()
+
+        async def serve():
+            await self.start(host, port)
+            self._stopped = asyncio.Event()
+            ready.set()
+            await self._stopped.wait()
+            self.server.close()
+            await self.server.wait_closed()
+
+        self._thread = threading.Thread(target=asyncio.run, args=(serve(),), name="mqtt-broker", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.port
+
+    def thread_cpu_time(self) -> float:
+        """CPU seconds used so far by a broker started with start_in_thread()."""
+        async def measure():
+            return time.thread_time()
+        return asyncio.run_coroutine_threadsafe(measure(), self.loop).result(timeout=5)
+
+    def stop(self):
+        """Stop a broker started with start_in_thread()."""
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+            self._thread.join()
+            self._thread = None
+
+
+async def record(path: str, seconds: float, macs: Optional[List[str]] = None):
+    """Capture real advertisements with bleak in the format from_recording() replays."""
+    from bleak import BleakScanner
+
+    wanted = {mac.upper() for mac in macs} if macs else None
+    started = time.monotonic()
+    count = 0
+    with open(path, "w") as f:
+        def on_advertisement(device, advertisement_data):
+            nonlocal count
+            if wanted is not None and device.address.upper() not in wanted:
+                return
+            if not any(uuid in ADVERTISEMENT_DECODERS for uuid in advertisement_data.service_data):
+                return
+            f.write(json.dumps({
+                "t": round(time.monotonic() - started, 3),
+                "mac": device.address.upper(),
+                "rssi": advertisement_data.rssi,
+                "service_data": {uuid: bytes(data).hex() for uuid, data in advertisement_data.service_data.items()},
+            }) + "\n")
+            count += 1
+
+        scanner = BleakScanner(detection_callback=on_advertisement)
+        await scanner.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await scanner.stop()
+    print(f"Recorded {count} advertisement(s) to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record BLE advertisements for replay in benchmarks")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    record_parser = subcommands.add_parser("record", help="capture real advertisements to a JSON-lines file")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--seconds", type=float, default=60.0)
+    record_parser.add_argument("--mac", action="append", help="only record this sensor (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        try:
+            asyncio.run(record(args.path, args.seconds, args.mac))
+        except ImportError:
+            print("Recording needs bleak: pip3 install bleak")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,25 +6,43 @@ and publishes to MQTT for Home Assistant integration.
 """
 
 import asyncio
+import bisect
 import json
 import logging
+import os
+import random
+import socket
+import sqlite3
 import sys
 import time
+from collections import Counter, deque
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 try:
-    from bleak import BleakClient, BleakScanner
     import paho.mqtt.client as mqtt
 except ImportError:
     print("Missing required packages. Install with:")
     print("pip3 install bleak paho-mqtt")
     sys.exit(1)
 
+# bleak is only needed for real hardware; the simulated backend in
+# xiaomi_ble_fake_backend.py is installed with use_ble_backend() instead
+try:
+    from bleak import BleakClient, BleakScanner
+except ImportError:
+    BleakClient = BleakScanner = None
+
 # ==================== CONFIGURATION ====================
 # Xiaomi Sensor Configuration
-SENSOR_MAC = "A4:C1:38:XX:XX:XX"  # Replace with your sensor's MAC address
-SENSOR_NAME = "bedroom_sensor"     # Friendly name for MQTT topics
+# One entry per sensor. All sensors share a single BLE scanner, so add every
+# room here instead of running one bridge process per sensor.
+# Add "mode": "subscribe" to an entry to keep a GATT connection open and
+# publish every notification as it arrives instead of polling.
+SENSORS = [
+    {"mac": "A4:C1:38:XX:XX:XX", "name": "bedroom_sensor"},  # Replace with your sensor's MAC address
+    # {"mac": "A4:C1:38:YY:YY:YY", "name": "living_room_sensor", "mode": "subscribe"},
+]
 
 # MQTT Configuration
 MQTT_BROKER = "192.168.1.XXX"      # IP of your Home Assistant Pi
@@ -32,22 +50,78 @@ MQTT_PORT = 1883
 MQTT_USERNAME = "mqtt_user"         # Optional: MQTT username
 MQTT_PASSWORD = "mqtt_password"     # Optional: MQTT password
 MQTT_CLIENT_ID = "xiaomi_ble_bridge"
+MQTT_QOS = 1                        # QoS 1: every publish is acknowledged by the broker
+MQTT_MAX_INFLIGHT = 20              # Unacknowledged publishes before senders wait
+MQTT_OUTBOX_SIZE = 1000             # Queued publishes before readings go to the spool
+MQTT_CONNECT_TIMEOUT = 10           # Seconds to wait for the broker's CONNACK
+MQTT_ACK_TIMEOUT = 30               # Seconds to wait for acks of a re-published spool batch
 
-# MQTT Topics
-MQTT_BASE_TOPIC = f"homeassistant/sensor/{SENSOR_NAME}"
-MQTT_TEMPERATURE_TOPIC = f"{MQTT_BASE_TOPIC}/temperature"
-MQTT_HUMIDITY_TOPIC = f"{MQTT_BASE_TOPIC}/humidity"
-MQTT_BATTERY_TOPIC = f"{MQTT_BASE_TOPIC}/battery"
-MQTT_STATE_TOPIC = f"{MQTT_BASE_TOPIC}/state"
+# MQTT Topics (each sensor publishes under {MQTT_BASE_TOPIC}/{name}/...)
+MQTT_BASE_TOPIC = "homeassistant/sensor"
+# Publish only the combined {name}/state message (one publish per reading
+# instead of four); Home Assistant reads each value from it with a template.
+MQTT_STATE_ONLY = False
 
 # Home Assistant Discovery Topics (for auto-discovery)
 MQTT_DISCOVERY_PREFIX = "homeassistant"
 
+# Change-Detection Publishing
+# A metric is only published when it moves at least its deadband away from
+# the last published value, or when PUBLISH_HEARTBEAT seconds have passed
+# since it was last sent. The combined state follows any published metric.
+PUBLISH_DEADBANDS = {
+    "temperature": 0.1,            # °C
+    "humidity": 1.0,               # %RH
+    "battery": 1,                  # %
+}
+PUBLISH_HEARTBEAT = 600            # Max seconds between publishes of an unchanged value
+
+# Offline Store-and-Forward
+# While the broker is unreachable, readings are queued in memory and spilled
+# to an SQLite spool on disk. After reconnecting, the backlog is re-published
+# oldest first (payloads keep their original timestamps). Size and age limits
+# keep an outage from filling the SD card.
+SPOOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mqtt_spool.db")
+SPOOL_MEMORY_MESSAGES = 500        # Messages buffered in memory before spilling to disk
+SPOOL_MAX_MESSAGES = 100000        # Oldest messages are evicted beyond this count
+SPOOL_MAX_BYTES = 20 * 1024 * 1024 # Oldest messages are evicted beyond this payload size
+SPOOL_MAX_AGE = 7 * 24 * 3600      # Messages older than this (seconds) are dropped
+SPOOL_DRAIN_RATE = 50              # Messages per second re-published after reconnecting
+
 # Scan and Update Intervals
-SCAN_TIMEOUT = 10.0                # Seconds to scan for device
+SCAN_TIMEOUT = 10.0                # Seconds to scan for devices at startup
 UPDATE_INTERVAL = 60               # Seconds between readings
 RECONNECT_DELAY = 30               # Seconds to wait before reconnecting
 
+# Passive Advertisement Mode
+# Decode readings straight from BLE advertisements (ATC/pvvx custom firmware,
+# BTHome and unencrypted MiBeacon) using the shared scanner, so a reading
+# costs no connection at all. GATT polling is only used as a fallback when a
+# sensor has not advertised any data for PASSIVE_STALE_TIMEOUT seconds.
+PASSIVE_SCAN = True                # Set to False to always poll over GATT
+PASSIVE_STALE_TIMEOUT = 300        # Seconds without advertisements before GATT fallback
+
+# GATT Polling Scheduler
+# Sensors without advertised data are polled concurrently, at most
+# GATT_MAX_CONNECTIONS at a time. Each sensor keeps its own jittered schedule
+# and backs off exponentially while it keeps failing, so one dead sensor
+# can't stall the healthy ones.
+GATT_MAX_CONNECTIONS = 3           # Parallel connections the adapter handles reliably
+GATT_CONNECT_TIMEOUT = 30.0        # Seconds to wait for a connection
+GATT_READ_DEADLINE = 45.0          # Seconds allowed for one complete read, connect included
+GATT_POLL_JITTER = 0.1             # Random +/- fraction added to each sensor's next poll
+GATT_BACKOFF_BASE = 30             # Retry delay after the first failure (seconds)
+GATT_BACKOFF_MAX = 1800            # Slowest retry cadence for a dead sensor (seconds)
+SUBSCRIBE_RECONNECT_DELAY = 2      # Seconds before re-subscribing after a dropped connection
+
+# Metrics
+# Per-phase timings, read counters, RSSI and reading age for every sensor,
+# served in Prometheus text format and published as an MQTT diagnostics
+# message, to tune SCAN_TIMEOUT, UPDATE_INTERVAL and the GATT settings.
+METRICS_HOST = "127.0.0.1"         # Use "0.0.0.0" to let Prometheus scrape from the network
+METRICS_PORT = 9105                # http://METRICS_HOST:METRICS_PORT/metrics (0 disables)
+METRICS_INTERVAL = 300             # Seconds between MQTT diagnostics publishes (0 disables)
+
 # Logging
 LOG_LEVEL = logging.INFO
 # ======================================================
@@ -58,6 +132,329 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Metrics published per sensor, with their Home Assistant discovery settings
+SENSOR_METRICS = {
+    "temperature": {"unit_of_measurement": "°C", "device_class": "temperature"},
+    "humidity": {"unit_of_measurement": "%", "device_class": "humidity"},
+    "battery": {"unit_of_measurement": "%", "device_class": "battery"},
+}
+
+# Shared compact JSON serializer for every payload
+_json_encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+def use_ble_backend(scanner_class, client_class):
+    """Replace bleak's scanner and client classes, e.g. with simulated ones."""
+    global BleakScanner, BleakClient
+    BleakScanner, BleakClient = scanner_class, client_class
+
+
+# ==================== ADVERTISEMENT DECODERS ====================
+# Service data UUIDs carrying sensor readings in advertisements
+ENVIRONMENTAL_SENSING_UUID = "0000181a-0000-1000-8000-00805f9b34fb"  # ATC1441 / pvvx custom
+BTHOME_UUID = "0000fcd2-0000-1000-8000-00805f9b34fb"                 # BTHome v2 (pvvx default)
+MIBEACON_UUID = "0000fe95-0000-1000-8000-00805f9b34fb"               # Xiaomi MiBeacon
+
+# MiBeacon object types
+MIBEACON_TEMPERATURE = 0x1004
+MIBEACON_HUMIDITY = 0x1006
+MIBEACON_BATTERY = 0x100A
+MIBEACON_TEMPERATURE_HUMIDITY = 0x100D
+
+# BTHome v2 object ids -> (name, length, signed, factor)
+BTHOME_OBJECTS = {
+    0x00: ("packet_id", 1, False, 1),
+    0x01: ("battery", 1, False, 1),
+    0x02: ("temperature", 2, True, 0.01),
+    0x03: ("humidity", 2, False, 0.01),
+    0x0C: ("voltage", 2, False, 0.001),
+    0x10: ("power", 1, False, 1),
+    0x2E: ("humidity", 1, False, 1),
+    0x45: ("temperature", 2, True, 0.1),
+}
+
+
+def decode_atc_advertisement(data: bytes) -> Optional[dict]:
+    """Decode ATC1441 (13 byte) or pvvx custom (15 byte) 0x181A service data."""
+    if len(data) == 13:
+        # ATC1441: MAC, temp x10 (BE), humidity %, battery %, battery mV, counter
+        return {
+            "temperature": int.from_bytes(data[6:8], byteorder='big', signed=True) / 10.0,
+            "humidity": data[8],
+            "battery": data[9],
+        }
+    if len(data) == 15:
+        # pvvx custom: MAC (reversed), temp x100, humidity x100, mV, battery %, counter, flags
+        return {
+            "temperature": int.from_bytes(data[6:8], byteorder='little', signed=True) / 100.0,
+            "humidity": int.from_bytes(data[8:10], byteorder='little') / 100.0,
+            "battery": data[12],
+        }
+    return None
+
+
+def decode_bthome_advertisement(data: bytes) -> Optional[dict]:
+    """Decode unencrypted BTHome v2 service data."""
+    if not data or data[0] & 0x01 or (data[0] >> 5) != 2:
+        # Encrypted or not BTHome v2
+        return None
+
+    values = {}
+    i = 1
+    while i < len(data):
+        object_id = data[i]
+        if object_id not in BTHOME_OBJECTS:
+            # Unknown object, the length of the rest can't be determined
+            break
+        name, length, signed, factor = BTHOME_OBJECTS[object_id]
+        raw = data[i + 1:i + 1 + length]
+        if len(raw) < length:
+            break
+        value = int.from_bytes(raw, byteorder='little', signed=signed) * factor
+        values[name] = round(value, 2) if factor != 1 else value
+        i += 1 + length
+
+    readings = {k: values[k] for k in ("temperature", "humidity", "battery") if k in values}
+    return readings or None
+
+
+def decode_mibeacon_advertisement(data: bytes) -> Optional[dict]:
+    """Decode unencrypted MiBeacon 0xFE95 service data.
+
+    Stock LYWSD03MMC firmware encrypts its MiBeacon payload, so those frames
+    are ignored; flash ATC/pvvx firmware to use passive mode with them.
+    """
+    if len(data) < 5:
+        return None
+
+    frame_control = int.from_bytes(data[0:2], byteorder='little')
+    if frame_control & 0x0008:
+        # Encrypted, needs a bind key
+        return None
+    if not frame_control & 0x0040:
+        # No object included
+        return None
+
+    i = 5
+    if frame_control & 0x0010:
+        i += 6  # MAC address
+    if frame_control & 0x0020:
+        capability = data[i] if i < len(data) else 0
+        i += 3 if capability & 0x20 else 1  # Two I/O capability bytes follow it
+
+    readings = {}
+    while i + 3 <= len(data):
+        object_type = int.from_bytes(data[i:i + 2], byteorder='little')
+        length = data[i + 2]
+        payload = data[i + 3:i + 3 + length]
+        if len(payload) < length:
+            break
+        if object_type == MIBEACON_TEMPERATURE and length == 2:
+            readings["temperature"] = int.from_bytes(payload, byteorder='little', signed=True) / 10.0
+        elif object_type == MIBEACON_HUMIDITY and length == 2:
+            readings["humidity"] = int.from_bytes(payload, byteorder='little') / 10.0
+        elif object_type == MIBEACON_BATTERY and length == 1:
+            readings["battery"] = payload[0]
+        elif object_type == MIBEACON_TEMPERATURE_HUMIDITY and length == 4:
+            readings["temperature"] = int.from_bytes(payload[0:2], byteorder='little', signed=True) / 10.0
+            readings["humidity"] = int.from_bytes(payload[2:4], byteorder='little') / 10.0
+        i += 3 + length
+
+    return readings or None
+
+
+ADVERTISEMENT_DECODERS = {
+    ENVIRONMENTAL_SENSING_UUID: decode_atc_advertisement,
+    BTHOME_UUID: decode_bthome_advertisement,
+    MIBEACON_UUID: decode_mibeacon_advertisement,
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class BridgeMetrics:
+    """Timings, counters and per-sensor gauges for the bridge."""
+    
+    # Seconds; covers fast advertisement gaps up to GATT_READ_DEADLINE
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 120, 300)
+    
+    HELP = {
+        "xiaomi_bridge_phase_seconds": ("histogram", "Duration of each reading phase"),
+        "xiaomi_bridge_mqtt_ack_seconds": ("histogram", "Time from publish to broker acknowledgment"),
+        "xiaomi_bridge_readings_total": ("counter", "Readings received, by source"),
+        "xiaomi_bridge_read_failures_total": ("counter", "Failed GATT reads and subscriptions"),
+        "xiaomi_bridge_mqtt_published_total": ("counter", "Metrics published to MQTT"),
+        "xiaomi_bridge_mqtt_suppressed_total": ("counter", "Publishes suppressed by the deadbands"),
+        "xiaomi_bridge_spool_evicted_total": ("counter", "Spooled messages dropped by the spool limits"),
+        "xiaomi_bridge_rssi_dbm": ("gauge", "Last advertisement signal strength"),
+        "xiaomi_bridge_seconds_since_reading": ("gauge", "Seconds since the last good reading"),
+        "xiaomi_bridge_consecutive_failures": ("gauge", "Failed reads in a row"),
+        "xiaomi_bridge_mqtt_connected": ("gauge", "1 while connected to the MQTT broker"),
+        "xiaomi_bridge_spool_messages": ("gauge", "Messages waiting in the offline spool"),
+        "xiaomi_bridge_uptime_seconds": ("gauge", "Seconds since the bridge started"),
+    }
+    
+    def __init__(self):
+        self.started = time.monotonic()
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self.counters: Counter = Counter()
+        self.sensors: List["XiaomiSensor"] = []
+        self.publisher: Optional["MQTTPublisher"] = None
+    
+    def observe(self, name: str, seconds: float, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.BUCKETS)
+        histogram.observe(seconds)
+    
+    def inc(self, name: str, **labels: str):
+        self.counters[(name, tuple(sorted(labels.items())))] += 1
+    
+    def _samples(self):
+        """Yield (name, labels, value) for every counter and gauge."""
+        for (name, labels), value in self.counters.items():
+            yield name, labels, value
+        
+        now = time.monotonic()
+        for sensor in self.sensors:
+            labels = (("sensor", sensor.name),)
+            if sensor.rssi is not None:
+                yield "xiaomi_bridge_rssi_dbm", labels, sensor.rssi
+            if sensor.last_reading is not None:
+                yield "xiaomi_bridge_seconds_since_reading", labels, round(now - sensor.last_reading, 1)
+            yield "xiaomi_bridge_consecutive_failures", labels, sensor.consecutive_failures
+        
+        publisher = self.publisher
+        if publisher is not None:
+            for metric, value in publisher.published.items():
+                yield "xiaomi_bridge_mqtt_published_total", (("metric", metric),), value
+            for metric, value in publisher.suppressed.items():
+                yield "xiaomi_bridge_mqtt_suppressed_total", (("metric", metric),), value
+            yield "xiaomi_bridge_mqtt_connected", (), int(publisher.connected)
+            yield "xiaomi_bridge_spool_messages", (), len(publisher.spool)
+            yield "xiaomi_bridge_spool_evicted_total", (), publisher.spool.evicted
+        
+        yield "xiaomi_bridge_uptime_seconds", (), round(now - self.started, 1)
+    
+    @staticmethod
+    def _format_labels(labels) -> str:
+        if not labels:
+            return ""
+        # Label values escape backslash, double quote and newline
+        escaped = (
+            (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for key, value in labels
+        )
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+    
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        by_name: Dict[str, list] = {}
+        for name, labels, value in self._samples():
+            by_name.setdefault(name, []).append((labels, value))
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            by_name.setdefault(name, []).append((labels, histogram))
+        
+        for name, samples in by_name.items():
+            kind, help_text = self.HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if not isinstance(value, Histogram):
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value.buckets + (float("inf"),), value.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else bound
+                    lines.append(f"{name}_bucket{self._format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {round(value.sum, 6)}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+    
+    def snapshot(self) -> dict:
+        """Compact per-sensor summary for the MQTT diagnostics topic."""
+        now = time.monotonic()
+        sensors = {}
+        for sensor in self.sensors:
+            readings = sum(
+                value for (name, labels), value in self.counters.items()
+                if name == "xiaomi_bridge_readings_total" and ("sensor", sensor.name) in labels
+            )
+            failures = sum(
+                value for (name, labels), value in self.counters.items()
+                if name == "xiaomi_bridge_read_failures_total" and ("sensor", sensor.name) in labels
+            )
+            sensors[sensor.name] = {
+                "rssi": sensor.rssi,
+                "seconds_since_reading": (
+                    round(now - sensor.last_reading, 1) if sensor.last_reading is not None else None
+                ),
+                "readings": readings,
+                "failures": failures,
+                "consecutive_failures": sensor.consecutive_failures,
+            }
+        phases = {}
+        for (name, labels), histogram in self.histograms.items():
+            if name == "xiaomi_bridge_phase_seconds" and histogram.count:
+                phase = dict(labels)["phase"]
+                total, count = phases.get(phase, (0.0, 0))
+                phases[phase] = (total + histogram.sum, count + histogram.count)
+        return {
+            "uptime": round(now - self.started, 1),
+            "sensors": sensors,
+            "phase_avg_seconds": {phase: round(total / count, 3) for phase, (total, count) in phases.items()},
+            "timestamp": datetime.now().isoformat(),
+        }
+    
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer one HTTP request with the metrics text."""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            path = request_line.split()[1] if len(request_line.split()) > 1 else b"/"
+            if path in (b"/metrics", b"/"):
+                status, body = "200 OK", self.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    async def serve(self):
+        """Serve /metrics until cancelled."""
+        server = await asyncio.start_server(self._handle_http, METRICS_HOST, METRICS_PORT)
+        logger.info(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        async with server:
+            await server.serve_forever()
+
+
+metrics = BridgeMetrics()
+
 
 class XiaomiSensor:
     """Handle Xiaomi BLE sensor data reading."""
@@ -66,70 +463,487 @@ class XiaomiSensor:
     TEMPERATURE_HUMIDITY_UUID = "ebe0ccc1-7a0a-4b0c-8a1a-6ff2997da3a6"
     BATTERY_UUID = "00002a19-0000-1000-8000-00805f9b34fb"
     
-    def __init__(self, mac_address: str):
-        self.mac_address = mac_address
+    def __init__(self, mac_address: str, name: str, mode: str = "auto"):
+        self.mac_address = mac_address.upper()
+        self.name = name
+        self.subscribe_mode = mode == "subscribe"
         self.temperature: Optional[float] = None
         self.humidity: Optional[float] = None
         self.battery: Optional[int] = None
+        self.rssi: Optional[int] = None
+        self.last_seen: Optional[float] = None  # time.monotonic() of last advert of any kind
+        self.last_advertisement: Optional[float] = None  # time.monotonic() of last decoded advert
+        self.last_reading: Optional[float] = None  # time.monotonic() of last good reading
+        self.has_new_reading = False
+        self.consecutive_failures = 0
         
-    async def find_device(self) -> bool:
-        """Scan for the device to ensure it's available."""
-        logger.info(f"Scanning for device {self.mac_address}...")
-        try:
-            device = await BleakScanner.find_device_by_address(
-                self.mac_address, 
-                timeout=SCAN_TIMEOUT
+        # MQTT topics
+        self.base_topic = f"{MQTT_BASE_TOPIC}/{name}"
+        self.metric_topics = {metric: f"{self.base_topic}/{metric}" for metric in SENSOR_METRICS}
+        self.state_topic = f"{self.base_topic}/state"
+        
+    def update_from_advertisement(self, advertisement_data) -> bool:
+        """Decode readings from an advertisement's service data, if it carries any."""
+        now = time.monotonic()
+        for uuid, data in advertisement_data.service_data.items():
+            decoder = ADVERTISEMENT_DECODERS.get(uuid)
+            if decoder is None:
+                continue
+            readings = decoder(bytes(data))
+            if not readings:
+                continue
+            
+            self.temperature = readings.get("temperature", self.temperature)
+            self.humidity = readings.get("humidity", self.humidity)
+            self.battery = readings.get("battery", self.battery)
+            self.rssi = advertisement_data.rssi
+            if self.last_advertisement is not None:
+                metrics.observe(
+                    "xiaomi_bridge_phase_seconds", now - self.last_advertisement,
+                    phase="advertisement_interval", sensor=self.name
+                )
+            self.last_advertisement = now
+            self._mark_reading("advertisement")
+            logger.debug(
+                f"Advertisement from {self.name}: {readings} (RSSI {self.rssi} dBm)"
             )
-            if device:
-                logger.info(f"Found device: {device.name} ({device.address})")
-                return True
-            else:
-                logger.warning(f"Device {self.mac_address} not found")
-                return False
+            return True
+        return False
+    
+    def _mark_reading(self, source: str):
+        """Record a good reading for publishing and metrics."""
+        self.has_new_reading = True
+        self.last_reading = time.monotonic()
+        metrics.inc("xiaomi_bridge_readings_total", sensor=self.name, source=source)
+    
+    def _apply_temperature_humidity(self, data: bytes):
+        """Decode the LYWSD03MMC temperature/humidity characteristic value."""
+        self.temperature = int.from_bytes(data[0:2], byteorder='little', signed=True) / 100.0
+        self.humidity = int.from_bytes(data[2:3], byteorder='little')
+    
+    async def _read_battery(self, client):
+        """Read the battery level, which is optional on some firmwares."""
+        try:
+            battery_data = await client.read_gatt_char(self.BATTERY_UUID)
+            self.battery = int.from_bytes(battery_data, byteorder='little')
+            logger.info(f"{self.name}: Battery: {self.battery}%")
         except Exception as e:
-            logger.error(f"Error scanning for device: {e}")
-            return False
+            logger.warning(f"Error reading battery from {self.name} (non-critical): {e}")
+            self.battery = None
     
     async def read_data(self) -> bool:
         """Connect to sensor and read temperature, humidity, and battery."""
+        started = time.monotonic()
         try:
-            async with BleakClient(self.mac_address, timeout=30.0) as client:
+            async with BleakClient(self.mac_address, timeout=GATT_CONNECT_TIMEOUT) as client:
                 if not client.is_connected:
-                    logger.error("Failed to connect to device")
+                    logger.error(f"Failed to connect to {self.name}")
                     return False
                 
-                logger.info(f"Connected to {self.mac_address}")
+                connected = time.monotonic()
+                metrics.observe("xiaomi_bridge_phase_seconds", connected - started, phase="connect", sensor=self.name)
+                logger.info(f"Connected to {self.name} ({self.mac_address})")
                 
                 # Read temperature and humidity
                 try:
                     data = await client.read_gatt_char(self.TEMPERATURE_HUMIDITY_UUID)
-                    self.temperature = int.from_bytes(data[0:2], byteorder='little', signed=True) / 100.0
-                    self.humidity = int.from_bytes(data[2:3], byteorder='little')
-                    logger.info(f"Temperature: {self.temperature}°C, Humidity: {self.humidity}%")
+                    metrics.observe(
+                        "xiaomi_bridge_phase_seconds", time.monotonic() - connected,
+                        phase="gatt_read", sensor=self.name
+                    )
+                    self._apply_temperature_humidity(data)
+                    logger.info(f"{self.name}: Temperature: {self.temperature}°C, Humidity: {self.humidity}%")
                 except Exception as e:
-                    logger.error(f"Error reading temperature/humidity: {e}")
+                    logger.error(f"Error reading temperature/humidity from {self.name}: {e}")
                     return False
                 
                 # Read battery level
-                try:
-                    battery_data = await client.read_gatt_char(self.BATTERY_UUID)
-                    self.battery = int.from_bytes(battery_data, byteorder='little')
-                    logger.info(f"Battery: {self.battery}%")
-                except Exception as e:
-                    logger.warning(f"Error reading battery (non-critical): {e}")
-                    self.battery = None
+                await self._read_battery(client)
                 
+                self._mark_reading("gatt")
                 return True
                 
         except Exception as e:
-            logger.error(f"Error reading sensor data: {e}", exc_info=True)
+            logger.error(f"Error reading sensor data from {self.name}: {e}", exc_info=True)
+            return False
+    
+    async def subscribe(self, on_reading: Callable[["XiaomiSensor"], None]) -> bool:
+        """Keep a connection open and report every temperature/humidity notification.
+        
+        Returns once the connection drops: True if the subscription was
+        established, False if connecting or subscribing failed.
+        """
+        disconnected = asyncio.Event()
+        
+        def on_notify(_characteristic, data: bytearray):
+            self._apply_temperature_humidity(data)
+            self._mark_reading("notification")
+            logger.debug(f"{self.name}: Notification: {self.temperature}°C, {self.humidity}%")
+            on_reading(self)
+        
+        started = time.monotonic()
+        try:
+            async with BleakClient(
+                self.mac_address,
+                timeout=GATT_CONNECT_TIMEOUT,
+                disconnected_callback=lambda _client: disconnected.set()
+            ) as client:
+                if not client.is_connected:
+                    logger.error(f"Failed to connect to {self.name}")
+                    return False
+                
+                metrics.observe(
+                    "xiaomi_bridge_phase_seconds", time.monotonic() - started,
+                    phase="connect", sensor=self.name
+                )
+                await self._read_battery(client)
+                await client.start_notify(self.TEMPERATURE_HUMIDITY_UUID, on_notify)
+                logger.info(f"Subscribed to {self.name} ({self.mac_address}) notifications")
+                await disconnected.wait()
+                logger.warning(f"{self.name} disconnected")
+                return True
+        
+        except Exception as e:
+            logger.error(f"Error subscribing to {self.name}: {e}", exc_info=True)
             return False
 
 
+class AdvertisementListener:
+    """Single long-lived BLE scanner shared by every configured sensor.
+    
+    Advertisements are routed to their sensor through a MAC-keyed dict, so the
+    cost per advertisement stays constant no matter how many sensors are
+    configured, and there is no per-sensor scan before a GATT read.
+    """
+    
+    def __init__(self, sensors: Dict[str, XiaomiSensor]):
+        self.sensors = sensors
+        self.scanner = BleakScanner(detection_callback=self._on_advertisement)
+        self.started_at: Optional[float] = None
+    
+    def _on_advertisement(self, device, advertisement_data):
+        """Detection callback, runs for every advertisement the adapter sees."""
+        sensor = self.sensors.get(device.address.upper())
+        if sensor is None:
+            return
+        now = time.monotonic()
+        if sensor.last_seen is None and self.started_at is not None:
+            metrics.observe("xiaomi_bridge_phase_seconds", now - self.started_at, phase="discovery", sensor=sensor.name)
+        sensor.last_seen = now
+        sensor.rssi = advertisement_data.rssi
+        if PASSIVE_SCAN:
+            sensor.update_from_advertisement(advertisement_data)
+    
+    async def start(self):
+        """Start scanning in the background."""
+        logger.info(f"Listening for advertisements from {len(self.sensors)} sensor(s)")
+        await self.scanner.start()
+        self.started_at = time.monotonic()
+    
+    async def stop(self):
+        """Stop the background scanner."""
+        await self.scanner.stop()
+    
+    def needs_gatt_fallback(self, sensor: XiaomiSensor) -> bool:
+        """True when the sensor has not advertised readings for PASSIVE_STALE_TIMEOUT."""
+        if not PASSIVE_SCAN:
+            return True
+        last_seen = sensor.last_advertisement or self.started_at
+        return time.monotonic() - last_seen > PASSIVE_STALE_TIMEOUT
+    
+    def is_visible(self, sensor: XiaomiSensor) -> bool:
+        """True when the scanner has seen the sensor within PASSIVE_STALE_TIMEOUT."""
+        return (
+            sensor.last_seen is not None
+            and time.monotonic() - sensor.last_seen <= PASSIVE_STALE_TIMEOUT
+        )
+
+
+class GattPollScheduler:
+    """Poll sensors over GATT concurrently, bounded by the adapter's connection limit.
+    
+    Subscribed sensors hold one of the GATT_MAX_CONNECTIONS slots for as long
+    as their connection stays open.
+    """
+    
+    def __init__(self, listener: AdvertisementListener, on_reading: Callable[[XiaomiSensor], None]):
+        self.listener = listener
+        self.on_reading = on_reading
+        self.semaphore = asyncio.Semaphore(GATT_MAX_CONNECTIONS)
+        self.tasks: List[asyncio.Task] = []
+    
+    def start(self, sensors: Iterable[XiaomiSensor]):
+        """Start one polling or subscription task per sensor."""
+        sensors = list(sensors)
+        subscribed = sum(1 for sensor in sensors if sensor.subscribe_mode)
+        if subscribed and subscribed >= GATT_MAX_CONNECTIONS and subscribed < len(sensors):
+            logger.warning(
+                f"{subscribed} subscribed sensor(s) use every GATT connection slot "
+                f"(GATT_MAX_CONNECTIONS={GATT_MAX_CONNECTIONS}); polled sensors will starve"
+            )
+        for sensor in sensors:
+            loop = self._subscribe_loop if sensor.subscribe_mode else self._poll_loop
+            self.tasks.append(asyncio.create_task(loop(sensor)))
+    
+    async def stop(self):
+        """Cancel all polling tasks."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+    
+    def next_delay(self, sensor: XiaomiSensor) -> float:
+        """Seconds until the sensor's next poll: jittered cadence or exponential backoff."""
+        if sensor.consecutive_failures:
+            delay = min(GATT_BACKOFF_BASE * 2 ** (sensor.consecutive_failures - 1), GATT_BACKOFF_MAX)
+        else:
+            delay = UPDATE_INTERVAL
+        return delay * random.uniform(1 - GATT_POLL_JITTER, 1 + GATT_POLL_JITTER)
+    
+    async def _poll_loop(self, sensor: XiaomiSensor):
+        """Poll one sensor whenever it has no advertised data."""
+        # Stagger the first polls so sensors don't all connect at once
+        await asyncio.sleep(random.uniform(0, UPDATE_INTERVAL * GATT_POLL_JITTER))
+        while True:
+            try:
+                if self.listener.needs_gatt_fallback(sensor):
+                    if await self.poll(sensor):
+                        sensor.consecutive_failures = 0
+                        self.on_reading(sensor)
+                    else:
+                        sensor.consecutive_failures += 1
+                        metrics.inc("xiaomi_bridge_read_failures_total", sensor=sensor.name, mode="gatt")
+                        delay = self.next_delay(sensor)
+                        logger.error(
+                            f"Failed to read {sensor.name} ({sensor.consecutive_failures} in a row). "
+                            f"Retrying in {delay:.0f}s"
+                        )
+                        await asyncio.sleep(delay)
+                        continue
+            except Exception as e:
+                logger.error(f"Error polling {sensor.name}: {e}", exc_info=True)
+            await asyncio.sleep(self.next_delay(sensor))
+    
+    async def _subscribe_loop(self, sensor: XiaomiSensor):
+        """Keep one sensor subscribed, reconnecting with backoff when it drops."""
+        while True:
+            try:
+                if self.listener.is_visible(sensor):
+                    async with self.semaphore:
+                        subscribed = await sensor.subscribe(self.on_reading)
+                else:
+                    logger.warning(f"Device {sensor.name} ({sensor.mac_address}) not seen by scanner")
+                    subscribed = False
+                
+                if subscribed:
+                    # The connection was up and dropped: reconnect promptly
+                    sensor.consecutive_failures = 0
+                    delay = SUBSCRIBE_RECONNECT_DELAY
+                else:
+                    sensor.consecutive_failures += 1
+                    metrics.inc("xiaomi_bridge_read_failures_total", sensor=sensor.name, mode="subscribe")
+                    delay = self.next_delay(sensor)
+                logger.info(f"Re-subscribing to {sensor.name} in {delay:.0f}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logger.error(f"Error in subscription to {sensor.name}: {e}", exc_info=True)
+                await asyncio.sleep(self.next_delay(sensor))
+    
+    async def poll(self, sensor: XiaomiSensor) -> bool:
+        """Read one sensor over GATT within GATT_READ_DEADLINE."""
+        if not self.listener.is_visible(sensor):
+            logger.warning(f"Device {sensor.name} ({sensor.mac_address}) not seen by scanner")
+            return False
+        
+        queued = time.monotonic()
+        async with self.semaphore:
+            started = time.monotonic()
+            metrics.observe("xiaomi_bridge_phase_seconds", started - queued, phase="queue", sensor=sensor.name)
+            if PASSIVE_SCAN:
+                logger.info(f"No advertised data from {sensor.name}, polling over GATT")
+            try:
+                return await asyncio.wait_for(sensor.read_data(), GATT_READ_DEADLINE)
+            except asyncio.TimeoutError:
+                logger.error(f"Reading {sensor.name} exceeded {GATT_READ_DEADLINE}s deadline")
+                return False
+            finally:
+                metrics.observe(
+                    "xiaomi_bridge_phase_seconds", time.monotonic() - started,
+                    phase="poll", sensor=sensor.name
+                )
+
+
+class OfflineSpool:
+    """Bounded store-and-forward queue for messages that couldn't be published.
+    
+    New messages go to an in-memory ring buffer; when it fills up it is
+    appended to an SQLite (WAL) spool in one transaction. Messages are handed
+    back oldest first: the disk spool, then the memory buffer.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.memory: deque = deque()  # (created, topic, payload)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created REAL NOT NULL, topic TEXT NOT NULL, payload BLOB NOT NULL)"
+        )
+        self.db.commit()
+        self.disk_count = self.db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self.evicted = 0
+        if self.disk_count:
+            logger.info(f"Found {self.disk_count} spooled message(s) from a previous run")
+    
+    def __len__(self) -> int:
+        return self.disk_count + len(self.memory)
+    
+    def append(self, topic: str, payload: bytes):
+        """Queue a message, spilling the memory buffer to disk when it is full."""
+        self.memory.append((time.time(), topic, payload))
+        if len(self.memory) >= SPOOL_MEMORY_MESSAGES:
+            self.flush()
+    
+    def flush(self):
+        """Append the memory buffer to the disk spool and apply the eviction limits."""
+        if not self.memory:
+            return
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO spool (created, topic, payload) VALUES (?, ?, ?)", self.memory
+            )
+        self.disk_count += len(self.memory)
+        self.memory.clear()
+        self._evict()
+    
+    def _evict(self):
+        """Drop messages that are too old, then the oldest beyond the size limits."""
+        before = self.disk_count
+        with self.db:
+            self.db.execute("DELETE FROM spool WHERE created < ?", (time.time() - SPOOL_MAX_AGE,))
+            self.db.execute(
+                "DELETE FROM spool WHERE id <= "
+                "(SELECT id FROM spool ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (SPOOL_MAX_MESSAGES,)
+            )
+            total_bytes = self.db.execute(
+                "SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM spool"
+            ).fetchone()[0]
+            if total_bytes > SPOOL_MAX_BYTES:
+                # Walk from the newest message back until the byte budget is used up
+                budget = SPOOL_MAX_BYTES
+                cutoff = None
+                for row_id, size in self.db.execute(
+                    "SELECT id, LENGTH(payload) FROM spool ORDER BY id DESC"
+                ):
+                    budget -= size
+                    if budget < 0:
+                        cutoff = row_id
+                        break
+                if cutoff is not None:
+                    self.db.execute("DELETE FROM spool WHERE id <= ?", (cutoff,))
+        self.disk_count = self.db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        if self.disk_count < before:
+            self.evicted += before - self.disk_count
+            logger.warning(f"Evicted {before - self.disk_count} spooled message(s) over the spool limits")
+            self.db.execute("PRAGMA incremental_vacuum")
+    
+    def peek(self, limit: int) -> List[Tuple[int, str, bytes]]:
+        """Return up to limit of the oldest messages as (id, topic, payload).
+        
+        The memory buffer is flushed first so every message handed out has a
+        stable disk id, whatever gets appended while it is being published.
+        """
+        self.flush()
+        return list(self.db.execute(
+            "SELECT id, topic, payload FROM spool ORDER BY id LIMIT ?", (limit,)
+        ))
+    
+    def remove(self, messages: List[Tuple[int, str, bytes]]):
+        """Remove messages returned by peek() once they have been published."""
+        if not messages:
+            return
+        with self.db:
+            self.db.executemany("DELETE FROM spool WHERE id = ?", [(row_id,) for row_id, _, _ in messages])
+        self.disk_count = self.db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+    
+    def close(self):
+        """Persist the memory buffer and close the database."""
+        self.flush()
+        self.db.close()
+
+
+class AsyncioMQTTHelper:
+    """Drive a paho client from the asyncio event loop instead of loop_start().
+    
+    paho reports its socket through callbacks; the socket is watched with
+    add_reader/add_writer and keepalives run from a small task, so all MQTT
+    callbacks run on the event loop thread.
+    """
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, client):
+        self.loop = loop
+        self.client = client
+        self.misc_task: Optional[asyncio.Task] = None
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+    
+    def _in_loop(self, callback, *args):
+        """Run callback on the event loop thread.
+        
+        connect() runs in an executor so the TCP handshake can't block the
+        loop, which means paho may report socket changes from that thread.
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+    
+    def _on_socket_open(self, client, userdata, sock):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2048)
+        self._in_loop(self._watch_socket, sock.fileno())
+    
+    def _on_socket_close(self, client, userdata, sock):
+        self._in_loop(self._unwatch_socket, sock.fileno())
+    
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._in_loop(self.loop.add_writer, sock.fileno(), client.loop_write)
+    
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._in_loop(self.loop.remove_writer, sock.fileno())
+    
+    def _watch_socket(self, fd: int):
+        self.loop.add_reader(fd, self.client.loop_read)
+        self.misc_task = self.loop.create_task(self._misc_loop())
+    
+    def _unwatch_socket(self, fd: int):
+        self.loop.remove_reader(fd)
+        self.loop.remove_writer(fd)
+        if self.misc_task is not None:
+            self.misc_task.cancel()
+            self.misc_task = None
+    
+    async def _misc_loop(self):
+        """Keepalive pings and timeouts, once a second while connected."""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
 class MQTTPublisher:
-    """Handle MQTT publishing to Home Assistant."""
+    """Handle MQTT publishing to Home Assistant from the asyncio event loop."""
     
-    def __init__(self):
+    def __init__(self, sensors: List[XiaomiSensor]):
+        self.sensors = sensors
         # Use callback_api_version to fix deprecation warning
         self.client = mqtt.Client(
             client_id=MQTT_CLIENT_ID,
@@ -137,149 +951,275 @@ class MQTTPublisher:
         )
         if MQTT_USERNAME and MQTT_PASSWORD:
             self.client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        self.client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
         
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
         self.connected = False
+        
+        # Set up in start(), once the event loop is running
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._helper: Optional[AsyncioMQTTHelper] = None
+        self._connack: Optional[asyncio.Future] = None
+        self._disconnected: Optional[asyncio.Event] = None
+        self._inflight: Optional[asyncio.Semaphore] = None
+        self._acks: Dict[int, Tuple[asyncio.Future, float]] = {}
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+        
+        # Discovery messages serialized once per sensor: name -> [(topic, payload)]
+        self._discovery_cache: Dict[str, List[Tuple[str, bytes]]] = {}
+        
+        # Change detection: (sensor name, metric) -> (value, time.monotonic())
+        self._last_published: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self.published = Counter()
+        self.suppressed = Counter()
+        
+        # Store-and-forward queue for readings published while disconnected
+        self.spool = OfflineSpool(SPOOL_PATH)
+    
+    def start(self):
+        """Attach the client to the running event loop."""
+        self.loop = asyncio.get_running_loop()
+        self._helper = AsyncioMQTTHelper(self.loop, self.client)
+        self._disconnected = asyncio.Event()
+        self._disconnected.set()
+        self._inflight = asyncio.Semaphore(MQTT_MAX_INFLIGHT)
+        self._outbox = asyncio.Queue(MQTT_OUTBOX_SIZE)
     
     def _on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback for when connected to MQTT broker."""
         if rc == 0:
             logger.info("Connected to MQTT broker")
             self.connected = True
-            self.publish_discovery_config()
+            self._disconnected.clear()
+            self.loop.create_task(self._publish_discovery())
         else:
             logger.error(f"Failed to connect to MQTT broker, return code {rc}")
             self.connected = False
+        if self._connack is not None and not self._connack.done():
+            self._connack.set_result(self.connected)
     
     def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties=None):
         """Callback for when disconnected from MQTT broker."""
-        logger.warning(f"Disconnected from MQTT broker, reason code {reason_code}")
+        if not self._closing:
+            logger.warning(f"Disconnected from MQTT broker, reason code {reason_code}")
         self.connected = False
+        self._disconnected.set()
+        # Acks still pending will never come on this connection: fail them
+        # and give their in-flight slots back
+        pending, self._acks = self._acks, {}
+        for ack, _ in pending.values():
+            if not ack.done():
+                ack.set_exception(ConnectionError("MQTT connection lost before the broker acknowledged"))
+                ack.exception()     # Most acks are never awaited; don't log them as unretrieved
+            self._inflight.release()
     
-    def connect(self) -> bool:
-        """Connect to MQTT broker."""
+    def _on_publish(self, client, userdata, mid, reason_code=None, properties=None):
+        """Callback for when the broker acknowledged a QoS 1 publish."""
+        pending = self._acks.pop(mid, None)
+        if pending is not None:
+            ack, sent_at = pending
+            metrics.observe("xiaomi_bridge_mqtt_ack_seconds", time.monotonic() - sent_at)
+            if not ack.done():
+                ack.set_result(True)
+            self._inflight.release()
+    
+    async def connect(self) -> bool:
+        """Connect to MQTT broker and wait for its CONNACK."""
+        self._connack = self.loop.create_future()
         try:
             logger.info(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-            self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
-            self.client.loop_start()
-            
-            # Wait for connection
-            timeout = 10
-            while not self.connected and timeout > 0:
-                time.sleep(1)
-                timeout -= 1
-            
-            return self.connected
+            await self.loop.run_in_executor(None, self.client.connect, MQTT_BROKER, MQTT_PORT, 60)
+            return await asyncio.wait_for(self._connack, MQTT_CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"No answer from MQTT broker within {MQTT_CONNECT_TIMEOUT}s")
+            return False
         except Exception as e:
             logger.error(f"Error connecting to MQTT broker: {e}")
             return False
     
-    def publish_discovery_config(self):
-        """Publish Home Assistant MQTT discovery configuration."""
-        # Temperature sensor discovery
-        temp_config = {
-            "name": f"{SENSOR_NAME} Temperature",
-            "unique_id": f"{SENSOR_NAME}_temperature",
-            "state_topic": MQTT_TEMPERATURE_TOPIC,
-            "unit_of_measurement": "°C",
-            "device_class": "temperature",
-            "state_class": "measurement",
-            "value_template": "{{ value_json.temperature }}",
-            "device": {
-                "identifiers": [SENSOR_NAME],
-                "name": SENSOR_NAME.replace("_", " ").title(),
-                "model": "Xiaomi LYWSD03MMC",
-                "manufacturer": "Xiaomi"
-            }
-        }
+    def run(self):
+        """Start the reconnect, outbox, spool drain and diagnostics tasks."""
+        self._tasks = [
+            self.loop.create_task(self._maintain_connection()),
+            self.loop.create_task(self._run_outbox()),
+            self.loop.create_task(self.drain_spool()),
+        ]
+        if METRICS_INTERVAL:
+            self._tasks.append(self.loop.create_task(self.publish_diagnostics()))
+    
+    async def _maintain_connection(self):
+        """Reconnect after RECONNECT_DELAY whenever the connection drops."""
+        while True:
+            await self._disconnected.wait()
+            logger.info(f"Reconnecting to MQTT broker in {RECONNECT_DELAY}s")
+            await asyncio.sleep(RECONNECT_DELAY)
+            await self.connect()
+    
+    async def _publish(self, topic: str, payload: bytes, retain: bool = False) -> Optional[asyncio.Future]:
+        """Publish once an in-flight slot is free; returns a future set on the broker's ack.
         
-        # Humidity sensor discovery
-        humidity_config = {
-            "name": f"{SENSOR_NAME} Humidity",
-            "unique_id": f"{SENSOR_NAME}_humidity",
-            "state_topic": MQTT_HUMIDITY_TOPIC,
-            "unit_of_measurement": "%",
-            "device_class": "humidity",
-            "state_class": "measurement",
-            "value_template": "{{ value_json.humidity }}",
-            "device": {
-                "identifiers": [SENSOR_NAME],
-                "name": SENSOR_NAME.replace("_", " ").title(),
-                "model": "Xiaomi LYWSD03MMC",
-                "manufacturer": "Xiaomi"
-            }
-        }
+        Returns None when the message could not be handed to the client.
+        """
+        await self._inflight.acquire()
+        if not self.connected:
+            self._inflight.release()
+            return None
+        info = self.client.publish(topic, payload, qos=MQTT_QOS, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self._inflight.release()
+            return None
+        ack = self.loop.create_future()
+        if MQTT_QOS == 0:
+            ack.set_result(True)
+            self._inflight.release()
+        else:
+            self._acks[info.mid] = (ack, time.monotonic())
+        return ack
+    
+    async def _publish_discovery(self):
+        """Publish the discovery configuration of every sensor."""
+        for sensor in self.sensors:
+            await self.publish_discovery_config(sensor)
+    
+    def _discovery_messages(self, sensor: XiaomiSensor) -> List[Tuple[str, bytes]]:
+        """Build (once) and return the serialized discovery configs for one sensor."""
+        messages = self._discovery_cache.get(sensor.name)
+        if messages is not None:
+            return messages
         
-        # Battery sensor discovery
-        battery_config = {
-            "name": f"{SENSOR_NAME} Battery",
-            "unique_id": f"{SENSOR_NAME}_battery",
-            "state_topic": MQTT_BATTERY_TOPIC,
-            "unit_of_measurement": "%",
-            "device_class": "battery",
-            "state_class": "measurement",
-            "value_template": "{{ value_json.battery }}",
-            "device": {
-                "identifiers": [SENSOR_NAME],
-                "name": SENSOR_NAME.replace("_", " ").title(),
-                "model": "Xiaomi LYWSD03MMC",
-                "manufacturer": "Xiaomi"
-            }
+        device = {
+            "identifiers": [sensor.name],
+            "name": sensor.name.replace("_", " ").title(),
+            "model": "Xiaomi LYWSD03MMC",
+            "manufacturer": "Xiaomi"
         }
+        messages = []
+        for metric, settings in SENSOR_METRICS.items():
+            config = {
+                "name": f"{sensor.name} {metric.title()}",
+                "unique_id": f"{sensor.name}_{metric}",
+                "state_topic": sensor.state_topic if MQTT_STATE_ONLY else sensor.metric_topics[metric],
+                **settings,
+                "state_class": "measurement",
+                "value_template": f"{{{{ value_json.{metric} }}}}",
+                "device": device
+            }
+            topic = f"{MQTT_DISCOVERY_PREFIX}/sensor/{sensor.name}_{metric}/config"
+            messages.append((topic, _json_encode(config).encode()))
         
-        # Publish discovery configs
-        self.client.publish(
-            f"{MQTT_DISCOVERY_PREFIX}/sensor/{SENSOR_NAME}_temperature/config",
-            json.dumps(temp_config),
-            retain=True
-        )
-        self.client.publish(
-            f"{MQTT_DISCOVERY_PREFIX}/sensor/{SENSOR_NAME}_humidity/config",
-            json.dumps(humidity_config),
-            retain=True
-        )
-        self.client.publish(
-            f"{MQTT_DISCOVERY_PREFIX}/sensor/{SENSOR_NAME}_battery/config",
-            json.dumps(battery_config),
-            retain=True
-        )
-        logger.info("Published Home Assistant discovery configuration")
+        self._discovery_cache[sensor.name] = messages
+        return messages
+    
+    async def publish_discovery_config(self, sensor: XiaomiSensor):
+        """Publish Home Assistant MQTT discovery configuration for one sensor."""
+        for topic, payload in self._discovery_messages(sensor):
+            await self._publish(topic, payload, retain=True)
+        logger.info(f"Published Home Assistant discovery configuration for {sensor.name}")
+    
+    def _changed_metrics(self, sensor: XiaomiSensor) -> Set[str]:
+        """Metrics that moved past their deadband or are due a heartbeat."""
+        now = time.monotonic()
+        changed = set()
+        for metric, deadband in PUBLISH_DEADBANDS.items():
+            value = getattr(sensor, metric)
+            if value is None:
+                continue
+            last = self._last_published.get((sensor.name, metric))
+            if (
+                last is None
+                or abs(value - last[0]) + 1e-9 >= deadband
+                or now - last[1] >= PUBLISH_HEARTBEAT
+            ):
+                changed.add(metric)
+                self._last_published[(sensor.name, metric)] = (value, now)
+                self.published[metric] += 1
+            else:
+                self.suppressed[metric] += 1
+        return changed
+    
+    def _send(self, topic: str, payload: bytes):
+        """Queue a message for publishing, or spool it while disconnected or backed up."""
+        if self.connected and not len(self.spool) and not self._outbox.full():
+            self._outbox.put_nowait((topic, payload))
+        else:
+            self.spool.append(topic, payload)
+    
+    async def _run_outbox(self):
+        """Publish queued messages, waiting for in-flight slots (backpressure)."""
+        while True:
+            topic, payload = await self._outbox.get()
+            if await self._publish(topic, payload) is None:
+                self.spool.append(topic, payload)
+    
+    async def drain_spool(self):
+        """Re-publish spooled messages at SPOOL_DRAIN_RATE whenever connected.
+        
+        A batch is only removed from the spool once the broker acknowledged
+        every message in it.
+        """
+        while True:
+            if not self.connected or not len(self.spool):
+                await asyncio.sleep(1)
+                continue
+            try:
+                await self._drain_batch()
+            except Exception as e:
+                # Keep draining: a dead task would leave the backlog stuck until restart
+                logger.error(f"Error re-publishing spooled messages: {e}")
+            await asyncio.sleep(1)
+    
+    async def _drain_batch(self):
+        """Publish one batch from the spool and remove what the broker acknowledged."""
+        batch = self.spool.peek(SPOOL_DRAIN_RATE)
+        sent = []
+        acks = []
+        for message in batch:
+            _, topic, payload = message
+            ack = await self._publish(topic, payload)
+            if ack is None:
+                break
+            sent.append(message)
+            acks.append(ack)
+        try:
+            await asyncio.wait_for(asyncio.gather(*acks), MQTT_ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Spooled batch not acknowledged in time, will retry")
+            return
+        except ConnectionError:
+            logger.warning("Connection lost while re-publishing the spool, will retry")
+            return
+        self.spool.remove(sent)
+        if sent and not len(self.spool):
+            logger.info("Spooled backlog fully re-published")
+        else:
+            logger.debug(f"Re-published {len(sent)} spooled message(s), {len(self.spool)} left")
     
     def publish_sensor_data(self, sensor: XiaomiSensor):
-        """Publish sensor readings to MQTT."""
+        """Publish sensor readings that changed past their deadband to MQTT."""
         if not self.connected:
-            logger.warning("Not connected to MQTT broker, skipping publish")
+            logger.warning(f"Not connected to MQTT broker, spooling {sensor.name} reading")
+        
+        changed = self._changed_metrics(sensor)
+        if not changed:
+            self.suppressed["state"] += 1
+            logger.debug(f"{sensor.name}: No change past deadbands, publish suppressed")
             return
+        self.published["state"] += 1
         
         timestamp = datetime.now().isoformat()
         
-        # Publish temperature
-        if sensor.temperature is not None:
-            temp_payload = {
-                "temperature": sensor.temperature,
-                "timestamp": timestamp
-            }
-            self.client.publish(MQTT_TEMPERATURE_TOPIC, json.dumps(temp_payload))
-            logger.debug(f"Published temperature: {sensor.temperature}°C")
-        
-        # Publish humidity
-        if sensor.humidity is not None:
-            humidity_payload = {
-                "humidity": sensor.humidity,
-                "timestamp": timestamp
-            }
-            self.client.publish(MQTT_HUMIDITY_TOPIC, json.dumps(humidity_payload))
-            logger.debug(f"Published humidity: {sensor.humidity}%")
-        
-        # Publish battery
-        if sensor.battery is not None:
-            battery_payload = {
-                "battery": sensor.battery,
-                "timestamp": timestamp
-            }
-            self.client.publish(MQTT_BATTERY_TOPIC, json.dumps(battery_payload))
-            logger.debug(f"Published battery: {sensor.battery}%")
+        # Publish individual metrics
+        if not MQTT_STATE_ONLY:
+            for metric in SENSOR_METRICS:
+                if metric in changed:
+                    value = getattr(sensor, metric)
+                    payload = _json_encode({metric: value, "timestamp": timestamp})
+                    self._send(sensor.metric_topics[metric], payload.encode())
+                    logger.debug(f"{sensor.name}: Published {metric}: {value}")
         
         # Publish combined state
         state_payload = {
@@ -288,45 +1228,98 @@ class MQTTPublisher:
             "battery": sensor.battery,
             "timestamp": timestamp
         }
-        self.client.publish(MQTT_STATE_TOPIC, json.dumps(state_payload))
+        self._send(sensor.state_topic, _json_encode(state_payload).encode())
+    
+    async def publish_diagnostics(self):
+        """Publish the metrics snapshot every METRICS_INTERVAL seconds."""
+        topic = f"{MQTT_BASE_TOPIC}/{MQTT_CLIENT_ID}/diagnostics"
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            if self.connected:
+                await self._publish(topic, _json_encode(metrics.snapshot()).encode())
     
-    def disconnect(self):
-        """Disconnect from MQTT broker."""
-        self.client.loop_stop()
-        self.client.disconnect()
+    async def disconnect(self):
+        """Disconnect from MQTT broker, spooling anything still queued."""
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        while not self._outbox.empty():
+            self.spool.append(*self._outbox.get_nowait())
+        if self.connected:
+            self.client.disconnect()
+            try:
+                await asyncio.wait_for(self._disconnected.wait(), 2)
+            except asyncio.TimeoutError:
+                pass
+        self.spool.close()
 
 
-async def main():
-    """Main loop to read sensor and publish to MQTT."""
-    logger.info("Starting Xiaomi BLE to MQTT Bridge")
+def _report_metrics_exit(task: asyncio.Task):
+    """Log why the metrics server stopped (e.g. its port is taken)."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Metrics server stopped: {task.exception()}")
+
+
+async def main(sensor_table: List[dict] = SENSORS):
+    """Main loop to read all sensors and publish to MQTT."""
+    if BleakScanner is None:
+        print("Missing required packages. Install with:")
+        print("pip3 install bleak paho-mqtt")
+        sys.exit(1)
+    logger.info(f"Starting Xiaomi BLE to MQTT Bridge for {len(sensor_table)} sensor(s)")
     
-    # Initialize sensor and MQTT
-    sensor = XiaomiSensor(SENSOR_MAC)
-    mqtt_publisher = MQTTPublisher()
+    # Initialize sensors (keyed by MAC for advertisement routing) and MQTT
+    sensors: Dict[str, XiaomiSensor] = {}
+    for entry in sensor_table:
+        sensor = XiaomiSensor(entry["mac"], entry["name"], entry.get("mode", "auto"))
+        sensors[sensor.mac_address] = sensor
+    mqtt_publisher = MQTTPublisher(list(sensors.values()))
+    mqtt_publisher.start()
+    listener = AdvertisementListener(sensors)
+    metrics.sensors = list(sensors.values())
+    metrics.publisher = mqtt_publisher
+    metrics_task = None
+    if METRICS_PORT:
+        metrics_task = asyncio.create_task(metrics.serve())
+        metrics_task.add_done_callback(_report_metrics_exit)
     
     # Connect to MQTT broker
-    if not mqtt_publisher.connect():
+    if not await mqtt_publisher.connect():
         logger.error("Failed to connect to MQTT broker. Exiting.")
+        if metrics_task is not None:
+            metrics_task.cancel()
         sys.exit(1)
+    mqtt_publisher.run()
+    
+    def publish(sensor: XiaomiSensor):
+        mqtt_publisher.publish_sensor_data(sensor)
+        sensor.has_new_reading = False
+    
+    scheduler = GattPollScheduler(listener, publish)
     
     try:
+        await listener.start()
+        # Give the shared scanner one window to discover the sensors
+        await asyncio.sleep(SCAN_TIMEOUT)
+        scheduler.start(sensors.values())
+        
         while True:
             try:
-                # Find and read sensor
-                if await sensor.find_device():
-                    if await sensor.read_data():
-                        mqtt_publisher.publish_sensor_data(sensor)
-                        logger.info(f"Successfully updated sensor data. Next update in {UPDATE_INTERVAL}s")
-                    else:
-                        logger.error(f"Failed to read sensor data. Retrying in {RECONNECT_DELAY}s")
-                        await asyncio.sleep(RECONNECT_DELAY)
-                        continue
-                else:
-                    logger.error(f"Device not found. Retrying in {RECONNECT_DELAY}s")
-                    await asyncio.sleep(RECONNECT_DELAY)
-                    continue
+                # Publish whatever the advertisements delivered; GATT readings
+                # are published by the scheduler as soon as they complete
+                published = 0
+                for sensor in sensors.values():
+                    if sensor.has_new_reading:
+                        publish(sensor)
+                        published += 1
                 
                 # Wait for next update
+                logger.info(
+                    f"Processed {published} advertised reading(s), "
+                    f"{sum(mqtt_publisher.suppressed.values())} publish(es) suppressed so far. "
+                    f"Next update in {UPDATE_INTERVAL}s"
+                )
                 await asyncio.sleep(UPDATE_INTERVAL)
                 
             except Exception as e:
@@ -336,7 +1329,11 @@ async def main():
     except KeyboardInterrupt:
         logger.info("Shutting down...")
     finally:
-        mqtt_publisher.disconnect()
+        if metrics_task is not None:
+            metrics_task.cancel()
+        await scheduler.stop()
+        await listener.stop()
+        await mqtt_publisher.disconnect()
 
 
 if __name__ == "__main__":